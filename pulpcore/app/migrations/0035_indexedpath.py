@@ -0,0 +1,40 @@
+# Generated by Django 2.2.14 on 2020-07-20 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_groupprogressreport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publication',
+            name='paths_indexed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='repositoryversion',
+            name='paths_indexed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='IndexedPath',
+            fields=[
+                ('pulp_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('relative_path', models.TextField()),
+                ('content_artifact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='indexed_paths', to='core.ContentArtifact')),
+                ('publication', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='indexed_paths', to='core.Publication')),
+                ('repository_version', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='indexed_paths', to='core.RepositoryVersion')),
+            ],
+            options={
+                'index_together': {('publication', 'relative_path'), ('repository_version', 'relative_path')},
+            },
+        ),
+    ]
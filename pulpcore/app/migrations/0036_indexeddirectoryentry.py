@@ -0,0 +1,30 @@
+# Generated by Django 2.2.14 on 2020-07-22 09:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_indexedpath'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexedDirectoryEntry',
+            fields=[
+                ('pulp_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('directory', models.TextField()),
+                ('name', models.TextField()),
+                ('publication', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='indexed_directory_entries', to='core.Publication')),
+                ('repository_version', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='indexed_directory_entries', to='core.RepositoryVersion')),
+            ],
+            options={
+                'index_together': {('publication', 'directory', 'name'), ('repository_version', 'directory', 'name')},
+            },
+        ),
+    ]
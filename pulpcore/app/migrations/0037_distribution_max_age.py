@@ -0,0 +1,23 @@
+# Generated by Django 2.2.14 on 2020-07-24 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_indexeddirectoryentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basedistribution',
+            name='artifact_max_age',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='basedistribution',
+            name='metadata_max_age',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
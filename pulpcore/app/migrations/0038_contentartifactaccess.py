@@ -0,0 +1,29 @@
+# Generated by Django 2.2.14 on 2020-07-27 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_distribution_max_age'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentArtifactAccess',
+            fields=[
+                ('pulp_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('last_accessed', models.DateTimeField()),
+                ('content_artifact', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='core.ContentArtifact')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
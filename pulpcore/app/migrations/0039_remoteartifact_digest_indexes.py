@@ -0,0 +1,37 @@
+# Generated by Django 2.2.14 on 2020-07-29 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_contentartifactaccess'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='remoteartifact',
+            index=models.Index(condition=models.Q(sha512__isnull=False), fields=['sha512'], name='remoteartifact_sha512_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='remoteartifact',
+            index=models.Index(condition=models.Q(sha384__isnull=False), fields=['sha384'], name='remoteartifact_sha384_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='remoteartifact',
+            index=models.Index(condition=models.Q(sha256__isnull=False), fields=['sha256'], name='remoteartifact_sha256_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='remoteartifact',
+            index=models.Index(condition=models.Q(sha224__isnull=False), fields=['sha224'], name='remoteartifact_sha224_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='remoteartifact',
+            index=models.Index(condition=models.Q(sha1__isnull=False), fields=['sha1'], name='remoteartifact_sha1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='remoteartifact',
+            index=models.Index(condition=models.Q(md5__isnull=False), fields=['md5'], name='remoteartifact_md5_idx'),
+        ),
+    ]
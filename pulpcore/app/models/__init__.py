@@ -6,6 +6,7 @@ from .content import (  # noqa
     AsciiArmoredDetachedSigningService,
     Content,
     ContentArtifact,
+    ContentArtifactAccess,
     RemoteArtifact,
     SigningService,
 )
@@ -34,6 +35,8 @@ from .publication import (  # noqa
     RepositoryVersionDistribution,
 )
 from .repository import (  # noqa
+    IndexedDirectoryEntry,
+    IndexedPath,
     Remote,
     Repository,
     RepositoryContent,
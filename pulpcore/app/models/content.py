@@ -5,14 +5,17 @@ import json
 import hashlib
 import tempfile
 import subprocess
+import uuid
 
 import gnupg
 
 from itertools import chain
 
 from django.core import validators
-from django.db import IntegrityError, models, transaction
+from django.db import connection, models, transaction
+from django.db.models.expressions import RawSQL
 from django.forms.models import model_to_dict
+from django.utils import timezone
 
 from pulpcore.app.models import MasterModel, BaseModel, fields, storage
 from pulpcore.exceptions import DigestValidationError, SizeValidationError
@@ -31,9 +34,11 @@ class BulkCreateManager(models.Manager):
         and do not set the primary key attribute if it is an autoincrement field (except if
         features.can_return_ids_from_bulk_insert=True). Multi-table models are not supported.
 
-        If an IntegrityError is raised while performing a bulk insert, this method falls back to
-        inserting each instance individually. The already-existing instances are retrieved from
-        the database and returned with the other newly created instances.
+        The objects are inserted with ``INSERT ... ON CONFLICT DO NOTHING``. The objects that
+        conflicted with existing rows, e.g. rows inserted by a concurrent sync, are then replaced
+        by the existing instances, fetched in one query by the fields of the first unique
+        constraint of the model. Objects whose existing row can't be found that way are fetched
+        one at a time.
 
         Args:
             objs (iterable of models.Model): an iterable of Django Model instances
@@ -43,18 +48,100 @@ class BulkCreateManager(models.Manager):
             List of instances that were inserted into the database.
         """
         objs = list(objs)
-        try:
-            with transaction.atomic():
-                return super().bulk_create(objs, batch_size=batch_size)
-        except IntegrityError:
-            for i in range(len(objs)):
-                try:
-                    with transaction.atomic():
-                        objs[i].save()
-                except IntegrityError:
-                    objs[i] = objs[i].__class__.objects.get(objs[i].q())
+        if not objs:
+            return objs
+        with transaction.atomic():
+            super().bulk_create(objs, batch_size=batch_size, ignore_conflicts=True)
+            inserted_pks = set(
+                self.filter(pk__in=[obj.pk for obj in objs]).values_list("pk", flat=True)
+            )
+            conflicting = [i for i, obj in enumerate(objs) if obj.pk not in inserted_pks]
+            if conflicting:
+                self._replace_conflicting(objs, conflicting)
         return objs
 
+    def _key_fields(self):
+        """
+        Get the fields of the first unique constraint of the model, besides the primary key.
+
+        Returns:
+            list: The fields, empty if the model has no other unique constraint.
+        """
+        meta = self.model._meta
+        if meta.unique_together:
+            return [meta.get_field(name) for name in meta.unique_together[0]]
+        for field in meta.local_concrete_fields:
+            if field.unique and not field.primary_key:
+                return [field]
+        return []
+
+    def _replace_conflicting(self, objs, conflicting):
+        """
+        Replace the objects that were not inserted with the existing instances.
+
+        Args:
+            objs (list): The objects, replaced in place.
+            conflicting (list): The indexes of the objects that were not inserted.
+        """
+        for i in conflicting:
+            objs[i]._state.adding = True
+        fields = self._key_fields()
+
+        def key(obj):
+            return tuple(getattr(obj, field.attname) for field in fields)
+
+        existing = {}
+        if fields:
+            existing_q = models.Q(pk__in=[])
+            for i in conflicting:
+                existing_q |= models.Q(
+                    **{field.attname: getattr(objs[i], field.attname) for field in fields}
+                )
+            existing = {key(obj): obj for obj in self.filter(existing_q).iterator()}
+        for i in conflicting:
+            try:
+                objs[i] = existing[key(objs[i])]
+            except KeyError:
+                objs[i] = self.get(objs[i].q())
+
+
+class DigestQuerySet(models.QuerySet):
+    """
+    A queryset that looks objects up by many digests at once.
+    """
+
+    def filter_digests(self, digests):
+        """
+        Filter the objects having any of the given digests.
+
+        On PostgreSQL, the digests of each field are passed as a single array parameter and joined
+        with ``unnest()``, instead of one parameter per digest. The SQL stays the same size for any
+        number of digests, and the planner can use a hashed semi-join on the index of the field.
+        The field is also required to be set, so that partial indexes of the rows having a digest
+        can be used.
+
+        Args:
+            digests (dict): Iterables of digest values, keyed by the name of the digest field,
+                e.g. ``{"sha256": [...], "md5": [...]}``.
+
+        Returns:
+            :class:`django.db.models.QuerySet`: The objects having any of the digests.
+        """
+        q = models.Q(pk__in=[])
+        for digest_name, values in digests.items():
+            values = list(set(values))
+            if not values:
+                continue
+            if connection.vendor == "postgresql":
+                values = RawSQL("SELECT unnest(%s::text[])", (values,))
+            q |= models.Q(
+                **{"{}__in".format(digest_name): values, "{}__isnull".format(digest_name): False}
+            )
+        return self.filter(q)
+
+
+DigestManager = BulkCreateManager.from_queryset(DigestQuerySet)
+
 
 class QueryMixin:
     """
@@ -117,7 +204,7 @@ class Artifact(BaseModel):
     sha384 = models.CharField(max_length=96, null=False, unique=True, db_index=True)
     sha512 = models.CharField(max_length=128, null=False, unique=True, db_index=True)
 
-    objects = BulkCreateManager()
+    objects = DigestManager()
 
     # All digest fields ordered by algorithm strength.
     DIGEST_FIELDS = (
@@ -371,10 +458,82 @@ class RemoteArtifact(BaseModel, QueryMixin):
     content_artifact = models.ForeignKey(ContentArtifact, on_delete=models.CASCADE)
     remote = models.ForeignKey("Remote", on_delete=models.CASCADE)
 
-    objects = BulkCreateManager()
+    objects = DigestManager()
 
     class Meta:
         unique_together = ("content_artifact", "remote")
+        # Most remotes only provide some of the digests, only the rows having one are indexed.
+        indexes = [
+            models.Index(
+                fields=[digest_name],
+                name="remoteartifact_{}_idx".format(digest_name),
+                condition=models.Q(**{"{}__isnull".format(digest_name): False}),
+            )
+            for digest_name in Artifact.DIGEST_FIELDS
+        ]
+
+
+class ContentArtifactAccess(BaseModel):
+    """
+    How often and how recently the content app served a ContentArtifact.
+
+    The content app counts the requests in memory and adds them up here periodically, see
+    ``settings.CONTENT_ACCESS_COUNT_INTERVAL``.
+
+    Fields:
+        count (models.BigIntegerField): The number of requests served.
+        last_accessed (models.DateTimeField): When the ContentArtifact was last requested.
+
+    Relations:
+        content_artifact (models.OneToOneField): The ContentArtifact requested.
+    """
+
+    count = models.BigIntegerField(default=0)
+    last_accessed = models.DateTimeField()
+
+    content_artifact = models.OneToOneField(
+        ContentArtifact, on_delete=models.CASCADE, related_name="access"
+    )
+
+    @classmethod
+    def add(cls, accesses):
+        """
+        Add up access counts with a single query.
+
+        The counts of ContentArtifacts that were deleted since they were requested are dropped.
+
+        Args:
+            accesses (dict): ``(count, last_accessed)`` tuples keyed by the primary key of the
+                ContentArtifact requested.
+        """
+        if not accesses:
+            return
+        now = timezone.now()
+        rows = [
+            (uuid.uuid4(), now, now, count, last_accessed, pk)
+            for pk, (count, last_accessed) in accesses.items()
+        ]
+        table = cls._meta.db_table
+        columns = (
+            "pulp_id, pulp_created, pulp_last_updated, count, last_accessed, content_artifact_id"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {table} ({columns}) "
+                "SELECT {columns} FROM (VALUES {values}) AS access ({columns}) "
+                "WHERE EXISTS (SELECT 1 FROM {content_artifacts} "
+                "WHERE {content_artifacts}.pulp_id = access.content_artifact_id) "
+                "ON CONFLICT (content_artifact_id) DO UPDATE SET "
+                "count = {table}.count + EXCLUDED.count, "
+                "last_accessed = GREATEST({table}.last_accessed, EXCLUDED.last_accessed), "
+                "pulp_last_updated = EXCLUDED.pulp_last_updated".format(
+                    table=table,
+                    columns=columns,
+                    values=", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows)),
+                    content_artifacts=ContentArtifact._meta.db_table,
+                ),
+                [value for row in rows for value in row],
+            )
 
 
 class SigningService(BaseModel):
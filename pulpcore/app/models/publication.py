@@ -1,11 +1,30 @@
-from django.db import IntegrityError, models, transaction
+from contextlib import suppress
+from gettext import gettext as _
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.signals import class_prepared, post_delete, post_save
+from django.dispatch import receiver
+
+from pulpcore.constants import CONTENT_APP_CACHE_CHANNEL
 
 from .base import MasterModel, BaseModel
 from .content import Artifact, Content, ContentArtifact
-from .repository import Remote, Repository, RepositoryVersion
+from .repository import IndexedPath, Remote, Repository, RepositoryVersion
 from .task import CreatedResource
 from pulpcore.app.files import PulpTemporaryUploadedFile
 
+log = logging.getLogger(__name__)
+
+# The size of the chunks published metadata is compressed in.
+COMPRESS_CHUNK_SIZE = 1048576
+
 
 class Publication(MasterModel):
     """
@@ -21,6 +40,8 @@ class Publication(MasterModel):
         pass_through (models.BooleanField): Indicates that the publication is a pass-through
             to the repository version. Enabling pass-through has the same effect as creating
             a PublishedArtifact for all of the content (artifacts) in the repository.
+        paths_indexed (models.BooleanField): If true, the paths served by this publication are
+            recorded as :class:`~pulpcore.app.models.IndexedPath` objects.
 
     Relations:
         repository_version (models.ForeignKey): The RepositoryVersion used to
@@ -43,6 +64,7 @@ class Publication(MasterModel):
 
     complete = models.BooleanField(db_index=True, default=False)
     pass_through = models.BooleanField(default=False)
+    paths_indexed = models.BooleanField(default=False)
 
     repository_version = models.ForeignKey("RepositoryVersion", on_delete=models.CASCADE)
 
@@ -135,6 +157,7 @@ class Publication(MasterModel):
         else:
             try:
                 self.finalize_new_publication()
+                IndexedPath.index_publication(self)
                 self.complete = True
                 self.save()
             except Exception:
@@ -173,16 +196,28 @@ class PublishedMetadata(Content):
 
     Relations:
         publication (models.ForeignKey): The publication in which the artifact is included.
+
+    Compressed variants of the metadata can be created with it. They are extra ContentArtifacts of
+    the same content, whose relative path has the suffix of their encoding in :attr:`ENCODINGS`,
+    and which are not published by themselves. The content app serves them to the clients that
+    accept their encoding.
     """
 
     TYPE = "publishedmetadata"
 
+    # The encodings of compressed variants and the suffix of their relative path, the preferred
+    # encoding first.
+    ENCODINGS = {"zstd": ".zst", "gzip": ".gz"}
+
+    # Files that are compressed already get no compressed variants.
+    COMPRESSED_EXTENSIONS = (".bz2", ".gz", ".lz4", ".xz", ".zck", ".zip", ".zst")
+
     relative_path = models.TextField()
 
     publication = models.ForeignKey(Publication, on_delete=models.CASCADE)
 
     @classmethod
-    def create_from_file(cls, file, publication, relative_path=None):
+    def create_from_file(cls, file, publication, relative_path=None, encodings=None):
         """
         Creates PublishedMetadata along with Artifact, ContentArtifact, and PublishedArtifact.
 
@@ -192,36 +227,132 @@ class PublishedMetadata(Content):
                 PublishedMetadata is included.
             relative_path (str): relative path at which the Metadata is published at. If None, the
                 name of the 'file' is used.
+            encodings (list): The encodings of the compressed variants to create, among the keys
+                of :attr:`ENCODINGS`. Defaults to ``settings.PUBLISHED_METADATA_ENCODINGS``.
 
         Returns:
             PublishedMetadata (pulpcore.app.models.PublishedMetadata):
                 A saved instance of PublishedMetadata.
         """
+        if encodings is None:
+            encodings = settings.PUBLISHED_METADATA_ENCODINGS
+        if not relative_path:
+            relative_path = file.name
+        if relative_path.endswith(cls.COMPRESSED_EXTENSIONS):
+            encodings = []
+
+        variants = {}
+        try:
+            # The variants are compressed first, saving the artifact closes the file.
+            for encoding in encodings:
+                variant_path = cls._compress_variant(file, encoding)
+                if variant_path is not None:
+                    variants[encoding] = variant_path
+            with transaction.atomic():
+                artifact = Artifact.init_and_validate(
+                    file=PulpTemporaryUploadedFile.from_file(file)
+                )
+                try:
+                    with transaction.atomic():
+                        artifact.save()
+                except IntegrityError:
+                    artifact = Artifact.objects.get(sha256=artifact.sha256)
+                content = cls(relative_path=relative_path, publication=publication)
+                content.save()
+                ca = ContentArtifact(
+                    relative_path=relative_path, content=content, artifact=artifact
+                )
+                ca.save()
+                pa = PublishedArtifact(
+                    relative_path=relative_path, content_artifact=ca, publication=publication
+                )
+                pa.save()
+                for encoding, variant_path in variants.items():
+                    content._create_variant(variant_path, encoding)
+        finally:
+            for variant_path in variants.values():
+                with suppress(FileNotFoundError):
+                    os.remove(variant_path)
+        return content
+
+    @staticmethod
+    def _compress_variant(file, encoding):
+        """
+        Compress the metadata for an encoding, in chunks, into a temporary file.
 
-        with transaction.atomic():
-            artifact = Artifact.init_and_validate(file=PulpTemporaryUploadedFile.from_file(file))
+        Args:
+            file (django.core.files.File): The metadata, it is read from its start.
+            encoding (str): The encoding, a key of :attr:`ENCODINGS`.
+
+        Returns:
+            str: The path of the compressed file. None when it is not smaller than the metadata,
+                or when the package the encoding requires is not installed.
+        """
+        with tempfile.NamedTemporaryFile(dir=os.getcwd(), delete=False) as temp_file:
+            smaller = False
+            try:
+                file.seek(0)
+                _compress(file, temp_file, encoding)
+                smaller = temp_file.tell() < file.size
+            except ImportError as e:
+                log.warning(
+                    _("Cannot create {encoding} variants of published metadata: {e}").format(
+                        encoding=encoding, e=e
+                    )
+                )
+            finally:
+                file.seek(0)
+                if not smaller:
+                    os.remove(temp_file.name)
+        return temp_file.name if smaller else None
+
+    def _create_variant(self, path, encoding):
+        """
+        Create the compressed variant of the metadata for an encoding.
+
+        Args:
+            path (str): The path of the compressed metadata, see :meth:`_compress_variant`.
+            encoding (str): The encoding, a key of :attr:`ENCODINGS`.
+        """
+        relative_path = self.relative_path + self.ENCODINGS[encoding]
+        with open(path, "rb") as variant_file:
+            artifact = Artifact.init_and_validate(
+                file=PulpTemporaryUploadedFile.from_file(File(variant_file))
+            )
             try:
                 with transaction.atomic():
                     artifact.save()
             except IntegrityError:
                 artifact = Artifact.objects.get(sha256=artifact.sha256)
-            if not relative_path:
-                relative_path = file.name
-            content = cls(relative_path=relative_path, publication=publication)
-            content.save()
-            ca = ContentArtifact(relative_path=relative_path, content=content, artifact=artifact)
-            ca.save()
-            pa = PublishedArtifact(
-                relative_path=relative_path, content_artifact=ca, publication=publication
-            )
-            pa.save()
-        return content
+        ContentArtifact(relative_path=relative_path, content=self, artifact=artifact).save()
 
     class Meta:
         default_related_name = "published_metadata"
         unique_together = ("publication", "relative_path")
 
 
+def _compress(source, target, encoding):
+    """
+    Compress a file in chunks.
+
+    Args:
+        source (file object): The file to compress, read from its current position.
+        target (file object): The file the compressed data is written to.
+        encoding (str): ``gzip``, or ``zstd`` which requires the ``zstandard`` package.
+
+    Raises:
+        ImportError: When the package the encoding requires is not installed.
+    """
+    if encoding == "zstd":
+        import zstandard
+
+        zstandard.ZstdCompressor().copy_stream(source, target)
+        return
+    # A fixed mtime makes the same metadata compress to the same artifact.
+    with gzip.GzipFile(fileobj=target, mode="wb", mtime=0) as gzip_file:
+        shutil.copyfileobj(source, gzip_file, COMPRESS_CHUNK_SIZE)
+
+
 class ContentGuard(MasterModel):
     """
     Defines a named content guard.
@@ -273,6 +404,12 @@ class BaseDistribution(MasterModel):
     Fields:
         name (models.TextField): The name of the distribution. Examples: "rawhide" and "stable".
         base_path (models.TextField): The base (relative) path component of the published url.
+        artifact_max_age (models.PositiveIntegerField): The number of seconds clients may cache
+            the files served by the distribution, except metadata. When null,
+            ``settings.CONTENT_ARTIFACT_MAX_AGE`` is used.
+        metadata_max_age (models.PositiveIntegerField): The number of seconds clients may cache
+            the :class:`PublishedMetadata` served by the distribution. When null,
+            ``settings.CONTENT_METADATA_MAX_AGE`` is used.
 
     Relations:
         content_guard (models.ForeignKey): An optional content-guard.
@@ -282,6 +419,8 @@ class BaseDistribution(MasterModel):
 
     name = models.TextField(db_index=True, unique=True)
     base_path = models.TextField(unique=True)
+    artifact_max_age = models.PositiveIntegerField(null=True)
+    metadata_max_age = models.PositiveIntegerField(null=True)
 
     content_guard = models.ForeignKey(ContentGuard, null=True, on_delete=models.SET_NULL)
     remote = models.ForeignKey(Remote, null=True, on_delete=models.SET_NULL)
@@ -342,3 +481,64 @@ class RepositoryVersionDistribution(BaseDistribution):
 
     class Meta:
         abstract = True
+
+
+# The models whose changes invalidate what the content app caches about distributions.
+CONTENT_APP_CACHED_MODELS = (BaseDistribution, ContentGuard, Publication, Remote, RepositoryVersion)
+
+
+def notify_content_app(sender, instance, **kwargs):
+    """
+    Tell the content apps that data they cache about distributions has changed.
+
+    The content app caches how a distribution resolves to its content guard, publication,
+    repository version and remote. Postgres delivers the notification when the surrounding
+    transaction commits, and identical notifications within one transaction are collapsed.
+
+    The receiver is only connected for the models in :data:`CONTENT_APP_CACHED_MODELS` and their
+    subclasses, see :func:`connect_content_app_notifications`. A ``post_delete`` receiver keeps
+    Django from deleting the instances of its senders without loading them, so connecting it for
+    every model would disable fast deletes everywhere.
+
+    Args:
+        sender (class): The model class of the saved or deleted instance.
+        instance (django.db.models.Model): The saved or deleted instance.
+        kwargs (dict): Other arguments sent with the signal.
+    """
+    if isinstance(instance, RepositoryVersion) and not instance.complete:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("NOTIFY {channel}".format(channel=CONTENT_APP_CACHE_CHANNEL))
+
+
+def _connect_notify_content_app(model):
+    uid = "notify_content_app_{}".format(model._meta.label_lower)
+    post_save.connect(notify_content_app, sender=model, dispatch_uid=uid)
+    post_delete.connect(notify_content_app, sender=model, dispatch_uid=uid)
+
+
+@receiver(class_prepared)
+def connect_content_app_notifications(sender, **kwargs):
+    """
+    Connect :func:`notify_content_app` for the subclasses of the cached models, e.g. the
+    distributions of plugins, as they are defined.
+
+    Args:
+        sender (class): The model class that was prepared.
+        kwargs (dict): Other arguments sent with the signal.
+    """
+    if issubclass(sender, CONTENT_APP_CACHED_MODELS):
+        _connect_notify_content_app(sender)
+
+
+def _connect_prepared_models():
+    # The models defined before this module, which class_prepared was sent for already.
+    models = list(CONTENT_APP_CACHED_MODELS)
+    while models:
+        model = models.pop()
+        if not model._meta.abstract:
+            _connect_notify_content_app(model)
+        models.extend(model.__subclasses__())
+
+
+_connect_prepared_models()
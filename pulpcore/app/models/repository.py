@@ -3,6 +3,7 @@ Repository related Django models.
 """
 from contextlib import suppress
 from gettext import gettext as _
+from itertools import chain, islice
 from os import path
 import logging
 
@@ -15,7 +16,7 @@ from pulpcore.download.factory import DownloaderFactory
 from pulpcore.exceptions import ResourceImmutableError
 
 from .base import MasterModel, BaseModel
-from .content import Artifact, Content
+from .content import Artifact, Content, ContentArtifact
 from .task import CreatedResource, Task
 
 
@@ -71,7 +72,9 @@ class Repository(MasterModel):
 
         This method can be overriden by plugins if they require custom logic.
         """
-        version = RepositoryVersion(repository=self, number=self.next_version, complete=True)
+        version = RepositoryVersion(
+            repository=self, number=self.next_version, complete=True, paths_indexed=True
+        )
         self.next_version += 1
         self.save()
         version.save()
@@ -388,6 +391,8 @@ class RepositoryVersion(BaseModel):
         action  (models.TextField): The action that produced the version.
         complete (models.BooleanField): If true, the RepositoryVersion is visible. This field is set
             to true when the task that creates the RepositoryVersion is complete.
+        paths_indexed (models.BooleanField): If true, the relative paths of the content in this
+            version are recorded as :class:`~pulpcore.app.models.IndexedPath` objects.
 
     Relations:
 
@@ -397,6 +402,7 @@ class RepositoryVersion(BaseModel):
     repository = models.ForeignKey(Repository, on_delete=models.CASCADE)
     number = models.PositiveIntegerField(db_index=True)
     complete = models.BooleanField(db_index=True, default=False)
+    paths_indexed = models.BooleanField(default=False)
     base_version = models.ForeignKey("RepositoryVersion", null=True, on_delete=models.SET_NULL)
 
     class Meta:
@@ -791,6 +797,7 @@ class RepositoryVersion(BaseModel):
                             "Saw unsupported content types {}".format(unsupported_types)
                         )
 
+                    IndexedPath.index_repository_version(self)
                     self.complete = True
                     self.repository.next_version = self.number + 1
                     self.repository.save()
@@ -860,3 +867,173 @@ class RepositoryVersionContentDetails(models.Model):
             partial_url_str = "{base}?repository_version_removed={rv_href}"
         full_url = partial_url_str.format(base=ctype_url, rv_href=rv_href)
         return full_url
+
+
+class IndexedPath(BaseModel):
+    """
+    A relative path served by a complete Publication or RepositoryVersion.
+
+    The content app resolves a requested path with a single indexed lookup on this table, instead
+    of searching the content of the whole repository version. The paths are recorded when the
+    Publication or RepositoryVersion is completed, together with the
+    :class:`~pulpcore.app.models.IndexedDirectoryEntry` objects used for directory listings.
+
+    Fields:
+
+        relative_path (models.TextField): The relative path of the served ContentArtifact.
+
+    Relations:
+
+        content_artifact (models.ForeignKey): The ContentArtifact served at the relative path.
+        publication (models.ForeignKey): The Publication serving the path, or None.
+        repository_version (models.ForeignKey): The RepositoryVersion serving the path, or None.
+    """
+
+    relative_path = models.TextField()
+
+    content_artifact = models.ForeignKey(ContentArtifact, on_delete=models.CASCADE)
+    publication = models.ForeignKey("Publication", null=True, on_delete=models.CASCADE)
+    repository_version = models.ForeignKey(RepositoryVersion, null=True, on_delete=models.CASCADE)
+
+    class Meta:
+        default_related_name = "indexed_paths"
+        index_together = (("publication", "relative_path"), ("repository_version", "relative_path"))
+
+    @classmethod
+    def index_publication(cls, publication):
+        """
+        Record the paths and directory entries served by a publication and mark it as indexed.
+
+        These are the paths of its PublishedArtifacts and, for a pass-through publication, the
+        paths of the content in its repository version that are not published otherwise.
+
+        Args:
+            publication (pulpcore.app.models.Publication): The publication to index.
+        """
+        published = publication.published_artifact.values_list("content_artifact", "relative_path")
+        paths = published.iterator()
+        if publication.pass_through:
+            passed_through = ContentArtifact.objects.filter(
+                content__in=publication.repository_version.content
+            ).exclude(relative_path__in=published.values("relative_path"))
+            paths = chain(paths, passed_through.values_list("pk", "relative_path").iterator())
+        _bulk_create(
+            cls,
+            (
+                cls(content_artifact_id=pk, relative_path=relative_path, publication=publication)
+                for pk, relative_path in paths
+            ),
+        )
+        IndexedDirectoryEntry.index(
+            cls.objects.filter(publication=publication).values_list("relative_path", flat=True),
+            publication=publication,
+        )
+        publication.paths_indexed = True
+
+    @classmethod
+    def index_repository_version(cls, repository_version):
+        """
+        Record the paths and directory entries of the content in a repository version and mark
+        the version as indexed.
+
+        Args:
+            repository_version (pulpcore.app.models.RepositoryVersion): The version to index.
+        """
+        content_artifacts = ContentArtifact.objects.filter(content__in=repository_version.content)
+        paths = content_artifacts.values_list("pk", "relative_path").iterator()
+        _bulk_create(
+            cls,
+            (
+                cls(
+                    content_artifact_id=pk,
+                    relative_path=relative_path,
+                    repository_version=repository_version,
+                )
+                for pk, relative_path in paths
+            ),
+        )
+        IndexedDirectoryEntry.index(
+            cls.objects.filter(repository_version=repository_version).values_list(
+                "relative_path", flat=True
+            ),
+            repository_version=repository_version,
+        )
+        repository_version.paths_indexed = True
+
+
+class IndexedDirectoryEntry(BaseModel):
+    """
+    An immediate child of a directory served by a complete Publication or RepositoryVersion.
+
+    The content app lists a directory by reading the entries of that directory only, in pages,
+    instead of scanning every path below it.
+
+    Fields:
+
+        directory (models.TextField): The path of the directory, with a trailing slash. The root
+            directory is the empty string.
+        name (models.TextField): The name of the file, or of the subdirectory with a trailing
+            slash.
+
+    Relations:
+
+        publication (models.ForeignKey): The Publication serving the directory, or None.
+        repository_version (models.ForeignKey): The RepositoryVersion serving the directory, or
+            None.
+    """
+
+    directory = models.TextField()
+    name = models.TextField()
+
+    publication = models.ForeignKey("Publication", null=True, on_delete=models.CASCADE)
+    repository_version = models.ForeignKey(RepositoryVersion, null=True, on_delete=models.CASCADE)
+
+    class Meta:
+        default_related_name = "indexed_directory_entries"
+        index_together = (
+            ("publication", "directory", "name"),
+            ("repository_version", "directory", "name"),
+        )
+
+    @classmethod
+    def index(cls, relative_paths, **owner):
+        """
+        Record the directory entries needed to list a set of relative paths.
+
+        Args:
+            relative_paths (django.db.models.QuerySet): The relative paths of the files served.
+            owner (dict): Either a ``publication`` or a ``repository_version`` keyword argument.
+        """
+        seen_directories = set()
+
+        def entries():
+            for relative_path in relative_paths.iterator():
+                *directories, filename = relative_path.split("/")
+                parent = ""
+                for directory in directories:
+                    path = "{}{}/".format(parent, directory)
+                    if path not in seen_directories:
+                        seen_directories.add(path)
+                        yield cls(directory=parent, name="{}/".format(directory), **owner)
+                    parent = path
+                if filename:
+                    yield cls(directory=parent, name=filename, **owner)
+
+        _bulk_create(cls, entries())
+
+
+def _bulk_create(model, objs, batch_size=1000):
+    """
+    Bulk create the objects of an iterable in batches, without loading it in memory at once.
+
+    Args:
+        model (class): The model class of the objects.
+        objs (iterable): The unsaved instances of ``model``.
+        batch_size (int): The number of objects created per query.
+    """
+    objs = iter(objs)
+    while True:
+        batch = list(islice(objs, batch_size))
+        if not batch:
+            break
+        model.objects.bulk_create(batch)
@@ -64,6 +64,7 @@ from .repository import (  # noqa
     RepositorySyncURLSerializer,
     RepositoryAddRemoveContentSerializer,
     RepositoryVersionSerializer,
+    RepositoryVersionPrefetchSerializer,
 )
 from .task import (  # noqa
     MinimalTaskSerializer,
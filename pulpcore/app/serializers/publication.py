@@ -115,11 +115,36 @@ class BaseDistributionSerializer(ModelSerializer):
         help_text=_("A unique name. Ex, `rawhide` and `stable`."),
         validators=[UniqueValidator(queryset=models.BaseDistribution.objects.all())],
     )
+    artifact_max_age = serializers.IntegerField(
+        help_text=_(
+            "The number of seconds clients may cache the files served by this distribution, "
+            "except metadata. Defaults to the CONTENT_ARTIFACT_MAX_AGE setting."
+        ),
+        min_value=0,
+        required=False,
+        allow_null=True,
+    )
+    metadata_max_age = serializers.IntegerField(
+        help_text=_(
+            "The number of seconds clients may cache the metadata served by this distribution. "
+            "Defaults to the CONTENT_METADATA_MAX_AGE setting."
+        ),
+        min_value=0,
+        required=False,
+        allow_null=True,
+    )
 
     class Meta:
         abstract = True
         model = models.BaseDistribution
-        fields = ModelSerializer.Meta.fields + ("base_path", "base_url", "content_guard", "name",)
+        fields = ModelSerializer.Meta.fields + (
+            "base_path",
+            "base_url",
+            "content_guard",
+            "name",
+            "artifact_max_age",
+            "metadata_max_age",
+        )
 
     def _validate_path_overlap(self, path):
         # look for any base paths nested in path
@@ -165,6 +165,40 @@ class RepositorySyncURLSerializer(serializers.Serializer):
     )
 
 
+class RepositoryVersionPrefetchSerializer(serializers.Serializer):
+    limit = fields.IntegerField(
+        required=False,
+        default=100,
+        min_value=1,
+        help_text=_("The number of artifacts to download at most."),
+    )
+    max_bytes = fields.IntegerField(
+        required=False,
+        allow_null=True,
+        default=None,
+        min_value=0,
+        help_text=_(
+            "The number of bytes to download at most, according to the sizes announced by the "
+            "remotes. Artifacts that don't fit are skipped."
+        ),
+    )
+    concurrency = fields.IntegerField(
+        required=False,
+        default=5,
+        min_value=1,
+        help_text=_("The number of artifacts downloaded at the same time at most."),
+    )
+    order = fields.ChoiceField(
+        choices=("count", "recent"),
+        required=False,
+        default="count",
+        help_text=_(
+            "Download the most requested artifacts first with ``count``, or the most recently "
+            "requested artifacts first with ``recent``."
+        ),
+    )
+
+
 class ContentSummarySerializer(serializers.Serializer):
     """
     Serializer for the RepositoryVersion content summary
@@ -191,6 +191,28 @@ LOGGING = {
 
 CONTENT_PATH_PREFIX = "/pulp/content/"
 CONTENT_APP_TTL = 30
+CONTENT_DISTRIBUTION_CACHE_TTL = 60
+CONTENT_APP_DB_THREADS = 10
+CONTENT_APP_DB_CONN_MAX_AGE = 600
+CONTENT_APP_DB_HEALTH_CHECK_INTERVAL = 30
+CONTENT_APP_WORKERS = 1
+CONTENT_DIRECTORY_LISTING_PAGE_SIZE = 1000
+CONTENT_APP_DOWNLOAD_LOCK_TIMEOUT = 0
+CONTENT_HEDGE_DELAY = None
+CONTENT_STREAMED_CACHE_DIR = os.path.join(MEDIA_ROOT, "streamed-cache/")
+CONTENT_STREAMED_CACHE_SIZE = 0
+CONTENT_ARTIFACT_MAX_AGE = None
+CONTENT_METADATA_MAX_AGE = None
+CONTENT_REDIRECT_URL_CACHE_SIZE = 10000
+CONTENT_MEMORY_CACHE_SIZE = 0
+CONTENT_MEMORY_CACHE_MAX_FILE_SIZE = 1024 * 1024
+CONTENT_SENDFILE_HEADER = None
+CONTENT_ACCEL_REDIRECT_PREFIX = "/pulp/media/"
+CONTENT_NOT_FOUND_CACHE_TTL = 60
+CONTENT_NOT_FOUND_CACHE_SIZE = 10000
+CONTENT_ACCESS_COUNT_INTERVAL = 60
+PUBLISHED_METADATA_ENCODINGS = []
+CONTENT_APP_METRICS_PATH = None
 
 REMOTE_USER_ENVIRON_NAME = "REMOTE_USER"
 
@@ -4,7 +4,8 @@ from functools import partial
 import asyncio
 import hashlib
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 
 from pulpcore.app import models
 
@@ -118,6 +119,119 @@ def repair_version(repository_version_pk):
     loop.run_until_complete(_repair_repository_version(version))
 
 
+PREFETCH_ORDERINGS = {
+    "count": ("-access__count", "-access__last_accessed"),
+    "recent": ("-access__last_accessed",),
+}
+
+
+def _save_prefetched_artifact(content_artifact, download_result):
+    artifact = models.Artifact(**download_result.artifact_attributes, file=download_result.path)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                artifact.save()
+        except IntegrityError:
+            artifact = models.Artifact.objects.get(artifact.q())
+        models.ContentArtifact.objects.filter(pk=content_artifact.pk, artifact__isnull=True).update(
+            artifact=artifact
+        )
+
+
+async def _prefetch_ca(content_artifact, remote_artifacts, remotes, prefetched):
+    for remote_artifact in remote_artifacts:
+        # Each remote is cast once, so all its downloads share its factory, with its session and
+        # its download_concurrency.
+        remote = remotes.get(remote_artifact.remote_id)
+        if remote is None:
+            remote = remotes[remote_artifact.remote_id] = remote_artifact.remote.cast()
+        downloader = remote.get_downloader(remote_artifact=remote_artifact)
+        try:
+            download_result = await downloader.run()
+        except Exception as e:
+            log.warning(_("Prefetch failed from {url}: {e}").format(url=remote_artifact.url, e=e))
+            continue
+        _save_prefetched_artifact(content_artifact, download_result)
+        prefetched.increment()
+        return True
+    return False
+
+
+async def _prefetch_content_artifacts(selected, concurrency):
+    pending = set()
+    remotes = {}
+    with models.ProgressReport(
+        message="Prefetch on-demand artifacts", code="prefetch.artifacts", total=len(selected)
+    ) as prefetched:
+        for content_artifact, remote_artifacts in selected:
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                await asyncio.gather(*done)  # Clean up tasks
+            pending.add(
+                asyncio.ensure_future(
+                    _prefetch_ca(content_artifact, remote_artifacts, remotes, prefetched)
+                )
+            )
+        await asyncio.gather(*pending)
+
+
+def prefetch_version(
+    repository_version_pk, limit=100, max_bytes=None, concurrency=5, order="count"
+):
+    """
+    Download the most requested on-demand artifacts of a repository version.
+
+    The content app counts the requests for each ContentArtifact, see
+    :class:`~pulpcore.app.models.ContentArtifactAccess`. The ContentArtifacts of the repository
+    version that were requested but whose artifact has not been downloaded yet are ranked by those
+    counts, and the top ones are downloaded from their remotes and saved, so that they are served
+    from storage afterwards.
+
+    Args:
+        repository_version_pk (uuid): The primary key of the RepositoryVersion.
+        limit (int): The number of artifacts to download at most.
+        max_bytes (int): The number of bytes to download at most, according to the sizes the
+            remotes announced. Artifacts that don't fit are skipped. None for no limit.
+        concurrency (int): The number of artifacts downloaded at the same time at most. The
+            ``download_concurrency`` of each remote applies as well.
+        order (str): ``count`` to rank by number of requests, ``recent`` to rank by the time of
+            the last request.
+    """
+    version = models.RepositoryVersion.objects.get(pk=repository_version_pk)
+
+    log.info(
+        _("Prefetching artifacts of version %(v)d of repository %(r)s"),
+        {"v": version.number, "r": version.repository.name},
+    )
+
+    content_artifacts = (
+        models.ContentArtifact.objects.filter(
+            content__in=version.content, artifact__isnull=True, access__isnull=False
+        )
+        .order_by(*PREFETCH_ORDERINGS[order])
+        .prefetch_related(
+            Prefetch(
+                "remoteartifact_set",
+                queryset=models.RemoteArtifact.objects.select_related("remote"),
+            )
+        )
+    )
+    selected = []
+    size = 0
+    for content_artifact in content_artifacts[:limit]:
+        remote_artifacts = list(content_artifact.remoteartifact_set.all())
+        if not remote_artifacts:
+            continue
+        expected_size = remote_artifacts[0].size or 0
+        if max_bytes is not None and size + expected_size > max_bytes:
+            continue
+        size += expected_size
+        selected.append((content_artifact, remote_artifacts))
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(_prefetch_content_artifacts(selected, concurrency))
+
+
 def add_and_remove(repository_pk, add_content_units, remove_content_units, base_version_pk=None):
     """
     Create a new repository version by adding and then removing content units.
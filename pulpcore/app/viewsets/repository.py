@@ -21,6 +21,7 @@ from pulpcore.app.serializers import (
     AsyncOperationResponseSerializer,
     RemoteSerializer,
     RepositorySerializer,
+    RepositoryVersionPrefetchSerializer,
     RepositoryVersionSerializer,
 )
 from pulpcore.app.viewsets import (
@@ -205,6 +206,28 @@ class RepositoryVersionViewSet(
         )
         return OperationPostponedResponse(async_result, request)
 
+    @swagger_auto_schema(
+        operation_description="Trigger an asynchronous task to download the most requested "
+        "on-demand artifacts of a repository version.",
+        request_body=RepositoryVersionPrefetchSerializer,
+        responses={202: AsyncOperationResponseSerializer},
+    )
+    @action(detail=True, methods=["post"], serializer_class=RepositoryVersionPrefetchSerializer)
+    def prefetch(self, request, repository_pk, number):
+        """
+        Queues a task to download the most requested on-demand artifacts of a RepositoryVersion
+        """
+        version = self.get_object()
+        serializer = RepositoryVersionPrefetchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        async_result = enqueue_with_reservation(
+            tasks.repository.prefetch_version,
+            [version.repository],
+            kwargs={"repository_version_pk": version.pk, **serializer.validated_data},
+        )
+        return OperationPostponedResponse(async_result, request)
+
 
 class RemoteFilter(BaseFilterSet):
     """
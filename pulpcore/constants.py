@@ -43,3 +43,6 @@ SYNC_CHOICES = (
 
 
 API_ROOT = "pulp/api/v3/"
+
+#: The Postgres NOTIFY channel used to tell content apps that distribution data changed.
+CONTENT_APP_CACHE_CHANNEL = "pulp_content_app_cache"
@@ -16,33 +16,65 @@ from django.conf import settings  # noqa: E402: module level not at top of file
 
 from pulpcore.app.apps import pulp_plugin_configs  # noqa: E402: module level not at top of file
 from pulpcore.app.models import ContentAppStatus  # noqa: E402: module level not at top of file
+from pulpcore.download import DownloaderFactory  # noqa: E402: module level not at top of file
 
+from .access import access_counts  # noqa: E402: module level not at top of file
+from .cache import listen_for_invalidation  # noqa: E402: module level not at top of file
+from .db import database  # noqa: E402: module level not at top of file
 from .handler import Handler  # noqa: E402: module level not at top of file
+from .metrics import (  # noqa: E402: module level not at top of file
+    metrics_handler,
+    metrics_middleware,
+)
 
 
 log = logging.getLogger(__name__)
 
-app = web.Application()
+app = web.Application(middlewares=[metrics_middleware(database.pop_task_time)])
 
 CONTENT_MODULE_NAME = "content"
 
 
+def _status_name():
+    return "{pid}@{hostname}".format(pid=os.getpid(), hostname=socket.gethostname())
+
+
 async def _heartbeat():
-    name = "{pid}@{hostname}".format(pid=os.getpid(), hostname=socket.gethostname())
+    name = _status_name()
     heartbeat_interval = settings.CONTENT_APP_TTL // 4
     i8ln_msg = _("Content App '{name}' heartbeat written, sleeping for '{interarrival}' seconds")
     msg = i8ln_msg.format(name=name, interarrival=heartbeat_interval)
 
     while True:
-        content_app_status, created = ContentAppStatus.objects.get_or_create(name=name)
+        content_app_status, created = await database.run(
+            ContentAppStatus.objects.get_or_create, name=name
+        )
         if not created:
-            content_app_status.save_heartbeat()
+            await database.run(content_app_status.save_heartbeat)
         log.debug(msg)
         await asyncio.sleep(heartbeat_interval)
 
 
+async def _remove_status(app):
+    """
+    Remove the status of this process when it shuts down, e.g. on a graceful reload, so that it
+    is not reported as online until it expires.
+    """
+    await database.run(ContentAppStatus.objects.filter(name=_status_name()).delete)
+
+
 async def server(*args, **kwargs):
+    # The remotes are shared by the requests, see SharedRemotes. Their connections are kept alive,
+    # and on-demand requests are not queued behind the download_concurrency of the remote.
+    DownloaderFactory.force_close = False
+    DownloaderFactory.limit_concurrency = False
     asyncio.ensure_future(_heartbeat())
+    app.on_shutdown.append(_remove_status)
+    if access_counts.enabled:
+        asyncio.ensure_future(access_counts.flush_periodically())
+        app.on_shutdown.append(access_counts.flush)
+    if settings.CONTENT_DISTRIBUTION_CACHE_TTL > 0 or settings.CONTENT_NOT_FOUND_CACHE_TTL > 0:
+        asyncio.ensure_future(listen_for_invalidation())
     for pulp_plugin in pulp_plugin_configs():
         if pulp_plugin.name != "pulpcore.app":
             content_module_name = "{name}.{module}".format(
@@ -50,6 +82,8 @@ async def server(*args, **kwargs):
             )
             with suppress(ModuleNotFoundError):
                 import_module(content_module_name)
+    if settings.CONTENT_APP_METRICS_PATH:
+        app.add_routes([web.get(settings.CONTENT_APP_METRICS_PATH, metrics_handler)])
     app.add_routes([web.get(settings.CONTENT_PATH_PREFIX, Handler().list_distributions)])
     app.add_routes([web.get(settings.CONTENT_PATH_PREFIX + "{path:.+}", Handler().stream_content)])
     return app
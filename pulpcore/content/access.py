@@ -0,0 +1,81 @@
+import asyncio
+from gettext import gettext as _
+import logging
+
+import django
+
+django.setup()
+
+from django.conf import settings  # noqa: E402: module level not at top of file
+from django.db import DatabaseError  # noqa: E402: module level not at top of file
+from django.utils import timezone  # noqa: E402: module level not at top of file
+
+from pulpcore.app.models import ContentArtifactAccess  # noqa: E402: module level not at top of file
+
+from .db import database  # noqa: E402: module level not at top of file
+
+log = logging.getLogger(__name__)
+
+
+class AccessCounts:
+    """
+    Count the requests for each ContentArtifact served by the content app.
+
+    Requests are counted in memory and added up to
+    :class:`~pulpcore.app.models.ContentArtifactAccess` every
+    ``settings.CONTENT_ACCESS_COUNT_INTERVAL`` seconds, with one query for all the ContentArtifacts
+    requested in the meantime. An interval of 0 disables the counting.
+    """
+
+    def __init__(self):
+        self._counts = {}
+
+    @property
+    def enabled(self):
+        """
+        Whether requests are counted.
+        """
+        return settings.CONTENT_ACCESS_COUNT_INTERVAL > 0
+
+    def record(self, content_artifact):
+        """
+        Count a request for a ContentArtifact.
+
+        Args:
+            content_artifact (:class:`~pulpcore.app.models.ContentArtifact`): The saved
+                ContentArtifact requested.
+        """
+        if not self.enabled:
+            return
+        count, _last_accessed = self._counts.get(content_artifact.pk, (0, None))
+        self._counts[content_artifact.pk] = (count + 1, timezone.now())
+
+    async def flush(self, app=None):
+        """
+        Add up the requests counted since the last flush.
+
+        Args:
+            app (:class:`aiohttp.web.Application`): The application, when called on shutdown.
+        """
+        counts, self._counts = self._counts, {}
+        if not counts:
+            return
+        try:
+            await database.run(ContentArtifactAccess.add, counts)
+        except DatabaseError as e:
+            log.warning(
+                _("Could not save the access counts of {n} content artifacts: {e}").format(
+                    n=len(counts), e=e
+                )
+            )
+
+    async def flush_periodically(self):
+        """
+        Flush the counts every ``settings.CONTENT_ACCESS_COUNT_INTERVAL`` seconds.
+        """
+        while True:
+            await asyncio.sleep(settings.CONTENT_ACCESS_COUNT_INTERVAL)
+            await self.flush()
+
+
+access_counts = AccessCounts()
@@ -0,0 +1,524 @@
+import asyncio
+from collections import OrderedDict
+from gettext import gettext as _
+import hashlib
+import logging
+import time
+
+from pygtrie import StringTrie
+
+import django
+
+django.setup()
+
+from django.conf import settings  # noqa: E402: module level not at top of file
+from django.db import connection  # noqa: E402: module level not at top of file
+
+from pulpcore.app.models import BaseDistribution  # noqa: E402: module level not at top of file
+from pulpcore.constants import CONTENT_APP_CACHE_CHANNEL  # noqa: E402: module level not at top
+
+from .metrics import cache_lookup  # noqa: E402: module level not at top of file
+
+log = logging.getLogger(__name__)
+
+
+class DistributionCache:
+    """
+    An in-process cache of how distributions resolve for the content app.
+
+    The cache keeps a trie of every ``base_path`` of the distribution model, so matching a request
+    path to a distribution needs no database query. Once a distribution has been matched, its
+    detail object is kept with its content guard, remote, publication and repository version
+    already resolved, so a cache hit serves the request without touching the database.
+
+    The whole cache is dropped when a change is announced on the
+    :data:`~pulpcore.constants.CONTENT_APP_CACHE_CHANNEL` Postgres channel, see
+    :func:`listen_for_invalidation`. As a safety net, the cache is also dropped when it is older
+    than ``settings.CONTENT_DISTRIBUTION_CACHE_TTL`` seconds. A TTL of 0 disables the cache.
+
+    Args:
+        model (class): The distribution model to cache. Either
+            :class:`~pulpcore.app.models.BaseDistribution` or a detail distribution model.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._generation = 0
+        self.invalidate()
+
+    @property
+    def enabled(self):
+        """
+        Whether caching is enabled.
+        """
+        return settings.CONTENT_DISTRIBUTION_CACHE_TTL > 0
+
+    def invalidate(self):
+        """
+        Drop everything that is cached.
+
+        Data that is being loaded while the cache is invalidated is not cached.
+        """
+        self._generation += 1
+        self._trie = None
+        self._entries = {}
+        self._loaded_at = 0
+
+    def _expired(self):
+        return time.monotonic() - self._loaded_at > settings.CONTENT_DISTRIBUTION_CACHE_TTL
+
+    def _base_path_trie(self):
+        """
+        Get the trie of distribution base paths, loading it with a single query if needed.
+
+        Returns:
+            pygtrie.StringTrie: Keyed by base path, valued with the distribution primary key.
+        """
+        trie = self._trie
+        if trie is None or self._expired():
+            self.invalidate()
+            generation = self._generation
+            trie = StringTrie(separator="/")
+            for pk, base_path in self.model.objects.values_list("pk", "base_path").iterator():
+                trie[base_path] = pk
+            if generation == self._generation:
+                self._trie = trie
+                self._loaded_at = time.monotonic()
+        return trie
+
+    def match(self, path):
+        """
+        Match a path against the base paths of the distributions.
+
+        Args:
+            path (str): The path component of the URL.
+
+        Returns:
+            detail of BaseDistribution: The matched distribution, or None.
+        """
+        trie = self._base_path_trie()
+        generation = self._generation
+        for step in trie.prefixes(path):
+            if step.key != path:
+                break
+        else:
+            return None
+
+        try:
+            distribution = self._entries[step.value][0]
+        except KeyError:
+            cache_lookup("distribution", hit=False)
+        else:
+            cache_lookup("distribution", hit=True)
+            return distribution
+
+        distribution = self._resolve(step.value)
+        if distribution is not None:
+            entry = (distribution, self._resolve_latest_version(distribution))
+            if self._trie is trie and generation == self._generation:
+                self._entries[step.value] = entry
+        return distribution
+
+    def latest_version(self, distribution):
+        """
+        Get the latest version of the repository served by a distribution.
+
+        Args:
+            distribution (detail of BaseDistribution): A distribution with a ``repository``.
+
+        Returns:
+            :class:`~pulpcore.app.models.RepositoryVersion`: The latest complete version.
+        """
+        try:
+            cached_distribution, version = self._entries[distribution.pk]
+        except KeyError:
+            pass
+        else:
+            if cached_distribution is distribution:
+                return version
+        return distribution.repository.latest_version()
+
+    def _resolve(self, pk):
+        """
+        Load a distribution and resolve everything the content app needs from it.
+
+        Args:
+            pk (uuid.UUID): The primary key of the distribution.
+
+        Returns:
+            detail of BaseDistribution: The distribution, or None if it does not exist anymore.
+        """
+        try:
+            distribution = self.model.objects.get(pk=pk)
+        except self.model.DoesNotExist:
+            return None
+        if self.model is BaseDistribution:
+            distribution = distribution.cast()
+        return resolve_related(distribution)
+
+    @staticmethod
+    def _resolve_latest_version(distribution):
+        repository = getattr(distribution, "repository", None)
+        if repository:
+            return repository.latest_version()
+        return None
+
+
+def resolve_related(distribution):
+    """
+    Fetch the relations of a distribution that the content app uses to serve it.
+
+    The content guard and remote are replaced by their detail objects, and the publication, its
+    repository version and the repository relations are fetched, so that later attribute access
+    on the distribution does not query the database.
+
+    Args:
+        distribution (detail of BaseDistribution): The distribution.
+
+    Returns:
+        detail of BaseDistribution: The same distribution.
+    """
+    if distribution.content_guard:
+        distribution.content_guard = distribution.content_guard.cast()
+    if distribution.remote:
+        distribution.remote = distribution.remote.cast()
+    publication = getattr(distribution, "publication", None)
+    if publication:
+        publication.repository_version
+    getattr(distribution, "repository", None)
+    getattr(distribution, "repository_version", None)
+    return distribution
+
+
+_distribution_caches = {}
+
+
+def get_distribution_cache(model):
+    """
+    Get the process-wide :class:`DistributionCache` for a distribution model.
+
+    Args:
+        model (class): The distribution model.
+
+    Returns:
+        :class:`DistributionCache`: The cache for that model.
+    """
+    try:
+        return _distribution_caches[model]
+    except KeyError:
+        return _distribution_caches.setdefault(model, DistributionCache(model))
+
+
+class NotFoundCache:
+    """
+    A bounded cache of the paths a distribution could not serve.
+
+    Every path that is not found costs a distribution its publication, pass-through, repository
+    version and remote lookups. Such paths are remembered instead, keyed by the distribution and
+    the relative path, for ``settings.CONTENT_NOT_FOUND_CACHE_TTL`` seconds, so a repeated request
+    is answered with a 404 without touching the database. The least recently added paths are
+    dropped when there are more than ``settings.CONTENT_NOT_FOUND_CACHE_SIZE`` of them.
+
+    The cache is dropped with the distribution caches, when a new publication or repository
+    version is announced, see :func:`invalidate_caches`. A TTL or size of 0 disables the cache.
+    """
+
+    def __init__(self):
+        self._paths = OrderedDict()
+        self.generation = 0
+
+    @property
+    def enabled(self):
+        """
+        Whether caching is enabled.
+        """
+        return (
+            settings.CONTENT_NOT_FOUND_CACHE_TTL > 0 and settings.CONTENT_NOT_FOUND_CACHE_SIZE > 0
+        )
+
+    def invalidate(self):
+        """
+        Drop everything that is cached.
+
+        Paths that are being looked up while the cache is invalidated are not cached.
+        """
+        self.generation += 1
+        self._paths = OrderedDict()
+
+    def __contains__(self, key):
+        """
+        Whether a path of a distribution is known not to exist.
+
+        Args:
+            key (tuple): The distribution and the relative path.
+
+        Returns:
+            bool: True if the path was not found recently.
+        """
+        distribution, path = key
+        key = (distribution.pk, path)
+        expires_at = self._paths.get(key)
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._paths[key]
+            expires_at = None
+        cache_lookup("not_found", hit=expires_at is not None)
+        return expires_at is not None
+
+    def add(self, distribution, path, generation):
+        """
+        Remember that a path of a distribution does not exist.
+
+        Args:
+            distribution (detail of BaseDistribution): The distribution.
+            path (str): The relative path in the distribution.
+            generation (int): The :attr:`generation` of the cache when the lookup of the path
+                started. The path is not cached if the cache was invalidated since.
+        """
+        if generation != self.generation:
+            return
+        key = (distribution.pk, path)
+        self._paths[key] = time.monotonic() + settings.CONTENT_NOT_FOUND_CACHE_TTL
+        self._paths.move_to_end(key)
+        while len(self._paths) > settings.CONTENT_NOT_FOUND_CACHE_SIZE:
+            self._paths.popitem(last=False)
+
+
+not_found_cache = NotFoundCache()
+
+
+def invalidate_caches():
+    """
+    Drop the content of every distribution cache, and of the not found cache, in this process.
+    """
+    for cache in _distribution_caches.values():
+        cache.invalidate()
+    not_found_cache.invalidate()
+
+
+class RedirectURLCache:
+    """
+    A bounded cache of the URLs the content app redirects clients to for cloud storages.
+
+    Signing a URL for S3 or Azure costs CPU on every request for an artifact. The signed URL of an
+    artifact is kept instead, keyed by the artifact and the parameters of the URL, and reused until
+    half of its validity has passed, so clients always get a URL that is valid for a while. The
+    least recently used URLs are dropped when there are more than
+    ``settings.CONTENT_REDIRECT_URL_CACHE_SIZE`` of them. A size of 0 disables the cache.
+    """
+
+    def __init__(self):
+        self._urls = OrderedDict()
+
+    @staticmethod
+    def _lifetime(storage):
+        """
+        Get the number of seconds a URL signed by a storage may be reused.
+
+        Args:
+            storage (django.core.files.storage.Storage): The storage of the artifacts.
+
+        Returns:
+            float: Half of the validity of the URLs the storage signs, or None if they don't expire.
+        """
+        # S3Boto3Storage and AzureStorage respectively.
+        for attribute in ("querystring_expire", "expiration_secs"):
+            expire = getattr(storage, attribute, None)
+            if expire:
+                return expire / 2
+        return None
+
+    def url(self, artifact, parameters):
+        """
+        Get the URL of the file of an artifact, signing it only if no cached URL can be reused.
+
+        Args:
+            artifact (:class:`~pulpcore.app.models.Artifact`): The artifact.
+            parameters (dict): The parameters of the URL, passed to the ``url()`` of the storage.
+
+        Returns:
+            str: The URL of the file.
+        """
+        artifact_file = artifact.file
+        max_size = settings.CONTENT_REDIRECT_URL_CACHE_SIZE
+        if not max_size:
+            return artifact_file.storage.url(artifact_file.name, parameters=parameters)
+
+        key = (artifact.pk, tuple(sorted(parameters.items())))
+        now = time.monotonic()
+        try:
+            url, expires_at = self._urls[key]
+        except KeyError:
+            pass
+        else:
+            if expires_at is None or now < expires_at:
+                self._urls.move_to_end(key)
+                cache_lookup("redirect_url", hit=True)
+                return url
+        cache_lookup("redirect_url", hit=False)
+
+        url = artifact_file.storage.url(artifact_file.name, parameters=parameters)
+        lifetime = self._lifetime(artifact_file.storage)
+        self._urls[key] = (url, None if lifetime is None else now + lifetime)
+        self._urls.move_to_end(key)
+        while len(self._urls) > max_size:
+            self._urls.popitem(last=False)
+        return url
+
+
+redirect_url_cache = RedirectURLCache()
+
+
+class MemoryFileCache:
+    """
+    A bounded in-memory cache of the files of small artifacts.
+
+    Small files that are requested all the time, like repository metadata and signatures, are
+    otherwise read from disk, or redirected to a cloud storage, on every request. The files of
+    artifacts of at most ``settings.CONTENT_MEMORY_CACHE_MAX_FILE_SIZE`` bytes are kept in memory
+    instead, keyed by the sha256 of the artifact. Artifacts are immutable, so a cached file is never
+    stale. The least recently served files are dropped when the cache holds more than
+    ``settings.CONTENT_MEMORY_CACHE_SIZE`` bytes. A size of 0 disables the cache.
+    """
+
+    def __init__(self):
+        self._files = OrderedDict()
+        self._size = 0
+        self._loading = set()
+
+    def cacheable(self, artifact):
+        """
+        Whether the file of an artifact may be cached.
+
+        Args:
+            artifact (:class:`~pulpcore.app.models.Artifact`): The artifact.
+
+        Returns:
+            bool: True if caching is enabled and the file is small enough.
+        """
+        max_size = min(
+            settings.CONTENT_MEMORY_CACHE_SIZE, settings.CONTENT_MEMORY_CACHE_MAX_FILE_SIZE
+        )
+        return artifact.size is not None and artifact.size <= max_size
+
+    def get(self, artifact):
+        """
+        Get the cached file of an artifact, and mark it as recently served.
+
+        Args:
+            artifact (:class:`~pulpcore.app.models.Artifact`): The artifact.
+
+        Returns:
+            bytes: The content of the file, or None if it is not cached.
+        """
+        data = self._files.get(artifact.sha256)
+        cache_lookup("memory", hit=data is not None)
+        if data is not None:
+            self._files.move_to_end(artifact.sha256)
+        return data
+
+    def put(self, sha256, data):
+        """
+        Cache the file of an artifact, then drop files to respect the byte budget.
+
+        Args:
+            sha256 (str): The sha256 of the artifact.
+            data (bytes): The content of the file.
+        """
+        if sha256 in self._files:
+            return
+        self._files[sha256] = data
+        self._size += len(data)
+        while self._size > settings.CONTENT_MEMORY_CACHE_SIZE:
+            _sha256, dropped = self._files.popitem(last=False)
+            self._size -= len(dropped)
+
+    @staticmethod
+    def _read(artifact):
+        artifact_file = artifact.file
+        with artifact_file.storage.open(artifact_file.name, "rb") as f:
+            return f.read()
+
+    async def load(self, artifact):
+        """
+        Read the file of an artifact in a thread, and cache it.
+
+        The file is read once even if it is requested again while it is being read. Files whose
+        content doesn't match the artifact are not cached.
+
+        Args:
+            artifact (:class:`~pulpcore.app.models.Artifact`): The artifact.
+        """
+        sha256 = artifact.sha256
+        if sha256 in self._loading or sha256 in self._files:
+            return
+        self._loading.add(sha256)
+        try:
+            data = await asyncio.get_event_loop().run_in_executor(None, self._read, artifact)
+        except Exception as e:
+            log.warning(
+                _("Could not cache the file of artifact {sha256}: {e}").format(sha256=sha256, e=e)
+            )
+        else:
+            if hashlib.sha256(data).hexdigest() == sha256:
+                self.put(sha256, data)
+        finally:
+            self._loading.discard(sha256)
+
+
+memory_file_cache = MemoryFileCache()
+
+
+async def listen_for_invalidation(retry_interval=5):
+    """
+    Invalidate the caches whenever a change is announced on the cache channel.
+
+    A dedicated database connection listens on
+    :data:`~pulpcore.constants.CONTENT_APP_CACHE_CHANNEL`. Its socket is watched by the event
+    loop, so waiting for notifications does not block request handling. If the connection is
+    lost, the caches are dropped and the connection is re-established.
+
+    Args:
+        retry_interval (int): Seconds to wait before reconnecting after an error.
+    """
+    import psycopg2
+    import psycopg2.extensions
+
+    loop = asyncio.get_event_loop()
+    while True:
+        lost = loop.create_future()
+        listen_connection = None
+        try:
+            listen_connection = psycopg2.connect(**connection.get_connection_params())
+            listen_connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with listen_connection.cursor() as cursor:
+                cursor.execute("LISTEN {channel}".format(channel=CONTENT_APP_CACHE_CHANNEL))
+
+            def _on_notify():
+                try:
+                    listen_connection.poll()
+                except psycopg2.Error as e:
+                    loop.remove_reader(listen_connection.fileno())
+                    if not lost.done():
+                        lost.set_exception(e)
+                    return
+                if listen_connection.notifies:
+                    listen_connection.notifies.clear()
+                    invalidate_caches()
+
+            loop.add_reader(listen_connection.fileno(), _on_notify)
+            # Anything changed before LISTEN took effect would go unnoticed otherwise.
+            invalidate_caches()
+            await lost
+        except psycopg2.Error as e:
+            log.warning(
+                _("Content app cache listener failed, reconnecting in {s} seconds: {e}").format(
+                    s=retry_interval, e=e
+                )
+            )
+        finally:
+            if listen_connection is not None:
+                if not listen_connection.closed:
+                    loop.remove_reader(listen_connection.fileno())
+                listen_connection.close()
+        invalidate_caches()
+        await asyncio.sleep(retry_interval)
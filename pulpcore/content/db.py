@@ -0,0 +1,355 @@
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from gettext import gettext as _
+import logging
+import threading
+import time
+import weakref
+
+import django
+
+django.setup()
+
+from django.conf import settings  # noqa: E402: module level not at top of file
+from django.db import connection  # noqa: E402: module level not at top of file
+
+from .metrics import CallbackMetric, registry  # noqa: E402: module level not at top of file
+
+log = logging.getLogger(__name__)
+
+try:
+    _current_task = asyncio.current_task
+except AttributeError:  # Python 3.6
+    _current_task = asyncio.Task.current_task
+
+
+class CallTimings:
+    """
+    Aggregated timings of the calls run by a :class:`DatabaseExecutor`.
+
+    Attributes:
+        count (int): The number of calls.
+        total (float): The total time spent in the calls, in seconds.
+        slowest (float): The time spent in the slowest call, in seconds.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+
+    def record(self, duration):
+        """
+        Record the duration of one call.
+
+        Args:
+            duration (float): The time spent in the call, in seconds.
+        """
+        self.count += 1
+        self.total += duration
+        self.slowest = max(self.slowest, duration)
+
+
+class PoolStats:
+    """
+    Counters of the threads and connections of a :class:`DatabaseExecutor`.
+
+    Attributes:
+        busy (int): The number of threads running a call.
+        waiting (int): The number of calls waiting for a thread.
+        exhausted (int): The number of calls that found every thread busy.
+        wait_time (float): The total time calls waited for a thread, in seconds.
+        connections (collections.defaultdict): The number of connections opened, and closed
+            because they were broken, unhealthy or expired, keyed by event.
+    """
+
+    def __init__(self):
+        self.busy = 0
+        self.waiting = 0
+        self.exhausted = 0
+        self.wait_time = 0.0
+        self.connections = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def connection_event(self, event):
+        """
+        Count an event of the connection of a thread.
+
+        Args:
+            event (str): ``opened``, ``broken``, ``unhealthy`` or ``expired``.
+        """
+        with self.lock:
+            self.connections[event] += 1
+
+
+class _ConnectionState(threading.local):
+    def __init__(self):
+        self.connection = None
+        self.opened_at = 0.0
+        self.last_used = 0.0
+
+
+class _PendingCall:
+    __slots__ = ("submitted", "started", "cancelled")
+
+    def __init__(self):
+        self.submitted = time.monotonic()
+        self.started = False
+        self.cancelled = False
+
+
+class DatabaseExecutor:
+    """
+    Run the content app's synchronous database work in a bounded pool of threads.
+
+    The Django ORM is synchronous. Running it on the event loop stalls every in-flight response of
+    the process until the query returns, so the content app hands database work to this executor
+    instead and awaits the result. Transactions started by a call are confined to that call,
+    because each thread uses its own database connection.
+
+    The pool has ``settings.CONTENT_APP_DB_THREADS`` threads, which is also the maximum number of
+    database connections the content app opens. Every thread keeps its connection between calls,
+    so requests don't pay for connecting to the database. Before a call, the connection of the
+    thread is closed, and reopened by the first query of the call, when an error left it
+    unusable, when it is older than ``settings.CONTENT_APP_DB_CONN_MAX_AGE`` seconds, or when it
+    was idle for more than ``settings.CONTENT_APP_DB_HEALTH_CHECK_INTERVAL`` seconds and fails a
+    health check.
+
+    The duration of every call is logged at debug level and aggregated per function in
+    :attr:`timings`. The time each task spends waiting for calls is also accumulated, see
+    :meth:`pop_task_time`. The use of the threads and connections is counted in :attr:`stats`.
+
+    Attributes:
+        timings (collections.defaultdict): :class:`CallTimings` keyed by the qualified name of the
+            function that was called.
+        stats (:class:`PoolStats`): The counters of the threads and connections.
+    """
+
+    def __init__(self, max_workers=None):
+        """
+        Args:
+            max_workers (int): The number of threads. Defaults to
+                ``settings.CONTENT_APP_DB_THREADS``.
+        """
+        self._max_workers = max_workers
+        self._executor = None
+        self._timings_lock = threading.Lock()
+        self.timings = defaultdict(CallTimings)
+        self._task_time = weakref.WeakKeyDictionary()
+        self._connection_state = _ConnectionState()
+        self.stats = PoolStats()
+
+    @property
+    def max_workers(self):
+        """
+        The number of threads of the pool.
+        """
+        return self._max_workers or settings.CONTENT_APP_DB_THREADS
+
+    @property
+    def executor(self):
+        """
+        The :class:`concurrent.futures.ThreadPoolExecutor`, created on first use.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="pulp-content-db"
+            )
+        return self._executor
+
+    def _track_connection(self, now):
+        """
+        Record when the connection of the current thread was opened, if it is a new one.
+
+        Args:
+            now (float): The time the connection was opened at the latest.
+        """
+        state = self._connection_state
+        if connection.connection is not None and connection.connection is not state.connection:
+            state.connection = connection.connection
+            state.opened_at = now
+            self.stats.connection_event("opened")
+
+    def _close_connection(self, event):
+        connection.close()
+        self.stats.connection_event(event)
+
+    def _reset_db_connection(self):
+        """
+        Close the connection of the current thread if it is unusable, unhealthy or obsolete.
+
+        Every thread of the pool keeps its connection between calls. It is closed, and reopened by
+        the next query, when an error left it unusable, when it is older than
+        ``settings.CONTENT_APP_DB_CONN_MAX_AGE``, or when it was idle for more than
+        ``settings.CONTENT_APP_DB_HEALTH_CHECK_INTERVAL`` and the server doesn't answer it anymore.
+        """
+        now = time.monotonic()
+        self._track_connection(now)
+        if connection.connection is None:
+            return
+        state = self._connection_state
+        if connection.errors_occurred:
+            if connection.is_usable():
+                connection.errors_occurred = False
+            else:
+                self._close_connection("broken")
+                return
+        max_age = settings.CONTENT_APP_DB_CONN_MAX_AGE
+        if max_age is not None and now - state.opened_at >= max_age:
+            self._close_connection("expired")
+            return
+        interval = settings.CONTENT_APP_DB_HEALTH_CHECK_INTERVAL
+        if interval is not None and now - state.last_used >= interval:
+            if not connection.is_usable():
+                self._close_connection("unhealthy")
+
+    def _call(self, pending, func, args, kwargs):
+        start = time.monotonic()
+        with self.stats.lock:
+            if pending.cancelled:
+                return None
+            pending.started = True
+            self.stats.waiting -= 1
+            self.stats.busy += 1
+            self.stats.wait_time += start - pending.submitted
+        self._reset_db_connection()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._track_connection(start)
+            self._connection_state.last_used = time.monotonic()
+            with self.stats.lock:
+                self.stats.busy -= 1
+            duration = time.monotonic() - start
+            name = getattr(func, "__qualname__", repr(func))
+            with self._timings_lock:
+                self.timings[name].record(duration)
+            log.debug(
+                _("Content app database call {name} took {ms:.1f} ms").format(
+                    name=name, ms=duration * 1000
+                )
+            )
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a synchronous function in the pool and wait for its result.
+
+        Args:
+            func (callable): The function to run.
+            args (tuple): Positional arguments for ``func``.
+            kwargs (dict): Keyword arguments for ``func``.
+
+        Returns:
+            The return value of ``func``. Exceptions raised by ``func`` are raised here.
+        """
+        loop = asyncio.get_event_loop()
+        pending = _PendingCall()
+        with self.stats.lock:
+            if self.stats.busy + self.stats.waiting >= self.max_workers:
+                self.stats.exhausted += 1
+            self.stats.waiting += 1
+        start = time.monotonic()
+        try:
+            return await loop.run_in_executor(
+                self.executor, partial(self._call, pending, func, args, kwargs)
+            )
+        finally:
+            with self.stats.lock:
+                if not pending.started:
+                    # The call was cancelled before a thread picked it up.
+                    pending.cancelled = True
+                    self.stats.waiting -= 1
+            task = _current_task()
+            if task is not None:
+                self._task_time[task] = self._task_time.get(task, 0.0) + time.monotonic() - start
+
+    def pop_task_time(self):
+        """
+        Get and reset the time the current task spent waiting for database calls.
+
+        Returns:
+            float: The time, in seconds.
+        """
+        task = _current_task()
+        if task is None:
+            return 0.0
+        return self._task_time.pop(task, 0.0)
+
+    def _timing_samples(self, attribute):
+        with self._timings_lock:
+            return [
+                ({"function": name}, getattr(timings, attribute))
+                for name, timings in self.timings.items()
+            ]
+
+
+database = DatabaseExecutor()
+
+registry.register(
+    CallbackMetric(
+        "pulp_content_db_calls_total",
+        "Database calls of the content app, by function.",
+        ("function",),
+        metric_type="counter",
+        callback=partial(database._timing_samples, "count"),
+    )
+)
+registry.register(
+    CallbackMetric(
+        "pulp_content_db_call_duration_seconds_total",
+        "Time spent in database calls of the content app, by function.",
+        ("function",),
+        metric_type="counter",
+        callback=partial(database._timing_samples, "total"),
+    )
+)
+registry.register(
+    CallbackMetric(
+        "pulp_content_db_pool_threads",
+        "Database threads of the content app, by state (busy or idle).",
+        ("state",),
+        metric_type="gauge",
+        callback=lambda: [
+            ({"state": "busy"}, database.stats.busy),
+            ({"state": "idle"}, database.max_workers - database.stats.busy),
+        ],
+    )
+)
+registry.register(
+    CallbackMetric(
+        "pulp_content_db_pool_waiting",
+        "Database calls of the content app waiting for a thread.",
+        metric_type="gauge",
+        callback=lambda: [({}, database.stats.waiting)],
+    )
+)
+registry.register(
+    CallbackMetric(
+        "pulp_content_db_pool_exhausted_total",
+        "Database calls of the content app that found every thread busy.",
+        metric_type="counter",
+        callback=lambda: [({}, database.stats.exhausted)],
+    )
+)
+registry.register(
+    CallbackMetric(
+        "pulp_content_db_pool_wait_seconds_total",
+        "Time database calls of the content app waited for a thread.",
+        metric_type="counter",
+        callback=lambda: [({}, database.stats.wait_time)],
+    )
+)
+registry.register(
+    CallbackMetric(
+        "pulp_content_db_connections_total",
+        "Database connections of the content app opened, and closed by event (broken, unhealthy "
+        "or expired).",
+        ("event",),
+        metric_type="counter",
+        callback=lambda: [
+            ({"event": event}, count) for event, count in list(database.stats.connections.items())
+        ],
+    )
+)
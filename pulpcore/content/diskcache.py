@@ -0,0 +1,177 @@
+from contextlib import suppress
+from gettext import gettext as _
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import django
+
+django.setup()
+
+from django.conf import settings  # noqa: E402: module level not at top of file
+
+from pulpcore.app.models import Artifact  # noqa: E402: module level not at top of file
+
+from .metrics import cache_lookup  # noqa: E402: module level not at top of file
+
+log = logging.getLogger(__name__)
+
+
+class StreamedContentCache:
+    """
+    A bounded disk cache of the files served for remotes with the ``streamed`` policy.
+
+    Files of the ``streamed`` policy are never saved as Artifacts, so without this cache every
+    request downloads them again. Files are cached by the reliable digest of their RemoteArtifact,
+    and only when the downloaded data matches that digest. RemoteArtifacts without a reliable
+    digest are never cached.
+
+    The cache lives in ``settings.CONTENT_STREAMED_CACHE_DIR`` and holds at most
+    ``settings.CONTENT_STREAMED_CACHE_SIZE`` bytes. When a new file exceeds that budget, the least
+    recently served files are evicted. The size of the cache is kept as files are put, so the
+    directory is only scanned when the budget is exceeded. Recency is tracked with the modification
+    time of the files, so every content app process sharing the directory sees the same order. A
+    size of 0 disables the cache.
+    """
+
+    def __init__(self):
+        self._size = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """
+        Whether caching is enabled.
+        """
+        return settings.CONTENT_STREAMED_CACHE_SIZE > 0
+
+    @property
+    def directory(self):
+        """
+        The directory of the cache.
+        """
+        return settings.CONTENT_STREAMED_CACHE_DIR
+
+    @staticmethod
+    def digest(remote_artifact):
+        """
+        Get the digest a RemoteArtifact is cached by.
+
+        Args:
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact.
+
+        Returns:
+            tuple: The name of the digest algorithm and the expected digest, or None if the
+                RemoteArtifact has no reliable digest.
+        """
+        for algorithm in Artifact.RELIABLE_DIGEST_FIELDS:
+            digest = getattr(remote_artifact, algorithm)
+            if digest:
+                return algorithm, digest
+        return None
+
+    def path(self, algorithm, digest):
+        """
+        Get the path a file is cached at.
+
+        Args:
+            algorithm (str): The name of the digest algorithm.
+            digest (str): The digest of the file.
+
+        Returns:
+            str: The path of the file in the cache.
+        """
+        return os.path.join(self.directory, algorithm, digest[:2], digest[2:])
+
+    def get(self, remote_artifact):
+        """
+        Get the cached file of a RemoteArtifact, and mark it as recently served.
+
+        Args:
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact.
+
+        Returns:
+            str: The path of the cached file, or None if it is not cached.
+        """
+        digest = self.digest(remote_artifact)
+        if digest is None:
+            return None
+        path = self.path(*digest)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            cache_lookup("streamed", hit=False)
+            return None
+        cache_lookup("streamed", hit=True)
+        return path
+
+    def put(self, algorithm, digest, path):
+        """
+        Link a downloaded file into the cache, then evict files to respect the byte budget.
+
+        Args:
+            algorithm (str): The name of the digest algorithm.
+            digest (str): The verified digest of the file.
+            path (str): The path of the downloaded file. The file is hard linked, or copied when it
+                is on another filesystem, and left in place.
+        """
+        cached_path = self.path(algorithm, digest)
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        # Files are linked in under a temporary name first, so that a file is never served while
+        # it is being copied from another filesystem.
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory, prefix=".")
+        os.close(fd)
+        try:
+            os.remove(temporary_path)
+            try:
+                os.link(path, temporary_path)
+            except OSError:
+                shutil.copyfile(path, temporary_path)
+            size = os.stat(temporary_path).st_size
+            with self._lock:
+                with suppress(FileNotFoundError):
+                    size -= os.stat(cached_path).st_size
+                os.replace(temporary_path, cached_path)
+                if self._size is not None:
+                    self._size += size
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(temporary_path)
+        if self._size is None or self._size > settings.CONTENT_STREAMED_CACHE_SIZE:
+            self.evict()
+
+    def _entries(self):
+        for algorithm in os.scandir(self.directory):
+            if not algorithm.is_dir() or algorithm.name.startswith("."):
+                continue
+            for prefix in os.scandir(algorithm.path):
+                for entry in os.scandir(prefix.path):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, entry.path
+
+    def evict(self):
+        """
+        Remove the least recently served files until the cache fits in its byte budget.
+
+        This scans the whole cache, and resets the size the process keeps of the cache, to account
+        for the files put or evicted by the other processes sharing the directory.
+        """
+        with self._lock:
+            entries = sorted(self._entries())
+            size = sum(entry_size for _mtime, entry_size, _path in entries)
+            for _mtime, entry_size, path in entries:
+                if size <= settings.CONTENT_STREAMED_CACHE_SIZE:
+                    break
+                with suppress(FileNotFoundError):
+                    os.remove(path)
+                    log.debug(_("Evicted {path} from the streamed content cache").format(path=path))
+                size -= entry_size
+            self._size = size
+
+
+streamed_cache = StreamedContentCache()
@@ -1,12 +1,27 @@
+import asyncio
+from contextlib import suppress
+from datetime import timezone
+from email.utils import format_datetime
+from functools import partial
+import hashlib
 import logging
 import mimetypes
 import os
 import re
+import time
 from gettext import gettext as _
+from urllib.parse import quote
+import warnings
 
 from aiohttp.client_exceptions import ClientResponseError
-from aiohttp.web import FileResponse, StreamResponse, HTTPOk
-from aiohttp.web_exceptions import HTTPForbidden, HTTPFound, HTTPNotFound
+from aiohttp.web import FileResponse, StreamResponse, HTTPOk, Response
+from aiohttp.web_exceptions import (
+    HTTPForbidden,
+    HTTPFound,
+    HTTPNotFound,
+    HTTPNotModified,
+    HTTPRequestRangeNotSatisfiable,
+)
 
 import django
 
@@ -18,7 +33,6 @@ from django.core.exceptions import (  # noqa: E402: module level not at top of f
     ObjectDoesNotExist,
 )
 from django.db import (  # noqa: E402: module level not at top of file
-    connection,
     IntegrityError,
     transaction,
 )
@@ -26,14 +40,58 @@ from pulpcore.app.models import (  # noqa: E402: module level not at top of file
     Artifact,
     BaseDistribution,
     ContentArtifact,
+    IndexedDirectoryEntry,
+    PublishedMetadata,
     Remote,
     RemoteArtifact,
 )
 
 from jinja2 import Template  # noqa: E402: module level not at top of file
 
+from .access import access_counts  # noqa: E402: module level not at top of file
+from .cache import (  # noqa: E402: module level not at top of file
+    get_distribution_cache,
+    memory_file_cache,
+    not_found_cache,
+    redirect_url_cache,
+    resolve_related,
+)
+from .db import database  # noqa: E402: module level not at top of file
+from .diskcache import streamed_cache  # noqa: E402: module level not at top of file
+from .metrics import (  # noqa: E402: module level not at top of file
+    REQUEST_FILE_SIZE,
+    UPSTREAM_DURATION,
+    UPSTREAM_FAILURES,
+    set_request_type,
+)
+from .persistence import artifact_persistence  # noqa: E402: module level not at top of file
+from .remotes import shared_remotes  # noqa: E402: module level not at top of file
+from .singleflight import (  # noqa: E402: module level not at top of file
+    SharedDownloadLock,
+    download_flights,
+    mirror_preferences,
+)
+
 log = logging.getLogger(__name__)
 
+DIRECTORY_LISTING_TEMPLATE = Template(
+    """
+<!DOCTYPE html>
+<html>
+    <body>
+        <ul>
+        {% for name in dir_list %}
+            <li><a href="{{ name|e }}">{{ name|e }}</a></li>
+        {% endfor %}
+        </ul>
+        {% if next_page is not none %}
+        <a href="?after={{ next_page|urlencode }}">Next page</a>
+        {% endif %}
+    </body>
+</html>
+"""
+)
+
 
 class PathNotResolved(HTTPNotFound):
     """
@@ -97,28 +155,44 @@ class Handler:
     @staticmethod
     def _reset_db_connection():
         """
-        Reset database connection if it's unusable or obselete to avoid "connection already closed".
+        Deprecated, this does nothing.
+
+        The database calls of the content app run in the threads of
+        :data:`~pulpcore.content.db.database`, which reset their own connections.
         """
-        connection.close_if_unusable_or_obsolete()
+        warnings.warn(
+            _("Handler._reset_db_connection() is deprecated and does nothing."),
+            DeprecationWarning,
+            stacklevel=2,
+        )
 
     async def list_distributions(self, request):
         """
         The handler for an HTML listing all distributions
 
+        The listing is paginated by base path, see ``settings.CONTENT_DIRECTORY_LISTING_PAGE_SIZE``.
+        The ``after`` query parameter selects the page listing the base paths that sort after it.
+
         Args:
             request (:class:`aiohttp.web.request`): The request from the client.
 
         Returns:
             :class:`aiohttp.web.HTTPOk`: The response back to the client.
         """
-        self._reset_db_connection()
-
-        if self.distribution_model is None:
-            distributions = BaseDistribution.objects.only("base_path").all()
-        else:
-            distributions = self.distribution_model.objects.only("base_path").all()
-        directory_list = ["{}/".format(d.base_path) for d in distributions]
-        return HTTPOk(headers={"Content-Type": "text/html"}, body=self.render_html(directory_list))
+        set_request_type(request, "distribution_listing")
+        page_size = settings.CONTENT_DIRECTORY_LISTING_PAGE_SIZE
+        after = request.query.get("after")
+        model = self.distribution_model or BaseDistribution
+        base_paths = model.objects.order_by("base_path").values_list("base_path", flat=True)
+        if after is not None:
+            base_paths = base_paths.filter(base_path__gt=after)
+        base_paths = await database.run(list, base_paths[: page_size + 1])
+        next_page = base_paths[page_size - 1] if len(base_paths) > page_size else None
+        directory_list = ["{}/".format(base_path) for base_path in base_paths[:page_size]]
+        return HTTPOk(
+            headers={"Content-Type": "text/html"},
+            body=self.render_html(directory_list, next_page=next_page),
+        )
 
     async def stream_content(self, request):
         """
@@ -131,8 +205,6 @@ class Handler:
             :class:`aiohttp.web.StreamResponse` or :class:`aiohttp.web.FileResponse`: The response
                 back to the client.
         """
-        self._reset_db_connection()
-
         path = request.match_info["path"]
         return await self._match_and_stream(path, request)
 
@@ -162,6 +234,9 @@ class Handler:
         """
         Match a distribution using a list of base paths and return its detail object.
 
+        When the distribution cache is enabled, the distribution is matched and resolved from the
+        cache, see :class:`~pulpcore.content.cache.DistributionCache`.
+
         Args:
             path (str): The path component of the URL.
 
@@ -171,14 +246,26 @@ class Handler:
         Raises:
             PathNotResolved: when not matched.
         """
+        cache = get_distribution_cache(cls.distribution_model or BaseDistribution)
+        if cache.enabled:
+            distribution = cache.match(path)
+            if distribution is None:
+                log.debug(
+                    _("{model_name} not matched for {path} using the distribution cache").format(
+                        model_name=cache.model.__name__, path=path
+                    )
+                )
+                raise PathNotResolved(path)
+            return distribution
+
         base_paths = cls._base_paths(path)
         try:
             if cls.distribution_model is None:
                 model_class = BaseDistribution
-                return BaseDistribution.objects.get(base_path__in=base_paths).cast()
+                distribution = BaseDistribution.objects.get(base_path__in=base_paths).cast()
             else:
                 model_class = cls.distribution_model
-                return cls.distribution_model.objects.get(base_path__in=base_paths)
+                distribution = cls.distribution_model.objects.get(base_path__in=base_paths)
         except ObjectDoesNotExist:
             log.debug(
                 _("{model_name} not matched for {path} using: {base_paths}").format(
@@ -186,6 +273,46 @@ class Handler:
                 )
             )
             raise PathNotResolved(path)
+        return resolve_related(distribution)
+
+    @classmethod
+    def _latest_version(cls, distribution):
+        """
+        Get the latest version of the repository served by a distribution.
+
+        Args:
+            distribution (detail of BaseDistribution): A distribution with a ``repository``.
+
+        Returns:
+            :class:`~pulpcore.app.models.RepositoryVersion`: The latest complete version.
+        """
+        cache = get_distribution_cache(cls.distribution_model or BaseDistribution)
+        return cache.latest_version(distribution)
+
+    @staticmethod
+    def _version_content_artifacts(repository_version, relative_path):
+        """
+        Get the ContentArtifacts at a relative path in a repository version.
+
+        The :class:`~pulpcore.app.models.IndexedPath` objects of the repository version are used
+        when it has been indexed, otherwise the content of the repository version is searched.
+
+        Args:
+            repository_version (:class:`~pulpcore.app.models.RepositoryVersion`): The repository
+                version to search.
+            relative_path (str): The relative path of the ContentArtifacts.
+
+        Returns:
+            django.db.models.QuerySet: The matching ContentArtifacts.
+        """
+        if repository_version.paths_indexed:
+            return ContentArtifact.objects.filter(
+                indexed_paths__repository_version=repository_version,
+                indexed_paths__relative_path=relative_path,
+            )
+        return ContentArtifact.objects.filter(
+            content__in=repository_version.content, relative_path=relative_path
+        )
 
     @staticmethod
     def _permit(request, distribution):
@@ -232,31 +359,38 @@ class Handler:
         return headers
 
     @staticmethod
-    def render_html(directory_list):
+    def render_html(directory_list, next_page=None):
         """
         Render a list of strings as an HTML list of links.
 
         Args:
             directory_list (iterable): an iterable of strings representing file and directory names
+            next_page (str): The cursor of the next page of the listing, linked as the ``after``
+                query parameter. None when there is no next page.
 
         Returns:
             String representing HTML of the directory listing.
         """
-        template = Template(
-            """
-        <!DOCTYPE html>
-        <html>
-            <body>
-                <ul>
-                {% for name in dir_list %}
-                    <li><a href="{{ name|e }}">{{ name|e }}</a></li>
-                {% endfor %}
-                </ul>
-            </body>
-        </html>
-        """
+        return DIRECTORY_LISTING_TEMPLATE.render(
+            dir_list=sorted(directory_list), next_page=next_page
         )
-        return template.render(dir_list=sorted(directory_list))
+
+    @staticmethod
+    def _indexed_directory_entries(repo_version, publication, path):
+        """
+        Get the :class:`~pulpcore.app.models.IndexedDirectoryEntry` objects of a directory.
+
+        Args:
+            repo_version (:class:`~pulpcore.app.models.RepositoryVersion`): The repository version
+            publication (:class:`~pulpcore.app.models.Publication`): Publication
+            path (str): relative path of the directory inside the repo version or publication.
+
+        Returns:
+            django.db.models.QuerySet: The entries of the directory.
+        """
+        if publication:
+            return IndexedDirectoryEntry.objects.filter(publication=publication, directory=path)
+        return IndexedDirectoryEntry.objects.filter(repository_version=repo_version, directory=path)
 
     async def list_directory(self, repo_version, publication, path):
         """
@@ -266,6 +400,10 @@ class Handler:
         method generates a set of strings representing the list of a path inside the repository
         version or publication.
 
+        When the paths of the repository version or publication are indexed, only the entries of
+        the directory are read, see :class:`~pulpcore.app.models.IndexedDirectoryEntry`.
+        Otherwise every path below the directory is read.
+
         Args:
             repo_version (:class:`~pulpcore.app.models.RepositoryVersion`): The repository version
             publication (:class:`~pulpcore.app.models.Publication`): Publication
@@ -283,33 +421,121 @@ class Handler:
             result = re.match(r"({})([^\/]*)(\/*)".format(directory_path), relative_path)
             return "{}{}".format(result.groups()[1], result.groups()[2])
 
-        directory_list = set()
+        def list_directory_blocking():
+            if (publication or repo_version).paths_indexed:
+                entries = self._indexed_directory_entries(repo_version, publication, path)
+                return set(entries.values_list("name", flat=True))
 
-        if publication:
-            pas = publication.published_artifact.filter(relative_path__startswith=path)
-            for pa in pas:
-                directory_list.add(file_or_directory_name(path, pa.relative_path))
+            directory_list = set()
+
+            if publication:
+                pas = publication.published_artifact.filter(relative_path__startswith=path)
+                for pa in pas:
+                    directory_list.add(file_or_directory_name(path, pa.relative_path))
 
-            if publication.pass_through:
+                if publication.pass_through:
+                    cas = ContentArtifact.objects.filter(
+                        content__in=publication.repository_version.content,
+                        relative_path__startswith=path,
+                    )
+                    for ca in cas:
+                        directory_list.add(file_or_directory_name(path, ca.relative_path))
+
+            if repo_version:
                 cas = ContentArtifact.objects.filter(
-                    content__in=publication.repository_version.content,
-                    relative_path__startswith=path,
+                    content__in=repo_version.content, relative_path__startswith=path
                 )
                 for ca in cas:
                     directory_list.add(file_or_directory_name(path, ca.relative_path))
 
-        if repo_version:
-            cas = ContentArtifact.objects.filter(
-                content__in=repo_version.content, relative_path__startswith=path
-            )
-            for ca in cas:
-                directory_list.add(file_or_directory_name(path, ca.relative_path))
+            return directory_list
+
+        directory_list = await database.run(list_directory_blocking)
 
         if directory_list:
             return directory_list
         else:
             raise PathNotResolved(path)
 
+    async def list_directory_page(self, repo_version, publication, path, after=None):
+        """
+        Generate one page of the directory listing of the path.
+
+        Pages hold at most ``settings.CONTENT_DIRECTORY_LISTING_PAGE_SIZE`` names, in name order.
+        When the paths of the repository version or publication are indexed, a page is read from
+        the index of the directory alone. Otherwise the whole listing is generated by
+        :meth:`list_directory` and sliced.
+
+        Args:
+            repo_version (:class:`~pulpcore.app.models.RepositoryVersion`): The repository version
+            publication (:class:`~pulpcore.app.models.Publication`): Publication
+            path (str): relative path inside the repo version of publication.
+            after (str): List the names that sort after this one. None for the first page.
+
+        Returns:
+            tuple: The set of names in the page, and the cursor of the next page or None.
+
+        Raises:
+            PathNotResolved: when the directory is empty.
+        """
+        page_size = settings.CONTENT_DIRECTORY_LISTING_PAGE_SIZE
+        owner = publication or repo_version
+
+        if owner is not None and owner.paths_indexed:
+
+            def list_directory_page_blocking():
+                entries = self._indexed_directory_entries(repo_version, publication, path)
+                if after is not None:
+                    entries = entries.filter(name__gt=after)
+                names = entries.order_by("name").values_list("name", flat=True).distinct()
+                return list(names[: page_size + 1])
+
+            names = await database.run(list_directory_page_blocking)
+        else:
+            names = sorted(await self.list_directory(repo_version, publication, path))
+            if after is not None:
+                names = [name for name in names if name > after]
+            names = names[: page_size + 1]
+
+        if not names and after is None:
+            raise PathNotResolved(path)
+        next_page = names[page_size - 1] if len(names) > page_size else None
+        return set(names[:page_size]), next_page
+
+    async def _list_directory_response(self, request, distro, repo_version, publication, path):
+        """
+        Respond with one page of the directory listing of the path.
+
+        The entries that :meth:`BaseDistribution.content_handler_list_directory` adds are listed
+        on the page their name sorts into.
+
+        Args:
+            request(:class:`~aiohttp.web.Request`): The request to prepare a response for.
+            distro (detail of :class:`pulpcore.plugin.models.BaseDistribution`): The matched
+                distribution.
+            repo_version (:class:`~pulpcore.app.models.RepositoryVersion`): The repository version
+            publication (:class:`~pulpcore.app.models.Publication`): Publication
+            path (str): relative path inside the repo version of publication.
+
+        Returns:
+            :class:`aiohttp.web.HTTPOk`: The response back to the client.
+        """
+        set_request_type(request, "directory_listing")
+        after = request.query.get("after")
+        dir_list, next_page = await self.list_directory_page(
+            repo_version, publication, path, after=after
+        )
+        extra = await database.run(distro.content_handler_list_directory, path)
+        dir_list.update(
+            name
+            for name in extra
+            if (after is None or name > after) and (next_page is None or name <= next_page)
+        )
+        return HTTPOk(
+            headers={"Content-Type": "text/html"},
+            body=self.render_html(dir_list, next_page=next_page),
+        )
+
     async def _match_and_stream(self, path, request):
         """
         Match the path and stream results either from the filesystem or by downloading new data.
@@ -331,6 +557,9 @@ class Handler:
         Finally, when nothing is served to client yet, we check if there is a remote for the
         Distribution. If so, the artifact is pulled from the remote and streamed to the client.
 
+        Paths that could not be resolved are remembered for a while, see
+        :class:`~pulpcore.content.cache.NotFoundCache`.
+
         Args:
             path (str): The path component of the URL.
             request(:class:`~aiohttp.web.Request`): The request to prepare a response for.
@@ -343,54 +572,87 @@ class Handler:
             :class:`aiohttp.web.StreamResponse` or :class:`aiohttp.web.FileResponse`: The response
                 streamed back to the client.
         """
-        distro = self._match_distribution(path)
-        self._permit(request, distro)
+        distro = await database.run(self._match_distribution, path)
+        set_request_type(request, "unresolved", distro)
+        await database.run(self._permit, request, distro)
 
         rel_path = path.lstrip("/")
         rel_path = rel_path[len(distro.base_path) :]
         rel_path = rel_path.lstrip("/")
 
-        content_handler_result = distro.content_handler(rel_path)
+        not_found_generation = not_found_cache.generation
+        content_handler_result = await database.run(distro.content_handler, rel_path)
         if content_handler_result is not None:
+            set_request_type(request, "content_handler")
             return content_handler_result
 
+        # The content handler of a distribution may serve paths that were not found before, so it
+        # always runs before the cache is checked.
+        if not_found_cache.enabled and (distro, rel_path) in not_found_cache:
+            raise PathNotResolved(path)
+
         headers = self.response_headers(rel_path)
 
         publication = getattr(distro, "publication", None)
 
         if publication:
             if rel_path == "" or rel_path[-1] == "/":
-                try:
-                    index_path = "{}index.html".format(rel_path)
-                    publication.published_artifact.get(relative_path=index_path)
+                index_path = "{}index.html".format(rel_path)
+                index_exists = await database.run(
+                    publication.published_artifact.filter(relative_path=index_path).exists
+                )
+                if index_exists:
                     rel_path = index_path
                     headers = self.response_headers(rel_path)
-                except ObjectDoesNotExist:
-                    dir_list = await self.list_directory(None, publication, rel_path)
-                    dir_list.update(distro.content_handler_list_directory(rel_path))
-                    return HTTPOk(
-                        headers={"Content-Type": "text/html"}, body=self.render_html(dir_list)
+                else:
+                    return await self._list_directory_response(
+                        request, distro, None, publication, rel_path
                     )
 
-            # published artifact
+            # published artifact, or pass-through when the paths of the publication are indexed
+            if publication.paths_indexed:
+                content_artifacts = ContentArtifact.objects.filter(
+                    indexed_paths__publication=publication, indexed_paths__relative_path=rel_path
+                )
+            else:
+                content_artifacts = ContentArtifact.objects.filter(
+                    published_artifact__publication=publication,
+                    published_artifact__relative_path=rel_path,
+                )
             try:
-                pa = publication.published_artifact.get(relative_path=rel_path)
-                ca = pa.content_artifact
+                ca = await database.run(
+                    content_artifacts.select_related("artifact", "content").get
+                )
+            except MultipleObjectsReturned:
+                log.error(
+                    _("Multiple (pass-through) matches for {b}/{p}"),
+                    {"b": distro.base_path, "p": rel_path},
+                )
+                raise
             except ObjectDoesNotExist:
                 pass
             else:
+                set_request_type(request, "published_artifact")
                 if ca.artifact:
-                    return self._serve_content_artifact(ca, headers)
+                    metadata = ca.content.pulp_type == PublishedMetadata.get_pulp_type()
+                    if metadata:
+                        set_request_type(request, "published_metadata")
+                        ca, headers = await self._metadata_variant(request, ca, headers)
+                    return self._serve_content_artifact(
+                        ca, headers, request, self._max_age(distro, metadata=metadata)
+                    )
                 else:
                     return await self._stream_content_artifact(
                         request, StreamResponse(headers=headers), ca
                     )
 
             # pass-through
-            if publication.pass_through:
+            if publication.pass_through and not publication.paths_indexed:
                 try:
-                    ca = ContentArtifact.objects.get(
-                        content__in=publication.repository_version.content, relative_path=rel_path
+                    ca = await database.run(
+                        ContentArtifact.objects.select_related("artifact").get,
+                        content__in=publication.repository_version.content,
+                        relative_path=rel_path,
                     )
                 except MultipleObjectsReturned:
                     log.error(
@@ -401,8 +663,11 @@ class Handler:
                 except ObjectDoesNotExist:
                     pass
                 else:
+                    set_request_type(request, "pass_through")
                     if ca.artifact:
-                        return self._serve_content_artifact(ca, headers)
+                        return self._serve_content_artifact(
+                            ca, headers, request, self._max_age(distro)
+                        )
                     else:
                         return await self._stream_content_artifact(
                             request, StreamResponse(headers=headers), ca
@@ -413,25 +678,25 @@ class Handler:
 
         if repository or repo_version:
             if repository:
-                repo_version = distro.repository.latest_version()
+                repo_version = await database.run(self._latest_version, distro)
 
             if rel_path == "" or rel_path[-1] == "/":
-                try:
-                    index_path = "{}index.html".format(rel_path)
-                    ContentArtifact.objects.get(
-                        content__in=repo_version.content, relative_path=index_path
-                    )
+                index_path = "{}index.html".format(rel_path)
+                index_exists = await database.run(
+                    self._version_content_artifacts(repo_version, index_path).exists
+                )
+                if index_exists:
                     rel_path = index_path
-                except ObjectDoesNotExist:
-                    dir_list = await self.list_directory(repo_version, None, rel_path)
-                    dir_list.update(distro.content_handler_list_directory(rel_path))
-                    return HTTPOk(
-                        headers={"Content-Type": "text/html"}, body=self.render_html(dir_list)
+                else:
+                    return await self._list_directory_response(
+                        request, distro, repo_version, None, rel_path
                     )
 
             try:
-                ca = ContentArtifact.objects.get(
-                    content__in=repo_version.content, relative_path=rel_path
+                ca = await database.run(
+                    self._version_content_artifacts(repo_version, rel_path)
+                    .select_related("artifact")
+                    .get
                 )
             except MultipleObjectsReturned:
                 log.error(
@@ -442,16 +707,24 @@ class Handler:
             except ObjectDoesNotExist:
                 pass
             else:
-                return self._serve_content_artifact(ca, headers)
+                set_request_type(request, "repository_version")
+                return self._serve_content_artifact(ca, headers, request, self._max_age(distro))
 
         if distro.remote:
             remote = distro.remote.cast()
             try:
                 url = remote.get_remote_artifact_url(rel_path)
-                ra = RemoteArtifact.objects.get(remote=remote, url=url)
+                ra = await database.run(
+                    RemoteArtifact.objects.select_related("content_artifact__artifact").get,
+                    remote=remote,
+                    url=url,
+                )
                 ca = ra.content_artifact
+                set_request_type(request, "on_demand")
                 if ca.artifact:
-                    return self._serve_content_artifact(ca, headers)
+                    return self._serve_content_artifact(
+                        ca, headers, request, self._max_age(distro)
+                    )
                 else:
                     return await self._stream_content_artifact(
                         request, StreamResponse(headers=headers), ca
@@ -463,6 +736,8 @@ class Handler:
                     request, StreamResponse(headers=headers), ra
                 )
 
+        if not_found_cache.enabled:
+            not_found_cache.add(distro, rel_path, not_found_generation)
         raise PathNotResolved(path)
 
     async def _stream_content_artifact(self, request, response, content_artifact):
@@ -475,6 +750,11 @@ class Handler:
         :class:`~pulpcore.plugin.models.RemoteArtifact` downloads raise exceptions, an HTTP 502
         error is returned to the client.
 
+        When ``settings.CONTENT_HEDGE_DELAY`` is set, the next RemoteArtifact is not only tried
+        after a failure, but also raced against a download that is slow to respond. The remotes
+        that won recently are tried first, see
+        :class:`~pulpcore.content.singleflight.MirrorPreferences`.
+
         Args:
             request(:class:`~aiohttp.web.Request`): The request to prepare a response for.
             response (:class:`~aiohttp.web.StreamResponse`): The response to stream data to.
@@ -487,15 +767,89 @@ class Handler:
                 :class:`~pulpcore.plugin.models.ContentArtifact` returned the binary data needed for
                 the client.
         """
-        for remote_artifact in content_artifact.remoteartifact_set.all():
+        access_counts.record(content_artifact)
+        remote_artifacts = await database.run(
+            list, content_artifact.remoteartifact_set.select_related("remote")
+        )
+        remote_artifacts = mirror_preferences.sort(remote_artifacts)
+        if settings.CONTENT_HEDGE_DELAY is not None and len(remote_artifacts) > 1:
             try:
-                response = await self._stream_remote_artifact(request, response, remote_artifact)
+                return await self._stream_remote_artifact(
+                    request, response, remote_artifacts[0], alternatives=remote_artifacts[1:]
+                )
+            except ClientResponseError:
+                raise HTTPNotFound()
+
+        for remote_artifact in remote_artifacts:
+            try:
+                return await self._stream_remote_artifact(request, response, remote_artifact)
 
             except ClientResponseError:
                 continue
 
         raise HTTPNotFound()
 
+    @staticmethod
+    async def _cache_streamed_download(remote_artifact, flight, cache_digest, hasher):
+        """
+        Put the file of a streamed download in the streamed content cache if it is valid.
+
+        Args:
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact
+                that was downloaded.
+            flight (:class:`~pulpcore.content.singleflight.DownloadFlight`): The flight of the
+                download.
+            cache_digest (tuple): The digest algorithm and expected digest of the RemoteArtifact.
+            hasher: The hash object of the downloaded data.
+        """
+        algorithm, digest = cache_digest
+        if hasher.hexdigest() != digest or (
+            remote_artifact.size and remote_artifact.size != flight.size
+        ):
+            log.warning(
+                _("Not caching {url}: the downloaded data does not match its {algorithm}").format(
+                    url=remote_artifact.url, algorithm=algorithm
+                )
+            )
+            return
+        flight.writer.close()
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, streamed_cache.put, algorithm, digest, flight.path)
+        except OSError as e:
+            log.warning(
+                _("Could not cache {url} in the streamed content cache: {e}").format(
+                    url=remote_artifact.url, e=e
+                )
+            )
+
+    def _save_artifact_from_spool(self, download_result, remote_artifact, flight):
+        """
+        Save the Artifact of a download from a link to the spool of its flight.
+
+        The flight is still registered while its artifact is saved, so clients joining it in the
+        meantime must still find the spool. The file moved into the artifact storage is a new link
+        to the spool, made for every attempt, so an attempt that is retried after the file was moved
+        saves the same data again.
+
+        Args:
+            download_result (:class:`~pulpcore.plugin.download.DownloadResult`): The result of the
+                download.
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact
+                that was downloaded.
+            flight (:class:`~pulpcore.content.singleflight.DownloadFlight`): The flight the data
+                was spooled by.
+
+        Returns:
+            The associated :class:`~pulpcore.plugin.models.Artifact`.
+        """
+        path = flight.link()
+        try:
+            return self._save_artifact(download_result._replace(path=path), remote_artifact)
+        finally:
+            with suppress(FileNotFoundError):
+                os.remove(path)
+
     def _save_artifact(self, download_result, remote_artifact):
         """
         Create/Get an Artifact and associate it to a RemoteArtifact and/or ContentArtifact.
@@ -562,49 +916,247 @@ class Handler:
                 content_artifact.save()
         return artifact
 
-    def _serve_content_artifact(self, content_artifact, headers):
+    @staticmethod
+    def _accepted_encodings(request):
+        """
+        Get the encodings of published metadata variants that the client accepts.
+
+        Args:
+            request (:class:`aiohttp.web.Request`): The request.
+
+        Returns:
+            list: The keys of :attr:`PublishedMetadata.ENCODINGS` that the client accepts, the one
+                to serve first.
+        """
+        qualities = {}
+        for coding in request.headers.get("Accept-Encoding", "").split(","):
+            name, _sep, parameters = coding.partition(";")
+            quality = 1.0
+            for parameter in parameters.split(";"):
+                key, _sep, value = parameter.partition("=")
+                if key.strip().lower() == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            qualities[name.strip().lower()] = quality
+        default = qualities.get("*", 0.0)
+        accepted = [
+            (qualities.get(encoding, default), encoding) for encoding in PublishedMetadata.ENCODINGS
+        ]
+        # sorted() is stable, so the preferred encoding comes first among equal qualities.
+        accepted = sorted(accepted, key=lambda item: item[0], reverse=True)
+        return [encoding for quality, encoding in accepted if quality > 0]
+
+    async def _metadata_variant(self, request, content_artifact, headers):
+        """
+        Select the compressed variant of published metadata that suits the client best.
+
+        Variants are only served from the filesystem storage, as redirects to cloud storages can't
+        carry the ``Content-Encoding`` header. Metadata that has variants is always served with
+        ``Vary: Accept-Encoding``, so that caches don't serve a variant to clients that don't accept
+        its encoding, nor the uncompressed metadata to the clients that do.
+
+        Args:
+            request (:class:`aiohttp.web.Request`): The request.
+            content_artifact (:class:`pulpcore.app.models.ContentArtifact`): The ContentArtifact of
+                the PublishedMetadata.
+            headers (dict): The response headers.
+
+        Returns:
+            tuple: The ContentArtifact to serve and the response headers.
+        """
+        if settings.DEFAULT_FILE_STORAGE != "pulpcore.app.models.storage.FileSystem":
+            return content_artifact, headers
+        paths = {
+            content_artifact.relative_path + suffix: encoding
+            for encoding, suffix in PublishedMetadata.ENCODINGS.items()
+        }
+        variants = await database.run(
+            list,
+            ContentArtifact.objects.select_related("artifact").filter(
+                content_id=content_artifact.content_id, relative_path__in=paths
+            ),
+        )
+        if not variants:
+            return content_artifact, headers
+        headers = dict(headers, Vary="Accept-Encoding")
+        variants = {paths[variant.relative_path]: variant for variant in variants}
+        for encoding in self._accepted_encodings(request):
+            if encoding in variants:
+                headers["Content-Encoding"] = encoding
+                return variants[encoding], headers
+        return content_artifact, headers
+
+    @staticmethod
+    def _max_age(distribution, metadata=False):
+        """
+        Get the number of seconds clients may cache a file served by a distribution.
+
+        Args:
+            distribution (detail of :class:`pulpcore.plugin.models.BaseDistribution`): The
+                distribution serving the file.
+            metadata (bool): Whether the file is :class:`~pulpcore.plugin.models.PublishedMetadata`.
+
+        Returns:
+            int: The number of seconds, or None if clients should not be told.
+        """
+        if metadata:
+            max_age = distribution.metadata_max_age
+            return settings.CONTENT_METADATA_MAX_AGE if max_age is None else max_age
+        max_age = distribution.artifact_max_age
+        return settings.CONTENT_ARTIFACT_MAX_AGE if max_age is None else max_age
+
+    @staticmethod
+    def _not_modified(request, etag, last_modified):
+        """
+        Whether the conditional headers of a request match the current version of a file.
+
+        ``If-None-Match`` takes precedence over ``If-Modified-Since``, as required by RFC 7232.
+
+        Args:
+            request (:class:`aiohttp.web.Request`): The request for the file.
+            etag (str): The quoted ETag of the file.
+            last_modified (datetime.datetime): When the file was last modified.
+
+        Returns:
+            bool: True if the client's copy of the file is current.
+        """
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+        if_modified_since = request.if_modified_since
+        if if_modified_since is None:
+            return False
+        return last_modified.replace(microsecond=0) <= if_modified_since
+
+    def _serve_content_artifact(self, content_artifact, headers, request=None, max_age=None):
         """
         Handle response for a Content Artifact with the file present.
 
         Depending on where the file storage (e.g. filesystem, S3, etc) this could be responding with
         the file (filesystem) or a redirect (S3).
 
+        Artifacts are immutable, so the response has an ``ETag`` derived from the sha256 of the
+        artifact and a ``Last-Modified`` of its creation. When the request is given, conditional
+        requests are answered with 304 Not Modified, and HEAD requests are answered, without
+        touching the file.
+
+        Small files are served from memory once they are cached, except to Range requests, see
+        :class:`~pulpcore.content.cache.MemoryFileCache`.
+
         Args:
             content_artifact (:class:`pulpcore.app.models.ContentArtifact`): The Content Artifact to
                 respond with.
             headers (dict): A dictionary of response headers.
+            request (:class:`aiohttp.web.Request`): The request to respond to.
+            max_age (int): The number of seconds clients may cache the file, sent in a
+                ``Cache-Control`` header. None to send no ``Cache-Control`` header.
 
         Raises:
             :class:`aiohttp.web_exceptions.HTTPFound`: When we need to redirect to the file
+            :class:`aiohttp.web_exceptions.HTTPNotModified`: When the client's copy is current
             NotImplementedError: If file is stored in a file storage we can't handle
 
         Returns:
             The :class:`aiohttp.web.FileResponse` for the file.
         """
+        access_counts.record(content_artifact)
+        artifact = content_artifact.artifact
+        last_modified = artifact.pulp_created.astimezone(timezone.utc)
+        etag = '"{}"'.format(artifact.sha256)
+        headers = dict(headers)
+        headers["ETag"] = etag
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+        if max_age is not None:
+            headers["Cache-Control"] = "max-age={}".format(max_age)
+        if request is not None:
+            if self._not_modified(request, etag, last_modified):
+                raise HTTPNotModified(headers=headers)
+            if request.method == "HEAD":
+                headers["Content-Length"] = str(artifact.size)
+                return Response(headers=headers)
+
+        # Range requests are left to the file response, which answers them with the right part.
+        ranged = request is not None and "Range" in request.headers
+        if not ranged and memory_file_cache.cacheable(artifact):
+            data = memory_file_cache.get(artifact)
+            if data is not None:
+                return Response(body=data, headers=headers)
+            asyncio.ensure_future(memory_file_cache.load(artifact))
+
         if settings.DEFAULT_FILE_STORAGE == "pulpcore.app.models.storage.FileSystem":
-            filename = content_artifact.artifact.file.name
-            return FileResponse(os.path.join(settings.MEDIA_ROOT, filename), headers=headers)
+            if request is not None:
+                request[REQUEST_FILE_SIZE] = artifact.size
+            path = os.path.join(settings.MEDIA_ROOT, content_artifact.artifact.file.name)
+            return self._file_response(path, headers)
         elif (
             settings.DEFAULT_FILE_STORAGE == "storages.backends.s3boto3.S3Boto3Storage"
             or settings.DEFAULT_FILE_STORAGE == "storages.backends.azure_storage.AzureStorage"
         ):
-            artifact_file = content_artifact.artifact.file
             content_disposition = f"attachment;filename={content_artifact.relative_path}"
             parameters = {"ResponseContentDisposition": content_disposition}
-            url = artifact_file.storage.url(artifact_file.name, parameters=parameters)
+            url = redirect_url_cache.url(content_artifact.artifact, parameters)
             raise HTTPFound(url)
         else:
             raise NotImplementedError()
 
-    async def _stream_remote_artifact(self, request, response, remote_artifact):
+    @staticmethod
+    def _file_response(path, headers):
+        """
+        Respond with a file of the local filesystem.
+
+        When ``settings.CONTENT_SENDFILE_HEADER`` is set, the web server in front of the content
+        app sends the file: the response only has a ``X-Accel-Redirect`` header with the path of
+        the file under ``settings.CONTENT_ACCEL_REDIRECT_PREFIX``, or a ``X-Sendfile`` header with
+        the absolute path of the file. Files outside of ``MEDIA_ROOT`` can't be sent with
+        ``X-Accel-Redirect``, and nginx drops the ``Content-Encoding`` header of internal
+        redirects, so such files are still sent by the content app.
+
+        Args:
+            path (str): The absolute path of the file.
+            headers (dict): The response headers.
+
+        Returns:
+            :class:`aiohttp.web.Response` or :class:`aiohttp.web.FileResponse`: The response.
+        """
+        header = settings.CONTENT_SENDFILE_HEADER
+        if header == "X-Sendfile":
+            return Response(headers=dict(headers, **{header: path}))
+        if header == "X-Accel-Redirect" and "Content-Encoding" not in headers:
+            relative_path = os.path.relpath(path, settings.MEDIA_ROOT)
+            if not relative_path.startswith(os.pardir):
+                location = settings.CONTENT_ACCEL_REDIRECT_PREFIX + quote(relative_path)
+                return Response(headers=dict(headers, **{header: location}))
+        return FileResponse(path, headers=headers)
+
+    async def _stream_remote_artifact(self, request, response, remote_artifact, alternatives=()):
         """
         Stream and save a RemoteArtifact.
 
+        Concurrent requests for the same remote and url share a single upstream download, which is
+        saved once, see :class:`~pulpcore.content.singleflight.DownloadFlights`. When
+        ``settings.CONTENT_APP_DOWNLOAD_LOCK_TIMEOUT`` is set, a file that another content app
+        process is already downloading and saving is served from storage once it is saved.
+
+        Files of remotes with the ``streamed`` policy are served from the streamed content cache
+        when they are in it, see :class:`~pulpcore.content.diskcache.StreamedContentCache`.
+
+        A byte range requested with the ``Range`` header is served from the download in progress,
+        if any. Otherwise a range that doesn't start at the first byte is requested from the remote
+        directly, see :meth:`_stream_remote_range`.
+
+        When alternative RemoteArtifacts of the same file are given, a download that is slow to
+        respond is raced against them, see :meth:`_hedge`.
+
         Args:
             request(:class:`~aiohttp.web.Request`): The request to prepare a response for.
             response (:class:`~aiohttp.web.StreamResponse`): The response to stream data to.
             content_artifact (:class:`~pulpcore.plugin.models.ContentArtifact`): The ContentArtifact
                 to fetch and then stream back to the client
+            alternatives (list): Other :class:`~pulpcore.plugin.models.RemoteArtifact` objects of
+                the same file, in the order to try them.
 
         Raises:
             :class:`~aiohttp.web.HTTPNotFound` when no
@@ -613,34 +1165,435 @@ class Handler:
                 the client.
 
         """
-        remote = remote_artifact.remote.cast()
+        remote = await shared_remotes.cast(remote_artifact.remote)
+        try:
+            return await self._stream_shared_remote_artifact(
+                request, response, remote, remote_artifact, alternatives
+            )
+        finally:
+            shared_remotes.release(remote)
+
+    async def _stream_shared_remote_artifact(
+        self, request, response, remote, remote_artifact, alternatives
+    ):
+        """
+        Stream and save a RemoteArtifact with the shared instance of its remote.
+
+        See :meth:`_stream_remote_artifact`, the download started here retains the remote until it
+        is done.
+
+        Args:
+            request(:class:`~aiohttp.web.Request`): The request to prepare a response for.
+            response (:class:`~aiohttp.web.StreamResponse`): The response to stream data to.
+            remote (:class:`~pulpcore.plugin.models.Remote`): The shared detail remote.
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact.
+            alternatives (list): Other :class:`~pulpcore.plugin.models.RemoteArtifact` objects of
+                the same file, in the order to try them.
+        """
+        key = (remote.pk, remote_artifact.url)
+        save = remote.policy != Remote.STREAMED
+        set_request_type(request, "on_demand" if save else "streamed")
+
+        if not save and streamed_cache.enabled:
+            cached_path = streamed_cache.get(remote_artifact)
+            if cached_path is not None:
+                try:
+                    request[REQUEST_FILE_SIZE] = os.path.getsize(cached_path)
+                except FileNotFoundError:
+                    # Another process evicted the file since it was looked up, download it again.
+                    pass
+                else:
+                    return self._file_response(cached_path, dict(response.headers))
+
+        http_range = self._http_range(request)
+        flight = download_flights.get(key)
+        if (
+            flight is None
+            and http_range is not None
+            and http_range.start != 0
+            and remote_artifact.url.startswith(("http://", "https://"))
+        ):
+            return await self._stream_remote_range(request, response, remote, remote_artifact)
+
+        if flight is None:
+            shared_lock = None
+            if save and settings.CONTENT_APP_DOWNLOAD_LOCK_TIMEOUT:
+                shared_lock = SharedDownloadLock(key, settings.CONTENT_APP_DOWNLOAD_LOCK_TIMEOUT)
+                if not await shared_lock.acquire():
+                    await shared_lock.wait()
+                    ca = await database.run(self._saved_content_artifact, remote, remote_artifact)
+                    if ca is not None:
+                        return self._serve_content_artifact(ca, dict(response.headers), request)
+                    if not await shared_lock.acquire():
+                        shared_lock = None
+            # Another request of this process may have started the download in the meantime.
+            flight = download_flights.get(key)
+            if flight is None:
+                flight = download_flights.start(
+                    key,
+                    partial(self._download_remote_artifact, remote, remote_artifact, shared_lock),
+                    cancel_when_abandoned=not save,
+                )
+                shared_remotes.retain(remote, until=flight.task)
+            elif shared_lock is not None:
+                await shared_lock.release()
+
+        reader = flight.open()
+        if alternatives:
+            # The readers of the other downloads are closed by the race, also when it fails.
+            flight, reader, remote_artifact = await self._hedge(
+                flight, reader, remote_artifact, alternatives
+            )
+        try:
+            headers = await flight.wait_for_headers()
+            if http_range is None:
+                for name, value in headers:
+                    response.headers[name] = value
+                await response.prepare(request)
+                chunks = flight.read(reader)
+            else:
+                start, stop, size = await self._flight_range(
+                    flight, remote_artifact, headers, http_range
+                )
+                for name, value in headers:
+                    if name.lower() not in ("content-length", "content-range"):
+                        response.headers[name] = value
+                response.set_status(206)
+                response.headers["Content-Range"] = "bytes {start}-{end}/{size}".format(
+                    start=start, end=stop - 1, size=size
+                )
+                response.content_length = stop - start
+                await response.prepare(request)
+                chunks = flight.read(reader, start, stop)
+            async for data in chunks:
+                await response.write(data)
+        finally:
+            flight.close(reader)
+        await response.write_eof()
+        return response
+
+    async def _hedge(self, flight, reader, remote_artifact, alternatives):
+        """
+        Race the download of a RemoteArtifact against the downloads of its alternatives.
+
+        Whenever no download started so far has sent headers for ``settings.CONTENT_HEDGE_DELAY``
+        seconds, or all of them failed, the download of the next alternative is started. The first
+        download to send headers wins and is recorded in the mirror preferences. The others are
+        cancelled, unless other clients are reading them.
+
+        Args:
+            flight (:class:`~pulpcore.content.singleflight.DownloadFlight`): The flight of the
+                RemoteArtifact.
+            reader (file object): The reader of the flight.
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact.
+            alternatives (list): The alternative RemoteArtifacts, in the order to try them.
+
+        Returns:
+            tuple: The flight, reader and RemoteArtifact of the winning download.
+
+        Raises:
+            Exception: The error of the last download, if all of them failed.
+        """
+        alternatives = list(alternatives)
+        candidates = {}
+        error = None
+
+        def add(flight, reader, remote_artifact):
+            waiter = asyncio.ensure_future(flight.wait_for_headers())
+            candidates[waiter] = (flight, reader, remote_artifact)
+
+        add(flight, reader, remote_artifact)
+        try:
+            while True:
+                if not candidates:
+                    if not alternatives:
+                        raise error
+                    alternative = alternatives.pop(0)
+                    alternative_flight = await self._alternative_flight(alternative)
+                    add(alternative_flight, alternative_flight.open(), alternative)
+                done, _pending = await asyncio.wait(
+                    list(candidates),
+                    timeout=settings.CONTENT_HEDGE_DELAY if alternatives else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for waiter in done:
+                    flight, reader, remote_artifact = candidates.pop(waiter)
+                    if waiter.exception() is None:
+                        mirror_preferences.won(remote_artifact.remote_id)
+                        return flight, reader, remote_artifact
+                    error = waiter.exception()
+                    flight.close(reader, cancel=True)
+                if not done and alternatives:
+                    alternative = alternatives.pop(0)
+                    alternative_flight = await self._alternative_flight(alternative)
+                    add(alternative_flight, alternative_flight.open(), alternative)
+        finally:
+            for waiter, (flight, reader, _remote_artifact) in candidates.items():
+                waiter.cancel()
+                flight.close(reader, cancel=True)
+
+    async def _alternative_flight(self, remote_artifact):
+        """
+        Get the flight downloading an alternative RemoteArtifact, starting it if needed.
+
+        Args:
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact.
+
+        Returns:
+            :class:`~pulpcore.content.singleflight.DownloadFlight`: The flight.
+        """
+        remote = await shared_remotes.cast(remote_artifact.remote)
+        try:
+            key = (remote.pk, remote_artifact.url)
+            flight = download_flights.get(key)
+            if flight is None:
+                flight = download_flights.start(
+                    key,
+                    partial(self._download_remote_artifact, remote, remote_artifact, None),
+                    cancel_when_abandoned=remote.policy == Remote.STREAMED,
+                )
+                shared_remotes.retain(remote, until=flight.task)
+            return flight
+        finally:
+            shared_remotes.release(remote)
+
+    @staticmethod
+    def _http_range(request):
+        """
+        Get the byte range requested by the client.
+
+        Args:
+            request(:class:`~aiohttp.web.Request`): The request from the client.
+
+        Returns:
+            slice: The requested range, as parsed by :attr:`aiohttp.web.BaseRequest.http_range`.
+                None when the whole file is requested or the ``Range`` header is not supported.
+        """
+        try:
+            http_range = request.http_range
+        except ValueError:
+            return None
+        if http_range.start is None and http_range.stop is None:
+            return None
+        return http_range
+
+    @staticmethod
+    async def _flight_range(flight, remote_artifact, headers, http_range):
+        """
+        Resolve a requested byte range against the file of a download.
+
+        The size of the file is taken from the RemoteArtifact or from the ``Content-Length`` of the
+        remote. If neither is known, the download is awaited.
+
+        Args:
+            flight (:class:`~pulpcore.content.singleflight.DownloadFlight`): The download.
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact
+                being downloaded.
+            headers (list): The ``(name, value)`` pairs of the headers of the remote.
+            http_range (slice): The range requested by the client.
+
+        Returns:
+            tuple: The offsets of the first byte and after the last byte to send, and the size of
+                the file.
+
+        Raises:
+            :class:`aiohttp.web_exceptions.HTTPRequestRangeNotSatisfiable`: When the range starts
+                after the end of the file.
+        """
+        size = remote_artifact.size
+        if not size:
+            content_length = {name.lower(): value for name, value in headers}.get("content-length")
+            if content_length:
+                size = int(content_length)
+            else:
+                await flight.wait()
+                if not flight.complete:
+                    raise flight.error
+                size = flight.size
+        if http_range.start < 0:
+            start, stop = max(size + http_range.start, 0), size
+        else:
+            start, stop = http_range.start, min(http_range.stop or size, size)
+        if start >= stop:
+            raise HTTPRequestRangeNotSatisfiable(
+                headers={"Content-Range": "bytes */{size}".format(size=size)}
+            )
+        return start, stop, size
+
+    async def _stream_remote_range(self, request, response, remote, remote_artifact):
+        """
+        Stream the byte range requested by the client straight from the remote.
+
+        The ``Range`` header is forwarded to the remote, and the data is neither saved nor shared
+        with other requests.
+
+        Args:
+            request(:class:`~aiohttp.web.Request`): The request to prepare a response for.
+            response (:class:`~aiohttp.web.StreamResponse`): The response to stream data to.
+            remote (:class:`~pulpcore.plugin.models.Remote`): The detail remote of the
+                RemoteArtifact.
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact
+                to stream a range of.
+
+        Raises:
+            :class:`aiohttp.web_exceptions.HTTPRequestRangeNotSatisfiable`: When the remote can't
+                serve the range.
+
+        Returns:
+            :class:`aiohttp.web.StreamResponse`: The response streamed back to the client.
+        """
 
         async def handle_headers(headers):
             for name, value in headers.items():
                 if name.lower() in self.hop_by_hop_headers:
                     continue
                 response.headers[name] = value
+            if "Content-Range" in headers:
+                response.set_status(206)
             await response.prepare(request)
 
         async def handle_data(data):
             await response.write(data)
-            if remote.policy != Remote.STREAMED:
-                await original_handle_data(data)
 
         async def finalize():
-            if remote.policy != Remote.STREAMED:
-                await original_finalize()
+            pass
 
         downloader = remote.get_downloader(
-            remote_artifact=remote_artifact, headers_ready_callback=handle_headers
+            url=remote_artifact.url,
+            headers_ready_callback=handle_headers,
+            request_headers={"Range": request.headers["Range"]},
         )
-        original_handle_data = downloader.handle_data
         downloader.handle_data = handle_data
-        original_finalize = downloader.finalize
         downloader.finalize = finalize
-        download_result = await downloader.run()
-
-        if remote.policy != Remote.STREAMED:
-            self._save_artifact(download_result, remote_artifact)
+        try:
+            await self._run_downloader(remote, downloader)
+        except ClientResponseError as e:
+            if e.status == 416:
+                raise HTTPRequestRangeNotSatisfiable()
+            raise
         await response.write_eof()
         return response
+
+    @staticmethod
+    async def _run_downloader(remote, downloader):
+        """
+        Run a downloader, recording its duration and failures in the metrics of its remote.
+
+        Args:
+            remote (:class:`~pulpcore.plugin.models.Remote`): The remote of the downloader.
+            downloader (:class:`~pulpcore.plugin.download.BaseDownloader`): The downloader.
+
+        Returns:
+            :class:`~pulpcore.plugin.download.DownloadResult`: The result of the download.
+        """
+        start = time.monotonic()
+        try:
+            return await downloader.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            UPSTREAM_FAILURES.inc(remote=remote.name)
+            raise
+        finally:
+            UPSTREAM_DURATION.observe(time.monotonic() - start, remote=remote.name)
+
+    @staticmethod
+    def _saved_content_artifact(remote, remote_artifact):
+        """
+        Get the ContentArtifact of a RemoteArtifact if its Artifact has been saved.
+
+        Args:
+            remote (:class:`~pulpcore.plugin.models.Remote`): The remote of the RemoteArtifact.
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact,
+                saved or not.
+
+        Returns:
+            :class:`~pulpcore.plugin.models.ContentArtifact`: The ContentArtifact with its
+                Artifact, or None.
+        """
+        remote_artifact = (
+            RemoteArtifact.objects.select_related("content_artifact__artifact")
+            .filter(
+                remote=remote, url=remote_artifact.url, content_artifact__artifact__isnull=False
+            )
+            .first()
+        )
+        if remote_artifact is None:
+            return None
+        return remote_artifact.content_artifact
+
+    async def _download_remote_artifact(self, remote, remote_artifact, shared_lock, flight):
+        """
+        Download a RemoteArtifact into a flight, and save it unless the policy is streamed.
+
+        The clients of the flight don't wait for the artifact to be saved: the save goes through
+        the :class:`~pulpcore.content.persistence.PersistenceQueue` once all the data is spooled.
+
+        With the ``streamed`` policy, the file is put in the streamed content cache instead when
+        the cache is enabled and the data matches the digest of the RemoteArtifact.
+
+        Args:
+            remote (:class:`~pulpcore.plugin.models.Remote`): The detail remote of the
+                RemoteArtifact.
+            remote_artifact (:class:`~pulpcore.plugin.models.RemoteArtifact`): The RemoteArtifact
+                to download.
+            shared_lock (:class:`~pulpcore.content.singleflight.SharedDownloadLock`): The lock
+                held for the download, or None.
+            flight (:class:`~pulpcore.content.singleflight.DownloadFlight`): The flight to write
+                the data to.
+
+        Returns:
+            :class:`~pulpcore.plugin.download.DownloadResult`: The result of the download.
+        """
+        save = remote.policy != Remote.STREAMED
+        cache_digest = None
+        if not save and streamed_cache.enabled:
+            cache_digest = streamed_cache.digest(remote_artifact)
+        if cache_digest is not None:
+            hasher = hashlib.new(cache_digest[0])
+
+        async def handle_headers(headers):
+            flight.set_headers(
+                [
+                    (name, value)
+                    for name, value in headers.items()
+                    if name.lower() not in self.hop_by_hop_headers
+                ]
+            )
+
+        async def handle_data(data):
+            if save:
+                await original_handle_data(data)
+            else:
+                flight.writer.write(data)
+                if cache_digest is not None:
+                    hasher.update(data)
+            flight.wrote(len(data))
+
+        async def finalize():
+            if save:
+                await original_finalize()
+
+        try:
+            downloader = remote.get_downloader(
+                remote_artifact=remote_artifact,
+                headers_ready_callback=handle_headers,
+                custom_file_object=flight.writer,
+            )
+            original_handle_data = downloader.handle_data
+            downloader.handle_data = handle_data
+            original_finalize = downloader.finalize
+            downloader.finalize = finalize
+            download_result = await self._run_downloader(remote, downloader)
+            flight.set_complete()
+
+            if save:
+                await artifact_persistence.save(
+                    self._save_artifact_from_spool, download_result, remote_artifact, flight
+                )
+            elif cache_digest is not None:
+                await self._cache_streamed_download(remote_artifact, flight, cache_digest, hasher)
+            return download_result
+        finally:
+            if shared_lock is not None:
+                await shared_lock.release()
@@ -0,0 +1,353 @@
+"""
+Metrics of the content app, exposed in the Prometheus text format.
+
+Every content app process keeps its own metrics, see ``settings.CONTENT_APP_METRICS_PATH``.
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+import threading
+import time
+
+from aiohttp import web
+
+REQUEST_TYPE = "pulp_content_request_type"
+REQUEST_DISTRIBUTION = "pulp_content_request_distribution"
+REQUEST_FILE_SIZE = "pulp_content_request_file_size"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join('{}="{}"'.format(name, _escape(value)) for name, value in labels)
+    )
+
+
+def _format_value(value):
+    if isinstance(value, int):
+        return str(value)
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """
+    A metric with optional labels.
+
+    Args:
+        name (str): The name of the metric.
+        documentation (str): The help text of the metric.
+        labelnames (tuple): The names of the labels of the metric.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self):
+        """
+        Get the current samples of the metric.
+
+        Returns:
+            list: Tuples of sample name suffix, labels as ``(name, value)`` pairs, and value.
+        """
+
+    def render(self):
+        """
+        Render the metric in the Prometheus text format.
+
+        Returns:
+            list: The lines of the metric.
+        """
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} {}".format(self.name, self.type),
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(
+                "{}{}{} {}".format(self.name, suffix, _format_labels(labels), _format_value(value))
+            )
+        return lines
+
+
+class Counter(Metric):
+    """
+    A value that only goes up, e.g. a number of requests.
+    """
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        """
+        Increment the counter.
+
+        Args:
+            amount (float): The increment.
+            labels (dict): The value of every label of the metric.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [("", key, value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    """
+    A distribution of observed values, e.g. durations, counted in buckets.
+
+    Args:
+        buckets (tuple): The increasing upper bounds of the buckets.
+    """
+
+    type = "histogram"
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(float(bound) for bound in buckets) + (float("inf"),)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        """
+        Observe a value.
+
+        Args:
+            value (float): The value.
+            labels (dict): The value of every label of the metric.
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append(("_bucket", key + (("le", _format_value(bound)),), cumulative))
+                samples.append(("_count", key, cumulative))
+                samples.append(("_sum", key, total))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """
+    A metric whose samples are read from elsewhere when the metrics are rendered.
+
+    Args:
+        metric_type (str): The Prometheus type of the metric, ``counter`` or ``gauge``.
+        callback (callable): Called without arguments, returns an iterable of pairs of labels as
+            a dict and value.
+    """
+
+    def __init__(self, *args, metric_type, callback, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.type = metric_type
+        self.callback = callback
+
+    def samples(self):
+        return [("", self._key(labels), value) for labels, value in self.callback()]
+
+
+class Registry:
+    """
+    The metrics of the process.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """
+        Add a metric to the rendered metrics.
+
+        Args:
+            metric (:class:`Metric`): The metric.
+
+        Returns:
+            :class:`Metric`: The same metric.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Render all the metrics in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(
+    Counter(
+        "pulp_content_requests_total",
+        "Requests, by distribution, type of content and response status.",
+        ("distribution", "type", "status"),
+    )
+)
+REQUEST_DURATION = registry.register(
+    Histogram(
+        "pulp_content_request_duration_seconds",
+        "Time spent handling requests, by type of content.",
+        ("type",),
+    )
+)
+REQUEST_DB_DURATION = registry.register(
+    Histogram(
+        "pulp_content_request_db_duration_seconds",
+        "Time requests spent waiting for the database, by type of content.",
+        ("type",),
+    )
+)
+RESPONSE_BYTES = registry.register(
+    Counter(
+        "pulp_content_response_bytes_total",
+        "Bytes of content served, by distribution and type of content.",
+        ("distribution", "type"),
+    )
+)
+UPSTREAM_DURATION = registry.register(
+    Histogram(
+        "pulp_content_upstream_duration_seconds",
+        "Time spent fetching content from remotes, by remote.",
+        ("remote",),
+    )
+)
+UPSTREAM_FAILURES = registry.register(
+    Counter(
+        "pulp_content_upstream_failures_total",
+        "Failed fetches of content from remotes, by remote.",
+        ("remote",),
+    )
+)
+CACHE_LOOKUPS = registry.register(
+    Counter(
+        "pulp_content_cache_lookups_total",
+        "Lookups in the caches of the content app, by cache and result (hit or miss).",
+        ("cache", "result"),
+    )
+)
+
+
+def cache_lookup(cache, hit):
+    """
+    Count a lookup in a cache.
+
+    Args:
+        cache (str): The name of the cache.
+        hit (bool): Whether the lookup was a hit.
+    """
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def set_request_type(request, request_type, distribution=None):
+    """
+    Record the type of content a request is served, for the metrics of the request.
+
+    Args:
+        request (:class:`aiohttp.web.Request`): The request.
+        request_type (str): The type of content, e.g. ``published_artifact`` or ``streamed``.
+        distribution (detail of :class:`pulpcore.plugin.models.BaseDistribution`): The
+            distribution serving the request, if it is known.
+    """
+    request[REQUEST_TYPE] = request_type
+    if distribution is not None:
+        request[REQUEST_DISTRIBUTION] = distribution.name
+
+
+def _response_size(request, response):
+    if request.method == "HEAD":
+        return 0
+    if response.prepared:
+        return response.body_length
+    if REQUEST_FILE_SIZE in request:
+        # Files are sent after the middlewares returned, by the content app or the web server.
+        return request[REQUEST_FILE_SIZE]
+    return response.content_length or 0
+
+
+def metrics_middleware(db_time):
+    """
+    Build a middleware recording the metrics of every request.
+
+    Args:
+        db_time (callable): Called without arguments at the end of a request, returns the time
+            the request spent waiting for the database and resets it.
+
+    Returns:
+        An :mod:`aiohttp` middleware.
+    """
+
+    @web.middleware
+    async def middleware(request, handler):
+        start = time.monotonic()
+        status = 500
+        response = None
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            request_type = request.get(REQUEST_TYPE, "unmatched")
+            distribution = request.get(REQUEST_DISTRIBUTION, "")
+            REQUESTS.inc(distribution=distribution, type=request_type, status=status)
+            REQUEST_DURATION.observe(time.monotonic() - start, type=request_type)
+            REQUEST_DB_DURATION.observe(db_time(), type=request_type)
+            if response is not None:
+                RESPONSE_BYTES.inc(
+                    _response_size(request, response), distribution=distribution, type=request_type
+                )
+
+    return middleware
+
+
+async def metrics_handler(request):
+    """
+    Serve the metrics of the process in the Prometheus text format.
+
+    Args:
+        request (:class:`aiohttp.web.Request`): The request from the client.
+
+    Returns:
+        :class:`aiohttp.web.Response`: The metrics.
+    """
+    set_request_type(request, "metrics")
+    return web.Response(
+        body=registry.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
@@ -0,0 +1,186 @@
+import asyncio
+from gettext import gettext as _
+import logging
+import threading
+
+import django
+
+django.setup()
+
+from django.db import (  # noqa: E402: module level not at top of file
+    IntegrityError,
+    OperationalError,
+    close_old_connections,
+)
+
+from .db import database  # noqa: E402: module level not at top of file
+from .metrics import CallbackMetric, registry  # noqa: E402: module level not at top of file
+
+log = logging.getLogger(__name__)
+
+
+class PersistenceStats:
+    """
+    Counters of the work done by a :class:`PersistenceQueue`.
+
+    Attributes:
+        queued (int): The number of saves queued.
+        saved (int): The number of saves that succeeded.
+        retried (int): The number of times a save was retried after a conflict.
+        failed (int): The number of saves that failed for good.
+        batches (int): The number of batches the saves were run in.
+    """
+
+    def __init__(self):
+        self.queued = 0
+        self.saved = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def increment(self, name):
+        """
+        Increment a counter. This is safe to call from the database threads.
+
+        Args:
+            name (str): The name of the counter.
+        """
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+class PersistenceQueue:
+    """
+    Save downloaded artifacts in the background of the content app.
+
+    Clients of an on-demand download don't wait for its artifact to be saved. The save is queued
+    instead, and a single worker task runs the queued saves. The saves queued while the worker was
+    busy are run together, as one batch in one database thread, so a burst of downloads costs one
+    round trip to the thread pool instead of one per download. Each save keeps its own transaction.
+
+    A save that fails because of a conflict with a concurrent transaction is queued again after an
+    exponential backoff, up to ``retries`` times. The backoff is waited for on the event loop, so
+    it doesn't hold a database thread.
+
+    Args:
+        batch_size (int): The maximum number of saves run in one batch.
+        retries (int): The number of times a conflicting save is retried.
+
+    Attributes:
+        stats (:class:`PersistenceStats`): The counters of the queue.
+    """
+
+    def __init__(self, batch_size=50, retries=3):
+        self.batch_size = batch_size
+        self.retries = retries
+        self.stats = PersistenceStats()
+        self._queue = None
+        self._worker = None
+
+    @property
+    def depth(self):
+        """
+        The number of saves waiting in the queue.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def save(self, func, *args):
+        """
+        Queue a save and wait for it to be done.
+
+        A save that is retried calls ``func`` again with the same arguments, so ``func`` must not
+        consume them, e.g. by moving a file it was given.
+
+        Args:
+            func (callable): The synchronous function saving the artifact, e.g.
+                :meth:`~pulpcore.content.Handler._save_artifact_from_spool`.
+            args (tuple): The arguments of ``func``.
+
+        Returns:
+            The return value of ``func``. Exceptions raised by ``func`` are raised here.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._work())
+        future = asyncio.get_event_loop().create_future()
+        self._queue.put_nowait((func, args, future, 0))
+        self.stats.increment("queued")
+        return await future
+
+    async def _work(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self.stats.increment("batches")
+            try:
+                results = await database.run(self._save_batch, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # E.g. no database thread could be run, fail the batch but keep the worker.
+                log.exception(_("Could not save a batch of pull-through artifacts"))
+                # The traceback holds the frame of this worker, which the callers must not clear.
+                e = e.with_traceback(None)
+                for _func, _args, future, _attempt in batch:
+                    if not future.cancelled():
+                        self.stats.increment("failed")
+                        future.set_exception(e)
+                continue
+            for (func, args, future, attempt), (result, error) in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if isinstance(error, (IntegrityError, OperationalError)) and attempt < self.retries:
+                    self.stats.increment("retried")
+                    loop.call_later(
+                        0.1 * 2 ** attempt,
+                        self._queue.put_nowait,
+                        (func, args, future, attempt + 1),
+                    )
+                elif error is not None:
+                    self.stats.increment("failed")
+                    log.error(_("Could not save a pull-through artifact: {e}").format(e=error))
+                    future.set_exception(error)
+                else:
+                    self.stats.increment("saved")
+                    future.set_result(result)
+
+    def _save_batch(self, batch):
+        return [self._save_one(func, args) for func, args, _future, _attempt in batch]
+
+    @staticmethod
+    def _save_one(func, args):
+        try:
+            return func(*args), None
+        except (IntegrityError, OperationalError) as e:
+            close_old_connections()
+            return None, e
+        except Exception as e:
+            return None, e
+
+
+artifact_persistence = PersistenceQueue()
+
+registry.register(
+    CallbackMetric(
+        "pulp_content_artifact_saves_total",
+        "Saves of pull-through artifacts, by result (queued, saved, retried or failed).",
+        ("result",),
+        metric_type="counter",
+        callback=lambda: [
+            ({"result": result}, getattr(artifact_persistence.stats, result))
+            for result in ("queued", "saved", "retried", "failed")
+        ],
+    )
+)
+registry.register(
+    CallbackMetric(
+        "pulp_content_artifact_save_queue_depth",
+        "Saves of pull-through artifacts waiting in the queue.",
+        metric_type="gauge",
+        callback=lambda: [({}, artifact_persistence.depth)],
+    )
+)
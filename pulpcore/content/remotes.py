@@ -0,0 +1,125 @@
+import asyncio
+from collections import OrderedDict
+
+import django
+
+django.setup()
+
+from .db import database  # noqa: E402: module level not at top of file
+from .metrics import cache_lookup  # noqa: E402: module level not at top of file
+
+
+class SharedRemotes:
+    """
+    The detail remotes the content app downloads from, shared by every request of the process.
+
+    A remote builds its :class:`~pulpcore.plugin.download.DownloaderFactory` on first use, and the
+    factory creates an :class:`aiohttp.ClientSession`, with its connection pool, SSL context and
+    client certificate. Casting the remote of every on-demand request to a new instance pays for
+    all of that on every request. Each remote is cast once instead, and the same instance, with its
+    factory, is used by every request of the process.
+
+    Remotes are keyed by their ``pk`` and ``pulp_last_updated``, so a remote that was changed is
+    cast again, and gets a new factory with the new settings, as soon as a request loads it.
+
+    At most ``max_size`` remotes are kept, the least recently used ones are dropped first, so the
+    remotes that were deleted don't stay around.
+
+    Every :meth:`cast` is a use of the remote that must be paired with a :meth:`release`, and the
+    downloads that outlive a request :meth:`retain` the remote for as long as they run. The session
+    of a remote that is dropped or replaced is only closed once all its uses are released.
+
+    Args:
+        max_size (int): The number of remotes kept at most.
+    """
+
+    def __init__(self, max_size=100):
+        self.max_size = max_size
+        self._remotes = OrderedDict()
+        self._uses = {}
+        self._retired = {}
+
+    def _get(self, remote):
+        shared = self._remotes.get(remote.pk)
+        if shared is not None:
+            if shared.pulp_last_updated == remote.pulp_last_updated:
+                self._remotes.move_to_end(remote.pk)
+            else:
+                shared = None
+        cache_lookup("remote", hit=shared is not None)
+        return shared
+
+    def _put(self, remote):
+        shared = self._remotes.get(remote.pk)
+        if shared is not None:
+            if shared.pulp_last_updated == remote.pulp_last_updated:
+                # Another request cast the same remote in the meantime.
+                return shared
+            self._retire(self._remotes.pop(remote.pk))
+        self._remotes[remote.pk] = remote
+        while len(self._remotes) > self.max_size:
+            _pk, dropped = self._remotes.popitem(last=False)
+            self._retire(dropped)
+        return remote
+
+    def _retire(self, remote):
+        if self._uses.get(id(remote)):
+            self._retired[id(remote)] = remote
+        else:
+            self._close(remote)
+
+    @staticmethod
+    def _close(remote):
+        # The factory is only built by the first download from the remote.
+        download_factory = getattr(remote, "_download_factory", None)
+        if download_factory is not None:
+            asyncio.ensure_future(download_factory.close())
+
+    async def cast(self, remote):
+        """
+        Get the shared detail instance of a remote, casting it if needed.
+
+        The shared remote is used until it is passed to :meth:`release`.
+
+        Args:
+            remote (:class:`~pulpcore.plugin.models.Remote`): The remote, master or detail.
+
+        Returns:
+            detail of :class:`~pulpcore.plugin.models.Remote`: The shared detail remote.
+        """
+        shared = self._get(remote)
+        if shared is None:
+            shared = self._put(await database.run(remote.cast))
+        self.retain(shared)
+        return shared
+
+    def retain(self, shared, until=None):
+        """
+        Use a shared remote once more.
+
+        Args:
+            shared (detail of :class:`~pulpcore.plugin.models.Remote`): A remote returned by
+                :meth:`cast`.
+            until (:class:`asyncio.Future`): Release this use once the future is done, instead of
+                with :meth:`release`.
+        """
+        self._uses[id(shared)] = self._uses.get(id(shared), 0) + 1
+        if until is not None:
+            until.add_done_callback(lambda future: self.release(shared))
+
+    def release(self, shared):
+        """
+        Stop using a shared remote, and close its session if it was dropped in the meantime.
+
+        Args:
+            shared (detail of :class:`~pulpcore.plugin.models.Remote`): A remote returned by
+                :meth:`cast`.
+        """
+        uses = self._uses.pop(id(shared)) - 1
+        if uses:
+            self._uses[id(shared)] = uses
+        elif self._retired.pop(id(shared), None) is not None:
+            self._close(shared)
+
+
+shared_remotes = SharedRemotes()
@@ -0,0 +1,495 @@
+import asyncio
+from collections import defaultdict
+from contextlib import suppress
+from functools import partial
+from gettext import gettext as _
+import hashlib
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import django
+
+django.setup()
+
+from redis.exceptions import LockError, RedisError  # noqa: E402: module level not at top of file
+
+from pulpcore.tasking.connection import (  # noqa: E402: module level not at top of file
+    get_redis_connection,
+)
+
+log = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1048576  # 1 megabyte
+
+DOWNLOAD_CHANNEL = "pulp-content-downloads"
+
+
+class DownloadFlight:
+    """
+    One upstream download whose data is shared by every client response waiting for it.
+
+    The download writes its data to a spool file. Every client response reads the spool from the
+    start, at its own pace, and waits for more data whenever it has caught up with the download.
+    A client that arrives in the middle of the download still gets the whole file.
+
+    Attributes:
+        path (str): The path of the spool file. It is created in the current working directory,
+            like the files of the downloaders, and removed once the flight is over.
+        writer (file object): The unbuffered file object the download writes the spool with.
+        headers (list): The ``(name, value)`` pairs of the headers to send to the clients, or None
+            until they are known.
+        size (int): The number of bytes written to the spool so far.
+        complete (bool): Whether all the data has been written to the spool.
+        finished (bool): Whether the download is over, including any work done with the data after
+            it was complete, like saving it.
+        result: The result of the download, once it succeeded.
+        error (Exception): The exception the download failed with, or None.
+        readers (int): The number of client responses reading the spool.
+        task (asyncio.Task): The task running the download.
+    """
+
+    def __init__(self, cancel_when_abandoned=False):
+        """
+        Args:
+            cancel_when_abandoned (bool): Cancel the download when the last client response stops
+                reading it before it is over.
+        """
+        fd, self.path = tempfile.mkstemp(dir=os.getcwd())
+        self.writer = os.fdopen(fd, "wb", buffering=0)
+        self.headers = None
+        self.size = 0
+        self.complete = False
+        self.finished = False
+        self.result = None
+        self.error = None
+        self.readers = 0
+        self.cancel_when_abandoned = cancel_when_abandoned
+        self.task = None
+        self._headers_ready = asyncio.Event()
+        self._progress = asyncio.Event()
+
+    def set_headers(self, headers):
+        """
+        Record the headers to send to the clients.
+
+        Args:
+            headers (list): The ``(name, value)`` pairs of the headers.
+        """
+        self.headers = headers
+        self._headers_ready.set()
+
+    def wrote(self, size):
+        """
+        Record that data was written to the spool, and wake up the client responses.
+
+        Downloaders that do not report headers send the data without any.
+
+        Args:
+            size (int): The number of bytes written.
+        """
+        if self.headers is None:
+            self.set_headers([])
+        self.size += size
+        self._notify()
+
+    def set_complete(self):
+        """
+        Record that all the data has been written to the spool.
+
+        Client responses end as soon as they have read it, without waiting for the download to be
+        finished.
+        """
+        self.complete = True
+        if self.headers is None:
+            self.set_headers([])
+        self._notify()
+
+    def finish(self, result=None, error=None):
+        """
+        Record the end of the download.
+
+        Args:
+            result: The result of the download if it succeeded.
+            error (Exception): The exception the download failed with, if it did.
+        """
+        self.finished = True
+        self.result = result
+        self.error = error
+        if error is None:
+            self.complete = True
+        if self.headers is None and self.complete:
+            self.headers = []
+        self._headers_ready.set()
+        self._notify()
+
+    def _notify(self):
+        progress = self._progress
+        self._progress = asyncio.Event()
+        progress.set()
+
+    def open(self):
+        """
+        Open the spool for a new client response.
+
+        This must be called without yielding to the event loop after the flight was looked up, so
+        the spool can't be removed in between.
+
+        Returns:
+            file object: The reader to pass to :meth:`read`.
+        """
+        reader = open(self.path, "rb", buffering=0)
+        self.readers += 1
+        return reader
+
+    def link(self):
+        """
+        Make a new name for the spool, that can be moved away while clients still read the spool.
+
+        The spool is hard linked, or copied when the filesystem doesn't support hard links. The
+        flight stays registered until the data has been saved, so the spool itself must stay where
+        it is for the clients that join it in the meantime.
+
+        Returns:
+            str: The path of the new file, in the same directory as the spool.
+        """
+        fd, path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        os.close(fd)
+        os.remove(path)
+        try:
+            os.link(self.path, path)
+        except OSError:
+            shutil.copyfile(self.path, path)
+        return path
+
+    def close(self, reader, cancel=False):
+        """
+        Close the reader of a client response.
+
+        Args:
+            reader (file object): A reader returned by :meth:`open`.
+            cancel (bool): Cancel the download if nobody else reads it, even if it was not started
+                with ``cancel_when_abandoned``.
+        """
+        reader.close()
+        self.readers -= 1
+        if self.readers == 0 and (cancel or self.cancel_when_abandoned) and not self.complete:
+            self.task.cancel()
+
+    async def wait_for_headers(self):
+        """
+        Wait until the headers to send to the clients are known.
+
+        Returns:
+            list: The ``(name, value)`` pairs of the headers.
+
+        Raises:
+            Exception: The exception of the download, if it failed before sending any headers.
+        """
+        await self._headers_ready.wait()
+        if self.headers is None:
+            raise self.error
+        return self.headers
+
+    async def wait(self):
+        """
+        Wait until all the data has been written to the spool, or the download failed.
+        """
+        while not (self.complete or self.finished):
+            await self._progress.wait()
+
+    async def read(self, reader, start=0, stop=None):
+        """
+        Read the download, waiting for the data that is not downloaded yet.
+
+        Args:
+            reader (file object): A reader returned by :meth:`open`.
+            start (int): The offset of the first byte to read.
+            stop (int): The offset after the last byte to read. None to read the whole download.
+
+        Yields:
+            bytes: The data, in chunks of at most 1 megabyte.
+
+        Raises:
+            Exception: The exception of the download, if it failed before ``stop``.
+        """
+        position = start
+        reader.seek(start)
+        while stop is None or position < stop:
+            progress = self._progress
+            if position < self.size:
+                end = self.size if stop is None else min(self.size, stop)
+                data = reader.read(min(end - position, READ_CHUNK_SIZE))
+                position += len(data)
+                yield data
+            elif self.complete:
+                return
+            elif self.error is not None:
+                raise self.error
+            else:
+                await progress.wait()
+
+
+class DownloadFlights:
+    """
+    A per-process registry of in-progress downloads, so that each one is started only once.
+
+    Flights are keyed by what they download, usually the remote and the url of a RemoteArtifact. A
+    flight leaves the registry as soon as its download is over.
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+    def get(self, key):
+        """
+        Get the flight of an in-progress download.
+
+        Args:
+            key (tuple): What the flight downloads.
+
+        Returns:
+            :class:`DownloadFlight`: The flight, or None if there is no such download in progress.
+        """
+        return self._flights.get(key)
+
+    def start(self, key, download, cancel_when_abandoned=False):
+        """
+        Start a download in its own task and register its flight.
+
+        The download is not tied to any client response, so it completes even if the client that
+        started it disconnects, unless ``cancel_when_abandoned`` is set.
+
+        Args:
+            key (tuple): What the flight downloads.
+            download (callable): A coroutine function called with the :class:`DownloadFlight`. It
+                writes the data with ``flight.writer``, reports it with ``flight.wrote()``, and
+                returns the result of the download.
+            cancel_when_abandoned (bool): Cancel the download when no client reads it anymore.
+
+        Returns:
+            :class:`DownloadFlight`: The flight of the download.
+        """
+        flight = DownloadFlight(cancel_when_abandoned=cancel_when_abandoned)
+        self._flights[key] = flight
+        flight.task = asyncio.ensure_future(download(flight))
+        flight.task.add_done_callback(partial(self._land, key, flight))
+        return flight
+
+    def _land(self, key, flight, task):
+        if task.cancelled():
+            flight.finish(error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            flight.finish(error=task.exception())
+        else:
+            flight.finish(result=task.result())
+        del self._flights[key]
+        flight.writer.close()
+        with suppress(FileNotFoundError):
+            os.remove(flight.path)
+
+
+download_flights = DownloadFlights()
+
+
+class MirrorPreferences:
+    """
+    Remember which remotes won the races between the downloads of the same file.
+
+    The RemoteArtifacts of a file are tried in order of the last win of their remote, most recent
+    first, so a fast mirror keeps being preferred over one that was slow to respond.
+    """
+
+    def __init__(self):
+        self._wins = {}
+        self._races = itertools.count()
+
+    def won(self, remote_pk):
+        """
+        Record that a remote won a race.
+
+        Args:
+            remote_pk (uuid.UUID): The primary key of the remote.
+        """
+        self._wins[remote_pk] = next(self._races)
+
+    def sort(self, remote_artifacts):
+        """
+        Sort RemoteArtifacts in the order to try them.
+
+        Args:
+            remote_artifacts (list): The RemoteArtifacts of a file.
+
+        Returns:
+            list: The RemoteArtifacts whose remote won most recently first. The others keep their
+                order.
+        """
+        return sorted(
+            remote_artifacts,
+            key=lambda remote_artifact: self._wins.get(remote_artifact.remote_id, -1),
+            reverse=True,
+        )
+
+
+mirror_preferences = MirrorPreferences()
+
+
+class DownloadNotifications:
+    """
+    A Redis channel telling the content app processes that a shared download is over.
+
+    A process that releases a :class:`SharedDownloadLock` publishes the name of the lock. Each
+    process subscribes to the channel once, in a dedicated thread, and wakes up the requests
+    waiting for that lock, so they don't have to poll the lock to notice it was released.
+    """
+
+    def __init__(self):
+        self._waiters = defaultdict(set)
+        self._listening = False
+        self._lock = threading.Lock()
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listening:
+                return
+            self._listening = True
+        thread = threading.Thread(
+            target=self._listen,
+            args=(asyncio.get_event_loop(),),
+            name="pulp-content-notifications",
+            daemon=True,
+        )
+        thread.start()
+
+    def _listen(self, loop):
+        try:
+            pubsub = get_redis_connection().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(DOWNLOAD_CHANNEL)
+            for message in pubsub.listen():
+                name = message["data"]
+                if isinstance(name, bytes):
+                    name = name.decode()
+                loop.call_soon_threadsafe(self._wake, name)
+        except RedisError as e:
+            log.warning(_("Stopped listening for shared downloads: {e}").format(e=e))
+        finally:
+            with self._lock:
+                self._listening = False
+
+    def _wake(self, name):
+        for waiter in self._waiters.pop(name, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait(self, name, timeout):
+        """
+        Wait until a lock is announced as released.
+
+        Args:
+            name (str): The name of the lock.
+            timeout (float): The number of seconds to wait at most.
+        """
+        self._ensure_listener()
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters[name].add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            waiters = self._waiters.get(name)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[name]
+
+    @staticmethod
+    def publish(name):
+        """
+        Announce that a lock was released. This blocks, call it from a thread.
+
+        Args:
+            name (str): The name of the lock.
+        """
+        get_redis_connection().publish(DOWNLOAD_CHANNEL, name)
+
+
+download_notifications = DownloadNotifications()
+
+
+class SharedDownloadLock:
+    """
+    A Redis lock telling the other content app processes that a download is in progress.
+
+    A process that can't acquire the lock waits for the download of the other process to be
+    saved, instead of downloading the same file again. The waiting process is woken up through the
+    :class:`DownloadNotifications` channel when the lock is released, and checks the lock
+    periodically in case the notification is lost. The lock expires after ``timeout`` seconds,
+    so a lost process does not block the others for long. Redis errors are logged and the lock is
+    then considered acquired, as coordination is only an optimization.
+
+    Args:
+        key (tuple): What is downloaded.
+        timeout (int): The number of seconds the lock is held at most.
+    """
+
+    def __init__(self, key, timeout):
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        self.name = "pulp-content-download-{digest}".format(digest=digest)
+        self.timeout = timeout
+        self._lock = None
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    def _redis_lock(self):
+        if self._lock is None:
+            self._lock = get_redis_connection().lock(
+                self.name, timeout=self.timeout, thread_local=False
+            )
+        return self._lock
+
+    async def acquire(self):
+        """
+        Try to acquire the lock, without waiting for it.
+
+        Returns:
+            bool: Whether the lock was acquired.
+        """
+        try:
+            return await self._run(self._redis_lock().acquire, blocking=False)
+        except RedisError as e:
+            log.warning(
+                _("Could not acquire the download lock {name}: {e}").format(name=self.name, e=e)
+            )
+            return True
+
+    async def release(self):
+        """
+        Release the lock, if it is still held.
+        """
+        with suppress(LockError, RedisError):
+            await self._run(self._redis_lock().release)
+            await self._run(download_notifications.publish, self.name)
+
+    async def wait(self, interval=2):
+        """
+        Wait until nobody holds the lock.
+
+        Args:
+            interval (float): The number of seconds between two checks of the lock, when no
+                notification is received.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.timeout
+        try:
+            while await self._run(self._redis_lock().locked) and loop.time() < deadline:
+                await download_notifications.wait(self.name, interval)
+        except RedisError as e:
+            log.warning(
+                _("Could not check the download lock {name}: {e}").format(name=self.name, e=e)
+            )
@@ -1,5 +1,6 @@
 import asyncio
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
 import logging
 import os
@@ -11,6 +12,25 @@ from pulpcore.exceptions import DigestValidationError, SizeValidationError
 
 log = logging.getLogger(__name__)
 
+# Chunks of data smaller than this are handled on the event loop, since handing them to a thread
+# costs more than digesting them.
+THREADED_CHUNK_SIZE = 65536
+
+_data_executor = None
+
+
+def _get_data_executor():
+    """
+    Get the thread pool downloaders write and digest their data in, creating it on first use.
+
+    Returns:
+        :class:`concurrent.futures.ThreadPoolExecutor`: The thread pool.
+    """
+    global _data_executor
+    if _data_executor is None:
+        _data_executor = ThreadPoolExecutor(thread_name_prefix="pulp-download-data")
+    return _data_executor
+
 
 DownloadResult = namedtuple("DownloadResult", ["url", "artifact_attributes", "path", "headers"])
 """
@@ -54,6 +74,12 @@ class BaseDownloader:
     data written to the file-like object is quiesced to disk before the file-like object has
     `close()` called on it.
 
+    Writing and digesting the data is CPU and IO work, which would hold up every other download of
+    the event loop. Chunks of at least ``THREADED_CHUNK_SIZE`` bytes are written and digested in a
+    thread pool instead, where hashlib releases the GIL, so concurrent downloads use several
+    cores. Each chunk is handled before ``handle_data`` returns, so the data of a download is
+    still handled in order, and is in the file once ``handle_data`` returned.
+
     Attributes:
         url (str): The url to download.
         expected_digests (dict): Keyed on the algorithm name provided by hashlib and stores the
@@ -121,6 +147,19 @@ class BaseDownloader:
             data (bytes): The data to be handled by the downloader.
         """
         self._ensure_writer_has_open_file()
+        if len(data) < THREADED_CHUNK_SIZE:
+            self._write_and_record(data)
+        else:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(_get_data_executor(), self._write_and_record, data)
+
+    def _write_and_record(self, data):
+        """
+        Write a chunk of data to the file object and record its size and digests.
+
+        Args:
+            data (bytes): The data to be handled by the downloader.
+        """
         self._writer.write(data)
         self._record_size_and_digests_for_data(data)
 
@@ -140,11 +179,17 @@ class BaseDownloader:
                 :meth:`~pulpcore.plugin.download.BaseDownloader.handle_data`.
         """
         self._ensure_writer_has_open_file()
+        await asyncio.get_event_loop().run_in_executor(_get_data_executor(), self._close_writer)
+        self.validate_digests()
+        self.validate_size()
+
+    def _close_writer(self):
+        """
+        Flush the data written to the file object to disk, and close it.
+        """
         self._writer.flush()
         os.fsync(self._writer.fileno())
         self._writer.close()
-        self.validate_digests()
-        self.validate_size()
 
     def fetch(self):
         """
@@ -57,9 +57,18 @@ class DownloaderFactory:
 
     Also for http and https urls, even though HTTP 1.1 is used, the TCP connection is setup and
     closed with each request. This is done for compatibility reasons due to various issues related
-    to session continuation implementation in various servers.
+    to session continuation implementation in various servers. A process that keeps its factories,
+    like the content app, can set ``force_close`` to ``False`` to reuse the connections instead.
+
+    Attributes:
+        force_close (bool): Close the TCP connection after each request.
+        limit_concurrency (bool): Run at most ``download_concurrency`` downloads of the factory at
+            a time.
     """
 
+    force_close = True
+    limit_concurrency = True
+
     def __init__(self, remote, downloader_overrides=None):
         """
         Args:
@@ -83,16 +92,27 @@ class DownloaderFactory:
         self._semaphore = asyncio.Semaphore(value=remote.download_concurrency)
         atexit.register(self._session.close)
 
+    async def close(self):
+        """
+        Close the aiohttp session.
+
+        The downloads that are running over http or https fail, and downloaders built afterwards
+        can't download over http or https anymore.
+        """
+        atexit.unregister(self._session.close)
+        await self._session.close()
+
     def _make_aiohttp_session_from_remote(self):
         """
         Build a :class:`aiohttp.ClientSession` from the remote's settings and timing settings.
 
-        This method is what provides the force_close of the TCP connection with each request.
+        This method is what provides the force_close of the TCP connection with each request,
+        unless ``force_close`` is ``False``.
 
         Returns:
             :class:`aiohttp.ClientSession`
         """
-        tcp_conn_opts = {"force_close": True}
+        tcp_conn_opts = {"force_close": self.force_close}
 
         sslcontext = None
         if self._remote.ca_cert:
@@ -137,7 +157,8 @@ class DownloaderFactory:
             subclass of :class:`~pulpcore.plugin.download.BaseDownloader`: A downloader that
             is configured with the remote settings.
         """
-        kwargs["semaphore"] = self._semaphore
+        if self.limit_concurrency:
+            kwargs["semaphore"] = self._semaphore
         scheme = urlparse(url).scheme.lower()
         try:
             builder = self._handler_map[scheme]
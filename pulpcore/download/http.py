@@ -106,6 +106,8 @@ class HttpDownloader(BaseDownloader):
             as its argument. The callback will be called when the response headers are
             available. The dictionary passed has the header names as the keys and header values
             as its values. e.g. `{'Transfer-Encoding': 'chunked'}`. This can also be None.
+        request_headers (dict): Headers sent with the request, in addition to the headers of the
+            session. e.g. `{'Range': 'bytes=1024-'}`. This can also be None.
 
     This downloader also has all of the attributes of
     :class:`~pulpcore.plugin.download.BaseDownloader`
@@ -119,6 +121,7 @@ class HttpDownloader(BaseDownloader):
         proxy=None,
         proxy_auth=None,
         headers_ready_callback=None,
+        request_headers=None,
         **kwargs,
     ):
         """
@@ -134,6 +137,8 @@ class HttpDownloader(BaseDownloader):
                 as its argument. The callback will be called when the response headers are
                 available. The dictionary passed has the header names as the keys and header values
                 as its values. e.g. `{'Transfer-Encoding': 'chunked'}`
+            request_headers (dict): Optional headers sent with the request, in addition to the
+                headers of the session.
             kwargs (dict): This accepts the parameters of
                 :class:`~pulpcore.plugin.download.BaseDownloader`.
         """
@@ -149,6 +154,7 @@ class HttpDownloader(BaseDownloader):
         self.proxy = proxy
         self.proxy_auth = proxy_auth
         self.headers_ready_callback = headers_ready_callback
+        self.request_headers = request_headers
         super().__init__(url, **kwargs)
 
     async def _handle_response(self, response):
@@ -194,7 +200,9 @@ class HttpDownloader(BaseDownloader):
         Args:
             extra_data (dict): Extra data passed by the downloader.
         """
-        async with self.session.get(self.url, proxy=self.proxy, auth=self.auth) as response:
+        async with self.session.get(
+            self.url, proxy=self.proxy, auth=self.auth, headers=self.request_headers
+        ) as response:
             response.raise_for_status()
             to_return = await self._handle_response(response)
             await response.release()
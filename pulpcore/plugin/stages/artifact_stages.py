@@ -1,8 +1,9 @@
 import asyncio
+from collections import defaultdict
 from gettext import gettext as _
 import logging
 
-from django.db.models import Q, Prefetch, prefetch_related_objects
+from django.db.models import Prefetch, prefetch_related_objects
 
 from pulpcore.plugin.models import Artifact, ContentArtifact, ProgressReport, RemoteArtifact
 
@@ -31,7 +32,10 @@ class QueryExistingArtifacts(Stage):
     its :class:`~pulpcore.plugin.stages.DeclarativeArtifact` objects have been handled.
 
     This stage drains all available items from `self._in_q` and batches everything into one large
-    call to the db for efficiency.
+    call to the db for efficiency. The digests of the batch are passed as one array per digest
+    field, see :meth:`~pulpcore.app.models.content.DigestQuerySet.filter_digests`. The saved
+    Artifacts are matched to the batch through an index of its digests, so the cost of a batch
+    grows linearly with its size.
     """
 
     async def run(self):
@@ -42,24 +46,51 @@ class QueryExistingArtifacts(Stage):
             The coroutine for this stage.
         """
         async for batch in self.batches():
-            all_artifacts_q = Q(pk__in=[])
+            artifact_pks = []
+            digests = defaultdict(list)
             for d_content in batch:
                 for d_artifact in d_content.d_artifacts:
-                    one_artifact_q = d_artifact.artifact.q()
-                    if one_artifact_q:
-                        all_artifacts_q |= one_artifact_q
-
-            for artifact in Artifact.objects.filter(all_artifacts_q).iterator():
-                for d_content in batch:
-                    for d_artifact in d_content.d_artifacts:
-                        for digest_name in artifact.DIGEST_FIELDS:
-                            digest_value = getattr(d_artifact.artifact, digest_name)
-                            if digest_value and digest_value == getattr(artifact, digest_name):
-                                d_artifact.artifact = artifact
-                                break
+                    artifact = d_artifact.artifact
+                    if not artifact._state.adding:
+                        artifact_pks.append(artifact.pk)
+                        continue
+                    for digest_name in Artifact.DIGEST_FIELDS:
+                        digest_value = getattr(artifact, digest_name)
+                        if digest_value:
+                            digests[digest_name].append(digest_value)
+                            break
+
+            existing_artifacts = Artifact.objects.filter(pk__in=artifact_pks)
+            existing_artifacts |= Artifact.objects.filter_digests(digests)
+            self._use_existing_artifacts(batch, existing_artifacts.iterator())
             for d_content in batch:
                 await self.put(d_content)
 
+    @staticmethod
+    def _use_existing_artifacts(batch, artifacts):
+        """
+        Replace the Artifacts of the batch with the saved Artifacts sharing any of their digests.
+
+        Args:
+            batch (list): List of :class:`~pulpcore.plugin.stages.DeclarativeContent`.
+            artifacts (iterable): The saved :class:`~pulpcore.plugin.models.Artifact` objects.
+        """
+        d_artifacts_by_digest = defaultdict(list)
+        for d_content in batch:
+            for d_artifact in d_content.d_artifacts:
+                for digest_name in Artifact.DIGEST_FIELDS:
+                    digest_value = getattr(d_artifact.artifact, digest_name)
+                    if digest_value:
+                        d_artifacts_by_digest[digest_name, digest_value].append(d_artifact)
+
+        for artifact in artifacts:
+            for digest_name in artifact.DIGEST_FIELDS:
+                digest_value = getattr(artifact, digest_name)
+                if not digest_value:
+                    continue
+                for d_artifact in d_artifacts_by_digest.get((digest_name, digest_value), ()):
+                    d_artifact.artifact = artifact
+
 
 class ArtifactDownloader(Stage):
     """
@@ -259,22 +290,22 @@ class RemoteArtifactSaver(Stage):
         )
         needed_ras = []
         for d_content in batch:
+            d_artifacts_by_path = {}
+            for d_artifact in d_content.d_artifacts:
+                d_artifacts_by_path.setdefault(d_artifact.relative_path, d_artifact)
             for content_artifact in d_content.content._remote_artifact_saver_cas:
-                for d_artifact in d_content.d_artifacts:
-                    if d_artifact.relative_path == content_artifact.relative_path:
-                        break
-                else:
+                d_artifact = d_artifacts_by_path.get(content_artifact.relative_path)
+                if d_artifact is None:
                     msg = _('No declared artifact with relative path "{rp}" for content "{c}"')
                     raise ValueError(
                         msg.format(rp=content_artifact.relative_path, c=d_content.content)
                     )
-                for remote_artifact in content_artifact._remote_artifact_saver_ras:
-                    if remote_artifact.remote_id == d_artifact.remote.pk:
-                        break
-                else:
-                    if d_artifact.remote:
-                        remote_artifact = self._create_remote_artifact(d_artifact, content_artifact)
-                        needed_ras.append(remote_artifact)
+                if not d_artifact.remote:
+                    continue
+                remote_ids = {ra.remote_id for ra in content_artifact._remote_artifact_saver_ras}
+                if d_artifact.remote.pk not in remote_ids:
+                    remote_artifact = self._create_remote_artifact(d_artifact, content_artifact)
+                    needed_ras.append(remote_artifact)
         return needed_ras
 
     @staticmethod
@@ -1,9 +1,9 @@
 from collections import defaultdict
 
-from django.db import IntegrityError, transaction
+from django.db import IntegrityError, connection, transaction
 from django.db.models import Q
 
-from pulpcore.plugin.models import ContentArtifact
+from pulpcore.plugin.models import Content, ContentArtifact
 
 from .api import Stage
 
@@ -26,7 +26,8 @@ class QueryExistingContents(Stage):
     been handled.
 
     This stage drains all available items from `self._in_q` and batches everything into one large
-    call to the db for efficiency.
+    call to the db for efficiency. The saved Content units are matched to the batch through an
+    index of its unit keys, so the cost of a batch grows linearly with its size.
     """
 
     async def run(self):
@@ -44,24 +45,43 @@ class QueryExistingContents(Stage):
                     unit_q = d_content.content.q()
                     content_q_by_type[model_type] = content_q_by_type[model_type] | unit_q
 
-            for model_type in content_q_by_type.keys():
-                type_natural_key_fields = model_type.natural_key_fields()
-                for result in model_type.objects.filter(content_q_by_type[model_type]).iterator():
-                    for d_content in batch:
-                        if type(d_content.content) is not model_type:
-                            continue
-                        not_same_unit = False
-                        for field in type_natural_key_fields:
-                            in_memory_digest_value = getattr(d_content.content, field)
-                            if in_memory_digest_value != getattr(result, field):
-                                not_same_unit = True
-                                break
-                        if not_same_unit:
-                            continue
-                        d_content.content = result
+            existing_contents = (
+                result
+                for model_type in content_q_by_type.keys()
+                for result in model_type.objects.filter(content_q_by_type[model_type]).iterator()
+            )
+            self._use_existing_contents(batch, existing_contents)
             for d_content in batch:
                 await self.put(d_content)
 
+    @staticmethod
+    def _use_existing_contents(batch, contents):
+        """
+        Replace the Content units of the batch with the saved units of the same type and unit key.
+
+        Args:
+            batch (list): List of :class:`~pulpcore.plugin.stages.DeclarativeContent`.
+            contents (iterable): The saved Content units.
+        """
+        d_contents_by_key = defaultdict(list)
+        # Unit keys with unhashable values, e.g. lists, are compared one by one.
+        unhashable = []
+        for d_content in batch:
+            key = (type(d_content.content), d_content.content.natural_key())
+            try:
+                d_contents_by_key[key].append(d_content)
+            except TypeError:
+                unhashable.append((key, d_content))
+
+        for result in contents:
+            key = (type(result), result.natural_key())
+            try:
+                matches = d_contents_by_key.get(key, ())
+            except TypeError:
+                matches = [d_content for other, d_content in unhashable if other == key]
+            for d_content in matches:
+                d_content.content = result
+
 
 class ContentSaver(Stage):
     """
@@ -76,6 +96,12 @@ class ContentSaver(Stage):
     Each "unsaved" Content objects is saved and a :class:`~pulpcore.plugin.models.ContentArtifact`
     objects too.
 
+    On PostgreSQL, the new units of each Content type are inserted in bulk, one ``INSERT`` per table
+    of the type, and ``ON CONFLICT DO NOTHING`` for the table holding the unit key. Units that
+    conflict with a saved unit, e.g. one saved by a concurrent sync, are replaced by the saved unit.
+    Types overriding ``save()`` are still saved one unit at a time, so that their ``save()`` keeps
+    running.
+
     Each :class:`~pulpcore.plugin.stages.DeclarativeContent` is sent to after it has been handled.
 
     This stage drains all available items from `self._in_q` and batches everything into one large
@@ -93,35 +119,158 @@ class ContentSaver(Stage):
             content_artifact_bulk = []
             with transaction.atomic():
                 await self._pre_save(batch)
-                for d_content in batch:
-                    # Are we saving to the database for the first time?
-                    content_already_saved = not d_content.content._state.adding
-                    if not content_already_saved:
-                        try:
-                            with transaction.atomic():
-                                d_content.content.save()
-                        except IntegrityError:
-                            d_content.content = d_content.content.__class__.objects.get(
-                                d_content.content.q()
-                            )
-                            continue
-                        for d_artifact in d_content.d_artifacts:
-                            if not d_artifact.artifact._state.adding:
-                                artifact = d_artifact.artifact
-                            else:
-                                # set to None for on-demand synced artifacts
-                                artifact = None
-                            content_artifact = ContentArtifact(
-                                content=d_content.content,
-                                artifact=artifact,
-                                relative_path=d_artifact.relative_path,
-                            )
-                            content_artifact_bulk.append(content_artifact)
+                for d_content in self._save_contents(batch):
+                    for d_artifact in d_content.d_artifacts:
+                        if not d_artifact.artifact._state.adding:
+                            artifact = d_artifact.artifact
+                        else:
+                            # set to None for on-demand synced artifacts
+                            artifact = None
+                        content_artifact = ContentArtifact(
+                            content=d_content.content,
+                            artifact=artifact,
+                            relative_path=d_artifact.relative_path,
+                        )
+                        content_artifact_bulk.append(content_artifact)
                 ContentArtifact.objects.bulk_get_or_create(content_artifact_bulk)
                 await self._post_save(batch)
             for declarative_content in batch:
                 await self.put(declarative_content)
 
+    def _save_contents(self, batch):
+        """
+        Save the unsaved Content units of the batch.
+
+        Units that already exist are replaced by the saved unit instead.
+
+        Args:
+            batch (list of :class:`~pulpcore.plugin.stages.DeclarativeContent`): The batch.
+
+        Returns:
+            list: The :class:`~pulpcore.plugin.stages.DeclarativeContent` objects whose unit was
+                saved for the first time.
+        """
+        d_contents_by_type = defaultdict(list)
+        for d_content in batch:
+            if d_content.content._state.adding:
+                d_contents_by_type[type(d_content.content)].append(d_content)
+
+        saved = []
+        for model_type, d_contents in d_contents_by_type.items():
+            if connection.vendor == "postgresql" and model_type.save is Content.save:
+                try:
+                    with transaction.atomic():
+                        saved.extend(self._bulk_save_contents(model_type, d_contents))
+                    continue
+                except IntegrityError:
+                    pass
+            for d_content in d_contents:
+                try:
+                    with transaction.atomic():
+                        d_content.content.save()
+                except IntegrityError:
+                    d_content.content = model_type.objects.get(d_content.content.q())
+                else:
+                    saved.append(d_content)
+        return saved
+
+    @staticmethod
+    def _insert(model, objs, ignore_conflicts=False, batch_size=1000):
+        """
+        Insert the rows of the table of a model.
+
+        Args:
+            model (class): The model, whose own fields are inserted.
+            objs (list): The instances to insert.
+            ignore_conflicts (bool): Skip the rows that conflict instead of raising IntegrityError.
+            batch_size (int): The maximum number of rows per ``INSERT``.
+
+        Returns:
+            set: The primary keys of the inserted rows.
+        """
+        fields = model._meta.local_concrete_fields
+        quote_name = connection.ops.quote_name
+        inserted = set()
+        for i in range(0, len(objs), batch_size):
+            rows = []
+            params = []
+            for obj in objs[i : i + batch_size]:
+                rows.append("({})".format(", ".join(["%s"] * len(fields))))
+                params.extend(
+                    field.get_db_prep_save(field.pre_save(obj, True), connection)
+                    for field in fields
+                )
+            sql = "INSERT INTO {table} ({columns}) VALUES {rows} "
+            if ignore_conflicts:
+                sql += "ON CONFLICT DO NOTHING "
+            sql += "RETURNING {pk}"
+            sql = sql.format(
+                table=quote_name(model._meta.db_table),
+                columns=", ".join(quote_name(field.column) for field in fields),
+                rows=", ".join(rows),
+                pk=quote_name(model._meta.pk.column),
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                inserted.update(row[0] for row in cursor.fetchall())
+        return inserted
+
+    def _bulk_save_contents(self, model_type, d_contents):
+        """
+        Insert new Content units of one type in bulk.
+
+        The table of the type, which holds the unit key, is inserted first and skips the units
+        that already exist. Only the inserted units get rows in the tables of the parent models,
+        which are inserted without skipping anything, so a conflict there raises IntegrityError
+        and the units are saved one at a time instead. The foreign keys of the parent links are
+        only checked when the transaction commits.
+
+        Args:
+            model_type (class): The type of the Content units.
+            d_contents (list of :class:`~pulpcore.plugin.stages.DeclarativeContent`): The
+                unsaved units of the type.
+
+        Returns:
+            list: The :class:`~pulpcore.plugin.stages.DeclarativeContent` objects whose unit was
+                inserted. The others got the saved unit.
+        """
+        models = [model_type] + model_type._meta.get_parent_list()
+        for d_content in d_contents:
+            content = d_content.content
+            if not content.pulp_type:
+                content.pulp_type = content.get_pulp_type()
+            for model in reversed(models):
+                for parent, link in model._meta.parents.items():
+                    if link is not None:
+                        setattr(content, link.attname, content._get_pk_val(parent._meta))
+
+        inserted_pks = self._insert(
+            model_type, [d_content.content for d_content in d_contents], ignore_conflicts=True
+        )
+        inserted = []
+        existing = []
+        for d_content in d_contents:
+            if d_content.content.pk in inserted_pks:
+                # A primary key is only inserted once, even if several units of the batch have it.
+                inserted_pks.discard(d_content.content.pk)
+                inserted.append(d_content)
+            else:
+                existing.append(d_content)
+        for parent in models[1:]:
+            self._insert(parent, [d_content.content for d_content in inserted])
+        for d_content in inserted:
+            d_content.content._state.adding = False
+            d_content.content._state.db = connection.alias
+
+        if existing:
+            existing_q = Q(pk__in=[])
+            for d_content in existing:
+                existing_q |= d_content.content.q()
+            QueryExistingContents._use_existing_contents(
+                existing, model_type.objects.filter(existing_q).iterator()
+            )
+        return inserted
+
     async def _pre_save(self, batch):
         """
         A hook plugin-writers can override to save related objects prior to content unit saving.
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+from unittest.mock import Mock, mock_open
+
+from django.test import TestCase, override_settings
+
+from pulpcore.content.cache import (
+    DistributionCache,
+    MemoryFileCache,
+    NotFoundCache,
+    RedirectURLCache,
+)
+from pulpcore.plugin.models import BaseDistribution
+
+
+@override_settings(CONTENT_DISTRIBUTION_CACHE_TTL=60)
+class DistributionCacheTestCase(TestCase):
+    def setUp(self):
+        self.distribution = BaseDistribution.objects.create(name="d1", base_path="a/b")
+        self.cache = DistributionCache(BaseDistribution)
+
+    def test_match(self):
+        """A path below the base path matches the distribution."""
+        self.assertEqual(self.cache.match("a/b/c/d.rpm").pk, self.distribution.pk)
+        self.assertEqual(self.cache.match("a/b/").pk, self.distribution.pk)
+
+    def test_no_match(self):
+        """The base path itself, a parent or a sibling do not match."""
+        self.assertIsNone(self.cache.match("a/b"))
+        self.assertIsNone(self.cache.match("a/c/d.rpm"))
+        self.assertIsNone(self.cache.match("a/bc/d.rpm"))
+
+    def test_hit_does_not_query(self):
+        """Once resolved, matching the distribution again needs no query."""
+        distribution = self.cache.match("a/b/c")
+        with self.assertNumQueries(0):
+            self.assertIs(self.cache.match("a/b/d"), distribution)
+            self.assertIsNone(self.cache.latest_version(distribution))
+
+    def test_invalidate(self):
+        """Invalidating the cache picks up new distributions."""
+        self.cache.match("a/b/c")
+        BaseDistribution.objects.create(name="d2", base_path="e")
+        self.assertIsNone(self.cache.match("e/f"))
+        self.cache.invalidate()
+        self.assertEqual(self.cache.match("e/f").name, "d2")
+
+
+@override_settings(CONTENT_REDIRECT_URL_CACHE_SIZE=1)
+class RedirectURLCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = RedirectURLCache()
+        self.storage = Mock(querystring_expire=3600)
+        self.storage.url.side_effect = ["url1", "url2", "url3"]
+
+    def artifact(self, pk):
+        return Mock(pk=pk, file=Mock(storage=self.storage))
+
+    def test_reuse(self):
+        """A URL is signed once for the same artifact and parameters."""
+        artifact = self.artifact(1)
+        self.assertEqual(self.cache.url(artifact, {"a": "b"}), "url1")
+        self.assertEqual(self.cache.url(artifact, {"a": "b"}), "url1")
+        self.assertEqual(self.cache.url(artifact, {"a": "c"}), "url2")
+
+    def test_bounded(self):
+        """The least recently used URLs are dropped."""
+        self.cache.url(self.artifact(1), {})
+        self.cache.url(self.artifact(2), {})
+        self.assertEqual(self.cache.url(self.artifact(1), {}), "url3")
+
+    def test_expired(self):
+        """A URL is signed again once half of its validity has passed."""
+        self.storage.querystring_expire = -1
+        artifact = self.artifact(1)
+        self.cache.url(artifact, {})
+        self.assertEqual(self.cache.url(artifact, {}), "url2")
+
+
+@override_settings(CONTENT_NOT_FOUND_CACHE_TTL=60, CONTENT_NOT_FOUND_CACHE_SIZE=2)
+class NotFoundCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = NotFoundCache()
+        self.distribution = Mock(pk=1)
+
+    def test_add(self):
+        """Added paths are found for their distribution only."""
+        self.cache.add(self.distribution, "a.rpm", self.cache.generation)
+        self.assertIn((self.distribution, "a.rpm"), self.cache)
+        self.assertNotIn((self.distribution, "b.rpm"), self.cache)
+        self.assertNotIn((Mock(pk=2), "a.rpm"), self.cache)
+
+    def test_bounded(self):
+        """The oldest paths are dropped."""
+        for path in ("a.rpm", "b.rpm", "c.rpm"):
+            self.cache.add(self.distribution, path, self.cache.generation)
+        self.assertNotIn((self.distribution, "a.rpm"), self.cache)
+        self.assertIn((self.distribution, "c.rpm"), self.cache)
+
+    @override_settings(CONTENT_NOT_FOUND_CACHE_TTL=-1)
+    def test_expired(self):
+        """Paths are forgotten after the TTL."""
+        self.cache.add(self.distribution, "a.rpm", self.cache.generation)
+        self.assertNotIn((self.distribution, "a.rpm"), self.cache)
+
+    def test_invalidate(self):
+        """Invalidating drops the paths, and lookups started before are not cached."""
+        generation = self.cache.generation
+        self.cache.add(self.distribution, "a.rpm", generation)
+        self.cache.invalidate()
+        self.assertNotIn((self.distribution, "a.rpm"), self.cache)
+        self.cache.add(self.distribution, "b.rpm", generation)
+        self.assertNotIn((self.distribution, "b.rpm"), self.cache)
+
+
+@override_settings(CONTENT_MEMORY_CACHE_SIZE=10, CONTENT_MEMORY_CACHE_MAX_FILE_SIZE=5)
+class MemoryFileCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = MemoryFileCache()
+
+    def artifact(self, data):
+        storage = Mock(open=mock_open(read_data=data))
+        return Mock(
+            sha256=hashlib.sha256(data).hexdigest(), size=len(data), file=Mock(storage=storage)
+        )
+
+    def test_cacheable(self):
+        """Only the files of small artifacts are cached."""
+        self.assertTrue(self.cache.cacheable(self.artifact(b"abcde")))
+        self.assertFalse(self.cache.cacheable(self.artifact(b"abcdef")))
+        with override_settings(CONTENT_MEMORY_CACHE_SIZE=0):
+            self.assertFalse(self.cache.cacheable(self.artifact(b"abcde")))
+
+    def test_bounded(self):
+        """The least recently served files are dropped to respect the byte budget."""
+        first, second, third = (self.artifact(data) for data in (b"aaaa", b"bbbb", b"cccc"))
+        self.cache.put(first.sha256, b"aaaa")
+        self.cache.put(second.sha256, b"bbbb")
+        self.assertEqual(self.cache.get(first), b"aaaa")
+        self.cache.put(third.sha256, b"cccc")
+        self.assertIsNone(self.cache.get(second))
+        self.assertEqual(self.cache.get(first), b"aaaa")
+
+    def test_load(self):
+        """Files are read from the storage, and only cached if they match the artifact."""
+        artifact = self.artifact(b"abc")
+        asyncio.get_event_loop().run_until_complete(self.cache.load(artifact))
+        self.assertEqual(self.cache.get(artifact), b"abc")
+        corrupted = self.artifact(b"def")
+        corrupted.sha256 = hashlib.sha256(b"xyz").hexdigest()
+        asyncio.get_event_loop().run_until_complete(self.cache.load(corrupted))
+        self.assertIsNone(self.cache.get(corrupted))
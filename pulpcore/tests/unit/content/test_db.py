@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from unittest.mock import Mock, patch
+
+import asynctest
+from django.test import override_settings
+
+from pulpcore.content.db import DatabaseExecutor
+
+
+class DatabaseExecutorTestCase(asynctest.TestCase):
+    def setUp(self):
+        self.database = DatabaseExecutor(max_workers=2)
+
+    async def test_run_in_thread(self):
+        """The function runs outside of the event loop thread and its result is returned."""
+        thread = await self.database.run(threading.current_thread)
+        self.assertIsNot(thread, threading.current_thread())
+
+    async def test_exception(self):
+        """Exceptions raised by the function are raised to the caller."""
+        with self.assertRaises(KeyError):
+            await self.database.run({}.__getitem__, "missing")
+
+    async def test_timings(self):
+        """Every call is timed per function."""
+        await self.database.run(sorted, [2, 1])
+        await self.database.run(sorted, [3, 1])
+        self.assertEqual(self.database.timings["sorted"].count, 2)
+
+    async def test_task_time(self):
+        """The time the task waited for calls is accumulated until it is popped."""
+        await self.database.run(sorted, [2, 1])
+        self.assertGreater(self.database.pop_task_time(), 0)
+        self.assertEqual(self.database.pop_task_time(), 0)
+
+    async def test_exhausted(self):
+        """Calls that find every thread busy are counted, and the counters settle afterwards."""
+        event = threading.Event()
+        calls = [asyncio.ensure_future(self.database.run(event.wait, 1)) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.database.stats.busy, 2)
+        self.assertEqual(self.database.stats.waiting, 1)
+        self.assertEqual(self.database.stats.exhausted, 1)
+        event.set()
+        await asyncio.gather(*calls)
+        self.assertEqual(self.database.stats.busy, 0)
+        self.assertEqual(self.database.stats.waiting, 0)
+
+    @override_settings(CONTENT_APP_DB_CONN_MAX_AGE=None, CONTENT_APP_DB_HEALTH_CHECK_INTERVAL=0)
+    def test_unhealthy_connection(self):
+        """Idle connections that fail the health check are closed before the next call."""
+        connection = Mock(connection=object(), errors_occurred=False)
+        connection.is_usable.return_value = False
+        with patch("pulpcore.content.db.connection", connection):
+            self.database._reset_db_connection()
+        connection.close.assert_called_once_with()
+        self.assertEqual(self.database.stats.connections["unhealthy"], 1)
+
+    @override_settings(CONTENT_APP_DB_CONN_MAX_AGE=0, CONTENT_APP_DB_HEALTH_CHECK_INTERVAL=None)
+    def test_expired_connection(self):
+        """Connections older than the maximum age are closed before the next call."""
+        connection = Mock(connection=object(), errors_occurred=False)
+        with patch("pulpcore.content.db.connection", connection):
+            self.database._reset_db_connection()
+        connection.close.assert_called_once_with()
+        connection.is_usable.assert_not_called()
+        self.assertEqual(self.database.stats.connections["expired"], 1)
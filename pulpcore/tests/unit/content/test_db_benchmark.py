@@ -0,0 +1,57 @@
+import asyncio
+import os
+import time
+from unittest import skipUnless
+
+import asynctest
+
+from pulpcore.content.db import DatabaseExecutor
+
+QUERY_TIME = 0.02
+CHUNK_INTERVAL = 0.001
+
+
+async def run_inline(func, *args):
+    return func(*args)
+
+
+@skipUnless(os.environ.get("PULP_BENCHMARKS"), "set PULP_BENCHMARKS=1 to run the benchmarks")
+class DatabaseExecutorBenchmarkTestCase(asynctest.TestCase):
+    """
+    The p99 latency of the streams stays low while slow queries run concurrently.
+
+    Streams write a chunk every millisecond while other requests run queries of 20 ms. Run on the
+    event loop, each query stalls every stream for its whole duration. Run in the threads of a
+    :class:`~pulpcore.content.db.DatabaseExecutor`, the streams go on, the bound leaves room for
+    noise. The timings depend on the machine, so the benchmarks only run when the
+    ``PULP_BENCHMARKS`` environment variable is set.
+    """
+
+    async def stream(self, latencies, until):
+        loop = asyncio.get_event_loop()
+        while loop.time() < until:
+            start = loop.time()
+            await asyncio.sleep(CHUNK_INTERVAL)
+            latencies.append(loop.time() - start - CHUNK_INTERVAL)
+
+    async def query(self, run, until):
+        while asyncio.get_event_loop().time() < until:
+            await run(time.sleep, QUERY_TIME)
+            # The rest of the request, e.g. sending the response.
+            await asyncio.sleep(0)
+
+    async def p99_latency(self, run, streams=20, queries=5, duration=1):
+        latencies = []
+        until = asyncio.get_event_loop().time() + duration
+        await asyncio.gather(
+            *[self.stream(latencies, until) for _ in range(streams)],
+            *[self.query(run, until) for _ in range(queries)],
+        )
+        return sorted(latencies)[int(len(latencies) * 0.99)]
+
+    async def test_p99_latency(self):
+        database = DatabaseExecutor(max_workers=5)
+        inline = await self.p99_latency(run_inline)
+        threaded = await self.p99_latency(database.run)
+        self.assertGreater(inline, QUERY_TIME / 2)
+        self.assertLess(threaded, inline / 4)
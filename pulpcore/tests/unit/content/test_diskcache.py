@@ -0,0 +1,75 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from pulpcore.content.diskcache import StreamedContentCache
+from pulpcore.plugin.models import RemoteArtifact
+
+
+class StreamedContentCacheTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = StreamedContentCache()
+
+    def put(self, digest, data):
+        fd, path = tempfile.mkstemp(dir=self.directory.name)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.cache.put("sha256", digest, path)
+
+    def test_put_and_get(self):
+        """A cached file is found by the sha256 of its RemoteArtifact."""
+        with override_settings(
+            CONTENT_STREAMED_CACHE_DIR=self.directory.name, CONTENT_STREAMED_CACHE_SIZE=10
+        ):
+            self.put("abcd", b"data")
+            path = self.cache.get(RemoteArtifact(sha256="abcd"))
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"data")
+            self.assertIsNone(self.cache.get(RemoteArtifact(sha256="efgh")))
+            self.assertIsNone(self.cache.get(RemoteArtifact(md5="abcd")))
+
+    def test_evict_least_recently_served(self):
+        """Files that don't fit in the byte budget are evicted, least recently served first."""
+        with override_settings(
+            CONTENT_STREAMED_CACHE_DIR=self.directory.name, CONTENT_STREAMED_CACHE_SIZE=8
+        ):
+            self.put("aaaa", b"data")
+            self.put("bbbb", b"data")
+            os.utime(self.cache.path("sha256", "aaaa"), (0, 0))
+            os.utime(self.cache.path("sha256", "bbbb"), (1, 1))
+            self.cache.get(RemoteArtifact(sha256="aaaa"))
+            self.put("cccc", b"data")
+            self.assertIsNotNone(self.cache.get(RemoteArtifact(sha256="aaaa")))
+            self.assertIsNone(self.cache.get(RemoteArtifact(sha256="bbbb")))
+            self.assertIsNotNone(self.cache.get(RemoteArtifact(sha256="cccc")))
+
+    def test_put_leaves_file(self):
+        """The downloaded file stays in place once it is cached."""
+        with override_settings(
+            CONTENT_STREAMED_CACHE_DIR=self.directory.name, CONTENT_STREAMED_CACHE_SIZE=10
+        ):
+            fd, path = tempfile.mkstemp(dir=self.directory.name)
+            with os.fdopen(fd, "wb") as f:
+                f.write(b"data")
+            self.cache.put("sha256", "abcd", path)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"data")
+
+    def test_size_kept(self):
+        """The cache is only scanned again once its size exceeds the byte budget."""
+        with override_settings(
+            CONTENT_STREAMED_CACHE_DIR=self.directory.name, CONTENT_STREAMED_CACHE_SIZE=8
+        ):
+            with mock.patch.object(self.cache, "evict", wraps=self.cache.evict) as evict:
+                self.put("aaaa", b"data")
+                self.put("aaaa", b"data")
+                self.put("bbbb", b"data")
+                self.assertEqual(evict.call_count, 1)
+                self.assertEqual(self.cache._size, 8)
+                self.put("cccc", b"data")
+                self.assertEqual(evict.call_count, 2)
+                self.assertEqual(self.cache._size, 8)
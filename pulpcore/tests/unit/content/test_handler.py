@@ -1,10 +1,13 @@
-from unittest.mock import Mock
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, Mock, patch
 
+import asynctest
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from pulpcore.content import Handler
-from pulpcore.plugin.models import Artifact, Content, ContentArtifact
+from pulpcore.content.handler import PathNotResolved
+from pulpcore.plugin.models import Artifact, Content, ContentArtifact, Remote
 
 
 class HandlerSaveContentTestCase(TestCase):
@@ -45,3 +48,192 @@ class HandlerSaveContentTestCase(TestCase):
         c2 = Content.objects.get(pk=self.c2.pk)
         self.assertEqual(existing_artifact.pk, new_artifact.pk)
         self.assertEqual(c2._artifacts.get().pk, existing_artifact.pk)
+
+
+class HandlerNotFoundCacheTestCase(asynctest.TestCase):
+    def setUp(self):
+        self.handler = Handler()
+        self.distro = Mock(base_path="base")
+        self.handler._match_distribution = Mock(return_value=self.distro)
+        self.handler._permit = Mock()
+        database = patch("pulpcore.content.handler.database")
+        database.start().run = asynctest.CoroutineMock(side_effect=lambda func, *args: func(*args))
+        self.addCleanup(database.stop)
+        not_found_cache = patch("pulpcore.content.handler.not_found_cache", MagicMock())
+        self.not_found_cache = not_found_cache.start()
+        self.not_found_cache.__contains__.return_value = True
+        self.addCleanup(not_found_cache.stop)
+
+    async def test_content_handler_first(self):
+        """The content handler of a distribution serves paths that were not found before."""
+        self.distro.content_handler.return_value = "response"
+        response = await self.handler._match_and_stream("/base/path", {})
+        self.assertEqual(response, "response")
+        self.distro.content_handler.assert_called_once_with("path")
+
+    async def test_not_found(self):
+        """Paths that were not found before, and aren't handled by the distribution, are not."""
+        self.distro.content_handler.return_value = None
+        with self.assertRaises(PathNotResolved):
+            await self.handler._match_and_stream("/base/path", {})
+        self.not_found_cache.__contains__.assert_called_once_with((self.distro, "path"))
+
+
+class HandlerStreamedCacheTestCase(asynctest.TestCase):
+    async def test_evicted(self):
+        """A cached file that was evicted since it was looked up is downloaded again."""
+        remote = Mock(pk=1, policy=Remote.STREAMED)
+        request = MagicMock(http_range=slice(None, None))
+        with patch("pulpcore.content.handler.streamed_cache") as streamed_cache, patch(
+            "pulpcore.content.handler.download_flights"
+        ) as download_flights:
+            streamed_cache.get.return_value = "/nonexistent/streamed/file"
+            download_flights.get.return_value = None
+            download_flights.start.side_effect = LookupError()
+            with self.assertRaises(LookupError):
+                await Handler()._stream_shared_remote_artifact(
+                    request, Mock(headers={}), remote, Mock(url="http://example.com/a"), ()
+                )
+        download_flights.start.assert_called_once()
+
+
+class HandlerDeprecationTestCase(TestCase):
+    def test_reset_db_connection(self):
+        """Plugins that still reset the database connection get a warning."""
+        with self.assertWarns(DeprecationWarning):
+            Handler._reset_db_connection()
+
+
+class HandlerConditionalRequestTestCase(TestCase):
+    def setUp(self):
+        self.last_modified = datetime(2020, 7, 24, 12, 0, 0, 500, tzinfo=timezone.utc)
+
+    def request(self, **headers):
+        return Mock(headers=headers, if_modified_since=headers.get("If-Modified-Since"))
+
+    def test_if_none_match(self):
+        """The ETag is matched, weak or not, in a list of ETags or by a wildcard."""
+        for header in ('"abc"', 'W/"abc"', '"def", "abc"', "*"):
+            request = self.request(**{"If-None-Match": header})
+            self.assertTrue(Handler._not_modified(request, '"abc"', self.last_modified))
+        request = self.request(**{"If-None-Match": '"def"'})
+        self.assertFalse(Handler._not_modified(request, '"abc"', self.last_modified))
+
+    def test_if_modified_since(self):
+        """The file is not modified since a date at or after its last modification."""
+        request = self.request(**{"If-Modified-Since": self.last_modified.replace(microsecond=0)})
+        self.assertTrue(Handler._not_modified(request, '"abc"', self.last_modified))
+        request = self.request(**{"If-Modified-Since": datetime(2020, 7, 1, tzinfo=timezone.utc)})
+        self.assertFalse(Handler._not_modified(request, '"abc"', self.last_modified))
+        self.assertFalse(Handler._not_modified(self.request(), '"abc"', self.last_modified))
+
+    @override_settings(CONTENT_ARTIFACT_MAX_AGE=60, CONTENT_METADATA_MAX_AGE=None)
+    def test_max_age(self):
+        """Distributions override the max ages of the settings."""
+        distribution = Mock(artifact_max_age=None, metadata_max_age=10)
+        self.assertEqual(Handler._max_age(distribution), 60)
+        self.assertEqual(Handler._max_age(distribution, metadata=True), 10)
+        distribution = Mock(artifact_max_age=0, metadata_max_age=None)
+        self.assertEqual(Handler._max_age(distribution), 0)
+        self.assertIsNone(Handler._max_age(distribution, metadata=True))
+
+
+class HandlerAcceptEncodingTestCase(TestCase):
+    def encodings(self, header):
+        return Handler._accepted_encodings(Mock(headers={"Accept-Encoding": header}))
+
+    def test_accepted_encodings(self):
+        """Encodings are ordered by quality, then by preference, and refused with a 0 quality."""
+        self.assertEqual(self.encodings("gzip, deflate"), ["gzip"])
+        self.assertEqual(self.encodings("gzip, zstd"), ["zstd", "gzip"])
+        self.assertEqual(self.encodings("gzip;q=1, zstd;q=0.5"), ["gzip", "zstd"])
+        self.assertEqual(self.encodings("*, gzip;q=0"), ["zstd"])
+        self.assertEqual(self.encodings("identity"), [])
+        self.assertEqual(Handler._accepted_encodings(Mock(headers={})), [])
+
+
+class HandlerMetadataVariantTestCase(asynctest.TestCase):
+    def setUp(self):
+        self.metadata = Mock(relative_path="repodata/primary.xml")
+        self.gzip = Mock(relative_path="repodata/primary.xml.gz")
+
+    async def variant(self, variants, **headers):
+        with override_settings(DEFAULT_FILE_STORAGE="pulpcore.app.models.storage.FileSystem"):
+            with patch("pulpcore.content.handler.database") as database:
+                database.run = asynctest.CoroutineMock(return_value=variants)
+                return await Handler()._metadata_variant(Mock(headers=headers), self.metadata, {})
+
+    async def test_accepted(self):
+        """The variant of an accepted encoding is served."""
+        ca, headers = await self.variant([self.gzip], **{"Accept-Encoding": "gzip"})
+        self.assertIs(ca, self.gzip)
+        self.assertEqual(headers, {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+
+    async def test_not_accepted(self):
+        """Metadata that has variants varies by Accept-Encoding, also when none is accepted."""
+        ca, headers = await self.variant([self.gzip])
+        self.assertIs(ca, self.metadata)
+        self.assertEqual(headers, {"Vary": "Accept-Encoding"})
+
+    async def test_no_variant(self):
+        """Metadata without variants doesn't vary."""
+        ca, headers = await self.variant([], **{"Accept-Encoding": "gzip"})
+        self.assertIs(ca, self.metadata)
+        self.assertEqual(headers, {})
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="pulpcore.app.models.storage.FileSystem", CONTENT_SENDFILE_HEADER=None
+)
+class HandlerMemoryCacheTestCase(TestCase):
+    def setUp(self):
+        artifact = Mock(pulp_created=datetime(2020, 7, 24, tzinfo=timezone.utc), sha256="abc")
+        artifact.file.name = "artifact/ab/c"
+        self.content_artifact = Mock(artifact=artifact)
+        for name in ("access_counts", "memory_file_cache"):
+            patcher = patch("pulpcore.content.handler." + name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.memory_file_cache.cacheable.return_value = True
+        self.memory_file_cache.get.return_value = b"data"
+
+    def serve(self, **headers):
+        request = MagicMock(method="GET", headers=headers, if_modified_since=None)
+        return Handler()._serve_content_artifact(self.content_artifact, {}, request)
+
+    def test_cached(self):
+        """Cached files are served from memory."""
+        self.assertEqual(self.serve().body, b"data")
+
+    def test_range(self):
+        """Range requests are answered from the file."""
+        response = self.serve(Range="bytes=0-1")
+        self.assertIsNone(getattr(response, "body", None))
+        self.memory_file_cache.get.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT="/var/lib/pulp", CONTENT_ACCEL_REDIRECT_PREFIX="/pulp/media/")
+class HandlerFileResponseTestCase(TestCase):
+    @override_settings(CONTENT_SENDFILE_HEADER="X-Accel-Redirect")
+    def test_accel_redirect(self):
+        """Files in MEDIA_ROOT are sent by nginx, unless they are precompressed."""
+        response = Handler._file_response("/var/lib/pulp/artifact/ab/c d", {"ETag": '"x"'})
+        self.assertEqual(response.headers["X-Accel-Redirect"], "/pulp/media/artifact/ab/c%20d")
+        self.assertEqual(response.headers["ETag"], '"x"')
+        response = Handler._file_response("/tmp/streamed/ab/cd", {})
+        self.assertNotIn("X-Accel-Redirect", response.headers)
+        response = Handler._file_response("/var/lib/pulp/a.xml", {"Content-Encoding": "gzip"})
+        self.assertNotIn("X-Accel-Redirect", response.headers)
+
+    @override_settings(CONTENT_SENDFILE_HEADER="X-Sendfile")
+    def test_sendfile(self):
+        """Files are sent by the web server with their absolute path."""
+        response = Handler._file_response("/tmp/streamed/ab/cd", {})
+        self.assertEqual(response.headers["X-Sendfile"], "/tmp/streamed/ab/cd")
+
+    @override_settings(CONTENT_SENDFILE_HEADER=None)
+    def test_disabled(self):
+        """Files are sent by the content app by default."""
+        response = Handler._file_response("/var/lib/pulp/artifact/ab/cd", {})
+        self.assertNotIn("X-Accel-Redirect", response.headers)
+        self.assertNotIn("X-Sendfile", response.headers)
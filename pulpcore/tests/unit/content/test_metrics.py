@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from pulpcore.content.metrics import CallbackMetric, Counter, Histogram
+
+
+class MetricsTestCase(TestCase):
+    def test_counter(self):
+        """Counters are rendered per label values."""
+        counter = Counter("requests_total", "Requests.", ("type",))
+        counter.inc(type="streamed")
+        counter.inc(2, type="streamed")
+        counter.inc(type='say "hi"')
+        self.assertEqual(
+            counter.render(),
+            [
+                "# HELP requests_total Requests.",
+                "# TYPE requests_total counter",
+                'requests_total{type="streamed"} 3',
+                'requests_total{type="say \\"hi\\""} 1',
+            ],
+        )
+
+    def test_histogram(self):
+        """Histograms count observations in cumulative buckets."""
+        histogram = Histogram("duration_seconds", "Durations.", buckets=(0.1, 1))
+        histogram.observe(0.1)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(
+            histogram.render()[2:],
+            [
+                'duration_seconds_bucket{le="0.1"} 1',
+                'duration_seconds_bucket{le="1.0"} 2',
+                'duration_seconds_bucket{le="+Inf"} 3',
+                "duration_seconds_count 3",
+                "duration_seconds_sum 5.6",
+            ],
+        )
+
+    def test_callback(self):
+        """Callback metrics are read when they are rendered."""
+        values = {"queued": 1}
+        metric = CallbackMetric(
+            "saves_total",
+            "Saves.",
+            ("result",),
+            metric_type="counter",
+            callback=lambda: [({"result": name}, value) for name, value in values.items()],
+        )
+        values["queued"] = 2
+        self.assertEqual(metric.render()[2:], ['saves_total{result="queued"} 2'])
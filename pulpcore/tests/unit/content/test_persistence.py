@@ -0,0 +1,65 @@
+import asyncio
+from unittest.mock import patch
+
+import asynctest
+from django.db import IntegrityError
+
+from pulpcore.content.persistence import PersistenceQueue
+
+
+class PersistenceQueueTestCase(asynctest.TestCase):
+    def setUp(self):
+        self.queue = PersistenceQueue(retries=1)
+
+    async def test_save(self):
+        """Concurrent saves are run in a single batch and their results are returned."""
+        results = await asyncio.gather(self.queue.save(abs, -1), self.queue.save(abs, -2))
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(self.queue.stats.saved, 2)
+        self.assertEqual(self.queue.stats.batches, 1)
+
+    async def test_retry_on_conflict(self):
+        """A save that conflicts is retried."""
+        attempts = []
+
+        def save():
+            attempts.append(None)
+            if len(attempts) == 1:
+                raise IntegrityError()
+            return "saved"
+
+        self.assertEqual(await self.queue.save(save), "saved")
+        self.assertEqual(self.queue.stats.retried, 1)
+
+    async def test_failure(self):
+        """The error of a save that keeps failing is raised."""
+        with self.assertRaises(KeyError):
+            await self.queue.save({}.__getitem__, "missing")
+        self.assertEqual(self.queue.stats.failed, 1)
+
+    async def test_batch_failure(self):
+        """The saves of a batch that could not be run fail, and the worker keeps running."""
+        with patch.object(self.queue, "_save_batch", side_effect=RuntimeError()):
+            with self.assertRaises(RuntimeError):
+                await self.queue.save(abs, -1)
+        worker = self.queue._worker
+        self.assertEqual(await self.queue.save(abs, -2), 2)
+        self.assertIs(self.queue._worker, worker)
+        self.assertEqual(self.queue.stats.failed, 1)
+
+    async def test_backoff_does_not_block(self):
+        """Other saves go on while a conflicting save waits to be retried."""
+        order = []
+
+        def conflicting():
+            order.append("conflicting")
+            raise IntegrityError()
+
+        conflicting_save = asyncio.ensure_future(self.queue.save(conflicting))
+        await asyncio.sleep(0.01)
+        self.assertIsNone(await self.queue.save(order.append, "other"))
+        with self.assertRaises(IntegrityError):
+            await conflicting_save
+        self.assertEqual(order, ["conflicting", "other", "conflicting"])
+        self.assertEqual(self.queue.stats.retried, 1)
+        self.assertEqual(self.queue.stats.failed, 1)
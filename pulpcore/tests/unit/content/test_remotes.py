@@ -0,0 +1,74 @@
+import asyncio
+from unittest.mock import Mock
+
+import asynctest
+
+from pulpcore.content.remotes import SharedRemotes
+
+
+class SharedRemotesTestCase(asynctest.TestCase):
+    def setUp(self):
+        self.remotes = SharedRemotes(max_size=2)
+
+    def remote(self, pk, last_updated):
+        remote = Mock(pk=pk, pulp_last_updated=last_updated)
+        remote.cast.return_value = Mock(pk=pk, pulp_last_updated=last_updated)
+        remote.cast.return_value._download_factory.close = asynctest.CoroutineMock()
+        return remote
+
+    async def cast(self, remote):
+        shared = await self.remotes.cast(remote)
+        self.remotes.release(shared)
+        return shared
+
+    async def test_shared(self):
+        """A remote is cast once, and every request gets the same instance."""
+        first = await self.cast(self.remote(1, 1))
+        second = self.remote(1, 1)
+        self.assertIs(await self.cast(second), first)
+        second.cast.assert_not_called()
+        self.assertIsNot(await self.cast(self.remote(2, 1)), first)
+
+    async def test_updated(self):
+        """A remote that was changed is cast again, and the session of the old one is closed."""
+        first = await self.cast(self.remote(1, 1))
+        updated = await self.cast(self.remote(1, 2))
+        self.assertIsNot(updated, first)
+        self.assertIs(await self.cast(self.remote(1, 2)), updated)
+        await asyncio.sleep(0)
+        first._download_factory.close.assert_awaited_once_with()
+        updated._download_factory.close.assert_not_awaited()
+
+    async def test_max_size(self):
+        """The least recently used remote is dropped, and its session is closed."""
+        first = await self.cast(self.remote(1, 1))
+        second = await self.cast(self.remote(2, 1))
+        await self.cast(self.remote(1, 1))
+        await self.cast(self.remote(3, 1))
+        await asyncio.sleep(0)
+        second._download_factory.close.assert_awaited_once_with()
+        first._download_factory.close.assert_not_awaited()
+        self.assertIs(await self.cast(self.remote(1, 1)), first)
+
+    async def test_close_when_released(self):
+        """The session of a replaced remote is only closed once its last use is released."""
+        first = await self.remotes.cast(self.remote(1, 1))
+        await self.cast(self.remote(1, 2))
+        await asyncio.sleep(0)
+        first._download_factory.close.assert_not_awaited()
+        self.remotes.release(first)
+        await asyncio.sleep(0)
+        first._download_factory.close.assert_awaited_once_with()
+
+    async def test_retain_until(self):
+        """A download retains its remote until it is done."""
+        first = await self.cast(self.remote(1, 1))
+        download = asyncio.get_event_loop().create_future()
+        self.remotes.retain(first, until=download)
+        await self.cast(self.remote(1, 2))
+        await asyncio.sleep(0)
+        first._download_factory.close.assert_not_awaited()
+        download.set_result(None)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        first._download_factory.close.assert_awaited_once_with()
@@ -0,0 +1,152 @@
+import asyncio
+import os
+from unittest.mock import Mock
+
+import asynctest
+
+from pulpcore.content.singleflight import (
+    DownloadFlights,
+    DownloadNotifications,
+    MirrorPreferences,
+)
+
+
+class DownloadFlightsTestCase(asynctest.TestCase):
+    def setUp(self):
+        self.flights = DownloadFlights()
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def download(self, flight):
+        self.calls += 1
+        flight.set_headers([("Content-Type", "text/plain")])
+        for data in (b"abc", b"def"):
+            await asyncio.sleep(0)
+            flight.writer.write(data)
+            flight.wrote(len(data))
+        return "result"
+
+    async def held_download(self, flight):
+        result = await self.download(flight)
+        flight.set_complete()
+        await self.release.wait()
+        return result
+
+    async def failing_download(self, flight):
+        await asyncio.sleep(0)
+        raise ValueError()
+
+    async def stream(self, flight):
+        reader = flight.open()
+        try:
+            headers = await flight.wait_for_headers()
+            return headers, b"".join([data async for data in flight.read(reader)])
+        finally:
+            flight.close(reader)
+
+    async def test_shared_download(self):
+        """Every client of a flight gets all the data of a single download."""
+        flight = self.flights.start("key", self.download)
+        self.assertIs(self.flights.get("key"), flight)
+        first = asyncio.ensure_future(self.stream(flight))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(self.stream(self.flights.get("key")))
+        expected = ([("Content-Type", "text/plain")], b"abcdef")
+        self.assertEqual(await first, expected)
+        self.assertEqual(await second, expected)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(flight.result, "result")
+
+    async def test_cleanup(self):
+        """The flight leaves the registry and its spool is removed once it is over."""
+        flight = self.flights.start("key", self.download)
+        await self.stream(flight)
+        await flight.wait()
+        self.assertIsNone(self.flights.get("key"))
+        self.assertFalse(os.path.exists(flight.path))
+
+    async def test_link(self):
+        """A link to the spool can be moved away while clients still read the spool."""
+        flight = self.flights.start("key", self.held_download)
+        await flight.wait()
+        path = flight.link()
+        try:
+            os.rename(path, path + ".moved")
+            self.assertEqual(
+                await self.stream(flight), ([("Content-Type", "text/plain")], b"abcdef")
+            )
+        finally:
+            os.remove(path + ".moved")
+            self.release.set()
+
+    async def test_open_missing_spool(self):
+        """A reader is only counted once the spool is open."""
+        flight = self.flights.start("key", self.held_download)
+        await flight.wait()
+        os.remove(flight.path)
+        with self.assertRaises(FileNotFoundError):
+            flight.open()
+        self.assertEqual(flight.readers, 0)
+        self.release.set()
+
+    async def test_error(self):
+        """The error of the download is raised to every client."""
+        flight = self.flights.start("key", self.failing_download)
+        with self.assertRaises(ValueError):
+            await self.stream(flight)
+
+    async def test_cancel_when_abandoned(self):
+        """A download nobody reads anymore is cancelled when requested."""
+        flight = self.flights.start("key", self.download, cancel_when_abandoned=True)
+        flight.close(flight.open())
+        await flight.wait()
+        self.assertIsInstance(flight.error, asyncio.CancelledError)
+
+    async def test_cancel(self):
+        """A download nobody reads anymore can be cancelled by its last reader."""
+        flight = self.flights.start("key", self.download)
+        flight.close(flight.open(), cancel=True)
+        await flight.wait()
+        self.assertIsInstance(flight.error, asyncio.CancelledError)
+
+    async def test_read_range(self):
+        """A range of the download is read as soon as it is downloaded."""
+        flight = self.flights.start("key", self.download)
+        reader = flight.open()
+        try:
+            data = b"".join([data async for data in flight.read(reader, 2, 4)])
+        finally:
+            flight.close(reader)
+        self.assertEqual(data, b"cd")
+        self.assertFalse(flight.finished)
+
+
+class DownloadNotificationsTestCase(asynctest.TestCase):
+    def setUp(self):
+        self.notifications = DownloadNotifications()
+        self.notifications._ensure_listener = lambda: None
+
+    async def test_wake(self):
+        """Waiters are woken up as soon as their lock is announced as released."""
+        waiter = asyncio.ensure_future(self.notifications.wait("lock", 10))
+        await asyncio.sleep(0)
+        self.notifications._wake("other")
+        self.assertFalse(waiter.done())
+        self.notifications._wake("lock")
+        await asyncio.wait_for(waiter, 1)
+        self.assertEqual(self.notifications._waiters, {})
+
+    async def test_timeout(self):
+        """Waiting ends after the timeout without a notification."""
+        await self.notifications.wait("lock", 0.01)
+        self.assertEqual(self.notifications._waiters, {})
+
+
+class MirrorPreferencesTestCase(asynctest.TestCase):
+    def test_sort(self):
+        """The remote that won most recently is tried first, the others keep their order."""
+        preferences = MirrorPreferences()
+        remote_artifacts = [Mock(remote_id=pk) for pk in (1, 2, 3)]
+        preferences.won(3)
+        preferences.won(2)
+        self.assertEqual([ra.remote_id for ra in preferences.sort(remote_artifacts)], [2, 3, 1])
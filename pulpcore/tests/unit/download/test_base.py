@@ -0,0 +1,39 @@
+import hashlib
+import io
+import os
+import tempfile
+
+import asynctest
+
+from pulpcore.download.base import THREADED_CHUNK_SIZE, BaseDownloader
+
+
+class BaseDownloaderTestCase(asynctest.TestCase):
+    async def test_handle_data(self):
+        """Small and large chunks are written and digested in order."""
+        writer = io.BytesIO()
+        downloader = BaseDownloader("http://example.com/file", custom_file_object=writer)
+        chunks = [b"a" * 10, b"b" * THREADED_CHUNK_SIZE, b"c" * 10, b"d" * THREADED_CHUNK_SIZE]
+        for chunk in chunks:
+            await downloader.handle_data(chunk)
+        data = b"".join(chunks)
+        self.assertEqual(writer.getvalue(), data)
+        self.assertEqual(downloader.artifact_attributes["size"], len(data))
+        self.assertEqual(downloader.artifact_attributes["sha256"], hashlib.sha256(data).hexdigest())
+
+    async def test_finalize(self):
+        """The file is complete and closed once the download is finalized."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "file")
+            data = b"a" * THREADED_CHUNK_SIZE
+            downloader = BaseDownloader(
+                "http://example.com/file",
+                custom_file_object=open(path, "wb"),
+                expected_digests={"sha256": hashlib.sha256(data).hexdigest()},
+                expected_size=len(data),
+            )
+            await downloader.handle_data(data)
+            await downloader.finalize()
+            self.assertTrue(downloader._writer.closed)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), data)
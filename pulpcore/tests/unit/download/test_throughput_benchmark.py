@@ -0,0 +1,83 @@
+import asyncio
+import os
+import socket
+import time
+from unittest import mock, skipUnless
+
+import aiohttp
+from aiohttp import web
+import asynctest
+
+from pulpcore.download import HttpDownloader
+
+CHUNK = b"\0" * 1048576
+# The size of the file served, in megabytes, e.g. 4096 for a multi-GB file.
+SIZE = int(os.environ.get("PULP_BENCHMARK_DOWNLOAD_SIZE", 64))
+DOWNLOADS = 20
+
+
+async def serve_file(request):
+    response = web.StreamResponse()
+    response.content_length = SIZE * len(CHUNK)
+    await response.prepare(request)
+    for _ in range(SIZE):
+        await response.write(CHUNK)
+    await response.write_eof()
+    return response
+
+
+class DiscardingDownloader(HttpDownloader):
+    """
+    A downloader writing to /dev/null, so that the disk doesn't bound the throughput.
+    """
+
+    def _close_writer(self):
+        self._writer.close()
+
+
+@skipUnless(os.environ.get("PULP_BENCHMARKS"), "set PULP_BENCHMARKS=1 to run the benchmarks")
+@skipUnless((os.cpu_count() or 1) > 1, "the data is only handled faster with several cores")
+class DownloadThroughputBenchmarkTestCase(asynctest.TestCase):
+    """
+    Concurrent downloads are faster with their data handled in threads than on the event loop.
+
+    20 downloads of a file served by a local HTTP server run at the same time, once with the chunks
+    of at least ``THREADED_CHUNK_SIZE`` bytes written and digested in the thread pool, and once
+    with every chunk handled on the event loop. The timings depend on the machine, so the
+    benchmarks only run when the ``PULP_BENCHMARKS`` environment variable is set.
+    """
+
+    async def setUp(self):
+        app = web.Application()
+        app.router.add_get("/file", serve_file)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.url = "http://127.0.0.1:{}/file".format(sock.getsockname()[1])
+        await web.SockSite(self.runner, sock).start()
+        self.session = aiohttp.ClientSession()
+
+    async def tearDown(self):
+        await self.session.close()
+        await self.runner.cleanup()
+
+    async def download(self):
+        downloader = DiscardingDownloader(
+            self.url, session=self.session, custom_file_object=open(os.devnull, "wb")
+        )
+        await downloader.run()
+
+    async def throughput(self):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            await asyncio.gather(*[self.download() for _ in range(DOWNLOADS)])
+            timings.append(time.perf_counter() - start)
+        return DOWNLOADS * SIZE / min(timings)
+
+    async def test_threaded(self):
+        threaded = await self.throughput()
+        with mock.patch("pulpcore.download.base.THREADED_CHUNK_SIZE", float("inf")):
+            inline = await self.throughput()
+        self.assertGreater(threaded, inline)
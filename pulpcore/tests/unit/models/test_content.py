@@ -1,9 +1,12 @@
+from datetime import timedelta
 import os
 import tempfile
 
 from django.core.files.storage import default_storage as storage
 from django.test import TestCase
-from pulpcore.plugin.models import Artifact, Content, ContentArtifact
+from django.utils import timezone
+from pulpcore.app.models import ContentArtifactAccess
+from pulpcore.plugin.models import Artifact, Content, ContentArtifact, Remote, RemoteArtifact
 
 
 class ContentCRUDTestCase(TestCase):
@@ -41,3 +44,88 @@ class ContentCRUDTestCase(TestCase):
         # Assumes creation is tested by test_create_and_read_content function
         Content.objects.filter(pk=content.pk).delete()
         self.assertFalse(Content.objects.filter(pk=content.pk).exists())
+
+
+class ContentArtifactAccessTestCase(TestCase):
+    def setUp(self):
+        self.content_artifact = ContentArtifact.objects.create(
+            content=Content.objects.create(), relative_path="a.rpm"
+        )
+
+    def test_add(self):
+        """Access counts are added up, keeping the latest access time."""
+        now = timezone.now()
+        ContentArtifactAccess.add({self.content_artifact.pk: (2, now)})
+        ContentArtifactAccess.add({self.content_artifact.pk: (3, now - timedelta(hours=1))})
+        access = ContentArtifactAccess.objects.get(content_artifact=self.content_artifact)
+        self.assertEqual(access.count, 5)
+        self.assertEqual(access.last_accessed, now)
+
+
+class ArtifactFilterDigestsTestCase(TestCase):
+
+    artifact_path = os.path.join(tempfile.gettempdir(), "artifact-digests-tmp")
+
+    def setUp(self):
+        with open(self.artifact_path, "w") as f:
+            f.write("Temp Artifact File")
+        self.artifact = Artifact.init_and_validate(self.artifact_path)
+        self.artifact.save()
+
+    def test_filter_digests(self):
+        """Artifacts having any of the digests of any field are found."""
+        found = Artifact.objects.filter_digests({"sha256": ["0" * 64, self.artifact.sha256]})
+        self.assertEqual(list(found), [self.artifact])
+        found = Artifact.objects.filter_digests({"sha256": ["0" * 64], "md5": [self.artifact.md5]})
+        self.assertEqual(list(found), [self.artifact])
+        self.assertFalse(Artifact.objects.filter_digests({"sha256": ["0" * 64]}).exists())
+        self.assertFalse(Artifact.objects.filter_digests({}).exists())
+
+
+class BulkGetOrCreateTestCase(TestCase):
+    def test_conflicts(self):
+        """Conflicting objects are replaced by the existing ones, the others are inserted."""
+        content = Content.objects.create()
+        existing = ContentArtifact.objects.create(content=content, relative_path="a")
+        created = ContentArtifact.objects.bulk_get_or_create(
+            [
+                ContentArtifact(content=content, relative_path="a"),
+                ContentArtifact(content=content, relative_path="b"),
+            ]
+        )
+        self.assertEqual(created[0], existing)
+        self.assertEqual(created[1].relative_path, "b")
+        self.assertFalse(created[1]._state.adding)
+        self.assertEqual(ContentArtifact.objects.filter(content=content).count(), 2)
+
+    def test_add_deleted(self):
+        """The counts of deleted ContentArtifacts are dropped, the others are added up."""
+        deleted = ContentArtifact.objects.create(
+            content=Content.objects.create(), relative_path="b.rpm"
+        )
+        deleted_pk = deleted.pk
+        deleted.delete()
+        ContentArtifactAccess.add(
+            {self.content_artifact.pk: (2, timezone.now()), deleted_pk: (1, timezone.now())}
+        )
+        self.assertEqual(ContentArtifactAccess.objects.get().count, 2)
+
+
+class RemoteArtifactFilterDigestsTestCase(TestCase):
+    def setUp(self):
+        content_artifact = ContentArtifact.objects.create(
+            content=Content.objects.create(), relative_path="a"
+        )
+        remote = Remote.objects.create(name="remote", url="http://example.com/")
+        self.remote_artifact = RemoteArtifact.objects.create(
+            url="http://example.com/a",
+            sha256="1" * 64,
+            content_artifact=content_artifact,
+            remote=remote,
+        )
+
+    def test_filter_digests(self):
+        """RemoteArtifacts having any of the digests are found, missing digests match nothing."""
+        found = RemoteArtifact.objects.filter_digests({"sha256": ["0" * 64, "1" * 64]})
+        self.assertEqual(list(found), [self.remote_artifact])
+        self.assertFalse(RemoteArtifact.objects.filter_digests({"md5": ["0" * 32]}).exists())
@@ -0,0 +1,51 @@
+import gzip
+import os
+import tempfile
+
+from django.core.files import File
+from django.db.models.signals import post_delete
+from django.test import TestCase
+
+from pulpcore.app.models import (
+    BaseDistribution,
+    Content,
+    ContentArtifact,
+    IndexedPath,
+    Publication,
+    PublishedMetadata,
+    Remote,
+    RepositoryVersion,
+)
+
+
+class NotifyContentAppTestCase(TestCase):
+    def test_senders(self):
+        """Only the models cached by the content app notify it, the others keep fast deletes."""
+        for model in (BaseDistribution, Publication, Remote, RepositoryVersion):
+            self.assertTrue(post_delete.has_listeners(model), model)
+        for model in (Content, ContentArtifact, IndexedPath):
+            self.assertFalse(post_delete.has_listeners(model), model)
+
+
+class CompressVariantTestCase(TestCase):
+    def compress(self, data):
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.seek(0)
+            path = PublishedMetadata._compress_variant(File(f, name="primary.xml"), "gzip")
+            self.assertEqual(f.tell(), 0)
+        return path
+
+    def test_compress(self):
+        """The metadata is compressed into a temporary file."""
+        data = b"<package/>" * 100000
+        path = self.compress(data)
+        try:
+            with gzip.open(path) as f:
+                self.assertEqual(f.read(), data)
+        finally:
+            os.remove(path)
+
+    def test_not_smaller(self):
+        """No variant is kept when it is not smaller than the metadata."""
+        self.assertIsNone(self.compress(b"a"))
@@ -1,7 +1,8 @@
 from itertools import compress
 
 from django.test import TestCase
-from pulpcore.plugin.models import Content, Repository, RepositoryVersion
+from pulpcore.app.models import IndexedDirectoryEntry, IndexedPath
+from pulpcore.plugin.models import Content, ContentArtifact, Repository, RepositoryVersion
 
 
 class RepositoryVersionTestCase(TestCase):
@@ -289,3 +290,49 @@ class RepositoryTestCase(TestCase):
         self.assertEqual(
             self.repository.latest_version().number, 1, self.repository.latest_version().number
         )
+
+    def test_indexed_paths(self):
+        content_artifacts = []
+        for i, pk in enumerate(self.pks[:3]):
+            content_artifacts.append(
+                ContentArtifact(content_id=pk, artifact=None, relative_path="p{}".format(i))
+            )
+        ContentArtifact.objects.bulk_create(content_artifacts)
+
+        with self.repository.new_version() as version1:
+            version1.add_content(self.content_qs(self.pks[:2]))
+        with self.repository.new_version() as version2:
+            version2.add_content(self.content_qs(self.pks[2:3]))
+
+        self.assertTrue(version1.paths_indexed)
+        self.assertTrue(version2.paths_indexed)
+        self.assertCountEqual(
+            IndexedPath.objects.filter(repository_version=version1).values_list(
+                "relative_path", flat=True
+            ),
+            ["p0", "p1"],
+        )
+        self.assertCountEqual(
+            IndexedPath.objects.filter(repository_version=version2).values_list(
+                "relative_path", flat=True
+            ),
+            ["p0", "p1", "p2"],
+        )
+
+    def test_indexed_directory_entries(self):
+        relative_paths = ["a/b/p0", "a/p1", "p2"]
+        content_artifacts = []
+        for pk, relative_path in zip(self.pks, relative_paths):
+            content_artifacts.append(
+                ContentArtifact(content_id=pk, artifact=None, relative_path=relative_path)
+            )
+        ContentArtifact.objects.bulk_create(content_artifacts)
+
+        with self.repository.new_version() as version:
+            version.add_content(self.content_qs(self.pks[:3]))
+
+        entries = IndexedDirectoryEntry.objects.filter(repository_version=version)
+        self.assertCountEqual(
+            entries.values_list("directory", "name"),
+            [("", "a/"), ("", "p2"), ("a/", "b/"), ("a/", "p1"), ("a/b/", "p0")],
+        )
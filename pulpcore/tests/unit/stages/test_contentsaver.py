@@ -0,0 +1,59 @@
+from django.test import TestCase
+
+from pulpcore.plugin.models import Content
+from pulpcore.plugin.stages import ContentSaver, DeclarativeContent
+
+
+class SavedOneByOne(Content):
+    """A Content type overriding ``save()``, which can't be inserted in bulk."""
+
+    saves = 0
+
+    class Meta:
+        app_label = "core"
+        proxy = True
+
+    def save(self, *args, **kwargs):
+        type(self).saves += 1
+        super().save(*args, **kwargs)
+
+
+class ContentSaverTestCase(TestCase):
+    def test_bulk_save(self):
+        """New units are inserted in bulk, and saved units are left alone."""
+        saved = Content.objects.create()
+        batch = [DeclarativeContent(content=Content()) for _ in range(3)]
+        batch.append(DeclarativeContent(content=saved))
+        inserted = ContentSaver()._save_contents(batch)
+        self.assertEqual(inserted, batch[:3])
+        for d_content in inserted:
+            self.assertFalse(d_content.content._state.adding)
+            content = Content.objects.get(pk=d_content.content.pk)
+            self.assertEqual(content.pulp_type, Content.get_pulp_type())
+            self.assertIsNotNone(content.pulp_created)
+
+    def test_conflict(self):
+        """A unit conflicting with a saved unit is replaced by it, and isn't returned."""
+        saved = Content.objects.create()
+        batch = [DeclarativeContent(content=Content(pk=saved.pk))]
+        self.assertEqual(ContentSaver()._save_contents(batch), [])
+        self.assertEqual(batch[0].content, saved)
+        self.assertFalse(batch[0].content._state.adding)
+        self.assertEqual(Content.objects.count(), 1)
+
+    def test_duplicate(self):
+        """A unit of the batch is only inserted once, the duplicates are replaced by it."""
+        content = Content()
+        batch = [DeclarativeContent(content=Content(pk=content.pk)) for _ in range(2)]
+        self.assertEqual(ContentSaver()._save_contents(batch), batch[:1])
+        self.assertEqual(batch[1].content.pk, content.pk)
+        self.assertFalse(batch[1].content._state.adding)
+        self.assertEqual(Content.objects.count(), 1)
+
+    def test_save_override(self):
+        """Units of a type overriding ``save()`` are saved one at a time with ``save()``."""
+        SavedOneByOne.saves = 0
+        batch = [DeclarativeContent(content=SavedOneByOne()) for _ in range(2)]
+        self.assertEqual(ContentSaver()._save_contents(batch), batch)
+        self.assertEqual(SavedOneByOne.saves, 2)
+        self.assertEqual(Content.objects.count(), 2)
@@ -0,0 +1,84 @@
+import os
+import time
+from types import SimpleNamespace
+from unittest import TestCase, mock, skipUnless
+
+from pulpcore.plugin.models import Artifact
+from pulpcore.plugin.stages import (
+    QueryExistingArtifacts,
+    QueryExistingContents,
+    RemoteArtifactSaver,
+)
+
+from .test_query_existing import Unit, d_artifact
+
+
+def artifacts_batch(size):
+    batch = [
+        SimpleNamespace(d_artifacts=[d_artifact(Artifact(sha256="{:064x}".format(i)))])
+        for i in range(size)
+    ]
+    saved = [Artifact(sha256="{:064x}".format(i), md5="{:032x}".format(i)) for i in range(size)]
+    return lambda: QueryExistingArtifacts._use_existing_artifacts(batch, saved)
+
+
+def contents_batch(size):
+    batch = [SimpleNamespace(content=Unit("unit", str(i))) for i in range(size)]
+    saved = [Unit("unit", str(i)) for i in range(size)]
+    return lambda: QueryExistingContents._use_existing_contents(batch, saved)
+
+
+def remote_artifacts_batch(size):
+    # A single unit with many files, e.g. a container image or a tree of files, is the worst case.
+    remote = mock.Mock(pk=1)
+    content_artifacts = [
+        SimpleNamespace(
+            relative_path=str(i),
+            _remote_artifact_saver_ras=[SimpleNamespace(remote_id=1)] if i % 2 else [],
+        )
+        for i in range(size)
+    ]
+    d_content = SimpleNamespace(
+        content=SimpleNamespace(_remote_artifact_saver_cas=content_artifacts),
+        d_artifacts=[
+            d_artifact(None, content_artifact.relative_path, remote)
+            for content_artifact in content_artifacts
+        ],
+    )
+    return lambda: RemoteArtifactSaver()._needed_remote_artifacts([d_content])
+
+
+@skipUnless(os.environ.get("PULP_BENCHMARKS"), "set PULP_BENCHMARKS=1 to run the benchmarks")
+@mock.patch("pulpcore.plugin.stages.artifact_stages.prefetch_related_objects")
+@mock.patch.object(RemoteArtifactSaver, "_create_remote_artifact")
+class MatchingBenchmarkTestCase(TestCase):
+    """
+    The cost per item of matching a batch to the saved objects stays flat from 500 to 5000 items.
+
+    A quadratic matching costs 10 times more per item for 5000 items than for 500 items, the bound
+    leaves room for noise. The timings depend on the machine, so the benchmarks only run when the
+    ``PULP_BENCHMARKS`` environment variable is set.
+    """
+
+    def cost_per_item(self, make_batch, size):
+        timings = []
+        for _ in range(3):
+            match = make_batch(size)
+            start = time.perf_counter()
+            match()
+            timings.append(time.perf_counter() - start)
+        return min(timings) / size
+
+    def assertLinear(self, make_batch):
+        self.assertLess(
+            self.cost_per_item(make_batch, 5000), 4 * self.cost_per_item(make_batch, 500)
+        )
+
+    def test_artifacts(self, *mocks):
+        self.assertLinear(artifacts_batch)
+
+    def test_contents(self, *mocks):
+        self.assertLinear(contents_batch)
+
+    def test_remote_artifacts(self, *mocks):
+        self.assertLinear(remote_artifacts_batch)
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from pulpcore.plugin.models import Artifact
+from pulpcore.plugin.stages import (
+    QueryExistingArtifacts,
+    QueryExistingContents,
+    RemoteArtifactSaver,
+)
+
+
+class Unit:
+    def __init__(self, name, version):
+        self.name = name
+        self.version = version
+
+    def natural_key(self):
+        return (self.name, self.version)
+
+
+def d_artifact(artifact, relative_path="file", remote=None):
+    return SimpleNamespace(artifact=artifact, relative_path=relative_path, remote=remote)
+
+
+class QueryExistingArtifactsTestCase(TestCase):
+    def test_match(self):
+        """Artifacts are replaced by the saved Artifact sharing any of their digests."""
+        first = d_artifact(Artifact(sha256="a" * 64))
+        second = d_artifact(Artifact(md5="b" * 32))
+        unknown = d_artifact(Artifact(sha256="c" * 64))
+        batch = [
+            SimpleNamespace(d_artifacts=[first, second]),
+            SimpleNamespace(d_artifacts=[unknown]),
+        ]
+        saved = [Artifact(sha256="a" * 64), Artifact(sha256="d" * 64, md5="b" * 32)]
+        QueryExistingArtifacts._use_existing_artifacts(batch, saved)
+        self.assertIs(first.artifact, saved[0])
+        self.assertIs(second.artifact, saved[1])
+        self.assertEqual(unknown.artifact.sha256, "c" * 64)
+
+
+class QueryExistingContentsTestCase(TestCase):
+    def test_match(self):
+        """Content units are replaced by the saved unit with the same type and unit key."""
+        same = SimpleNamespace(content=Unit("a", "1"))
+        other_version = SimpleNamespace(content=Unit("a", "2"))
+        unhashable = SimpleNamespace(content=Unit("b", ["1"]))
+        saved = [Unit("a", "1"), Unit("b", ["1"]), SimpleNamespace(natural_key=lambda: ("a", "2"))]
+        QueryExistingContents._use_existing_contents([same, other_version, unhashable], saved)
+        self.assertIs(same.content, saved[0])
+        self.assertIs(unhashable.content, saved[1])
+        self.assertEqual(other_version.content.version, "2")
+        self.assertIsInstance(other_version.content, Unit)
+
+
+class RemoteArtifactSaverTestCase(TestCase):
+    @mock.patch("pulpcore.plugin.stages.artifact_stages.prefetch_related_objects")
+    @mock.patch.object(RemoteArtifactSaver, "_create_remote_artifact")
+    def test_needed_remote_artifacts(self, create_remote_artifact, prefetch_related_objects):
+        """RemoteArtifacts are only created for the remotes the ContentArtifact has none for."""
+        remote = mock.Mock(pk=1)
+        content_artifacts = [
+            SimpleNamespace(relative_path="a", _remote_artifact_saver_ras=[]),
+            SimpleNamespace(
+                relative_path="b", _remote_artifact_saver_ras=[SimpleNamespace(remote_id=1)]
+            ),
+        ]
+        d_content = SimpleNamespace(
+            content=SimpleNamespace(_remote_artifact_saver_cas=content_artifacts),
+            d_artifacts=[d_artifact(None, "a", remote), d_artifact(None, "b", remote)],
+        )
+        needed = RemoteArtifactSaver()._needed_remote_artifacts([d_content])
+        self.assertEqual(needed, [create_remote_artifact.return_value])
+        create_remote_artifact.assert_called_once_with(
+            d_content.d_artifacts[0], content_artifacts[0]
+        )
+
+    @mock.patch("pulpcore.plugin.stages.artifact_stages.prefetch_related_objects")
+    def test_undeclared_relative_path(self, prefetch_related_objects):
+        """A ContentArtifact without a declared artifact of the same relative path is an error."""
+        content_artifacts = [SimpleNamespace(relative_path="a", _remote_artifact_saver_ras=[])]
+        d_content = SimpleNamespace(
+            content=SimpleNamespace(_remote_artifact_saver_cas=content_artifacts),
+            d_artifacts=[d_artifact(None, "b")],
+        )
+        with self.assertRaises(ValueError):
+            RemoteArtifactSaver()._needed_remote_artifacts([d_content])
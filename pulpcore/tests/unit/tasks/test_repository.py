@@ -0,0 +1,104 @@
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+import asynctest
+from django.test import TestCase
+from django.utils import timezone
+
+from pulpcore.app.models import ContentArtifactAccess
+from pulpcore.app.tasks.repository import _prefetch_ca, prefetch_version
+from pulpcore.plugin.models import Content, ContentArtifact, Remote, RemoteArtifact, Repository
+
+
+class PrefetchVersionTestCase(TestCase):
+    def setUp(self):
+        self.repository = Repository.objects.create(name="repository")
+        self.repository.CONTENT_TYPES = [Content]
+        self.repository.save()
+        remote = Remote.objects.create(name="remote", url="http://example.com/")
+        now = timezone.now()
+        # The ContentArtifacts, the size of their file, and when and how often they were requested.
+        accesses = [(10, 3, 1), (20, 2, 5), (30, 1, 3), (40, None, None)]
+        self.content_artifacts = []
+        for i, (size, hours_ago, count) in enumerate(accesses):
+            content_artifact = ContentArtifact.objects.create(
+                content=Content.objects.create(), relative_path=str(i)
+            )
+            RemoteArtifact.objects.create(
+                url="http://example.com/{}".format(i),
+                size=size,
+                content_artifact=content_artifact,
+                remote=remote,
+            )
+            if count is not None:
+                ContentArtifactAccess.add(
+                    {content_artifact.pk: (count, now - timedelta(hours=hours_ago))}
+                )
+            self.content_artifacts.append(content_artifact)
+        with self.repository.new_version() as version:
+            version.add_content(Content.objects.all())
+        self.version = version
+
+    def selected(self, **kwargs):
+        with patch(
+            "pulpcore.app.tasks.repository._prefetch_content_artifacts", asynctest.CoroutineMock()
+        ) as prefetch:
+            prefetch_version(self.version.pk, **kwargs)
+        selected, _concurrency = prefetch.call_args[0]
+        return [self.content_artifacts.index(ca) for ca, _remote_artifacts in selected]
+
+    def test_order(self):
+        """Requested artifacts are selected by request count or by last request."""
+        self.assertEqual(self.selected(), [1, 2, 0])
+        self.assertEqual(self.selected(order="recent"), [2, 1, 0])
+
+    def test_limit(self):
+        """At most ``limit`` artifacts are selected."""
+        self.assertEqual(self.selected(limit=2), [1, 2])
+
+    def test_max_bytes(self):
+        """Artifacts that don't fit in the byte budget are skipped."""
+        self.assertEqual(self.selected(max_bytes=40), [1, 0])
+
+    def test_no_remote_artifact(self):
+        """Artifacts that can't be downloaded from any remote are skipped."""
+        self.content_artifacts[1].remoteartifact_set.all().delete()
+        self.assertEqual(self.selected(), [2, 0])
+
+
+class PrefetchContentArtifactTestCase(asynctest.TestCase):
+    def remote_artifact(self, result=None, error=None, remote_id=None):
+        downloader = Mock(run=asynctest.CoroutineMock(return_value=result, side_effect=error))
+        remote_artifact = Mock(url="http://example.com/a", remote_id=remote_id or Mock())
+        remote_artifact.remote.cast.return_value.get_downloader.return_value = downloader
+        return remote_artifact
+
+    async def test_next_remote(self):
+        """A download that fails is tried from the next remote, then saved."""
+        content_artifact = Mock()
+        prefetched = Mock()
+        remote_artifacts = [self.remote_artifact(error=OSError()), self.remote_artifact("result")]
+        with patch("pulpcore.app.tasks.repository._save_prefetched_artifact") as save:
+            self.assertTrue(await _prefetch_ca(content_artifact, remote_artifacts, {}, prefetched))
+        save.assert_called_once_with(content_artifact, "result")
+        prefetched.increment.assert_called_once_with()
+
+    async def test_failure(self):
+        """Nothing is saved when every remote fails."""
+        prefetched = Mock()
+        remote_artifacts = [self.remote_artifact(error=OSError())]
+        with patch("pulpcore.app.tasks.repository._save_prefetched_artifact") as save:
+            self.assertFalse(await _prefetch_ca(Mock(), remote_artifacts, {}, prefetched))
+        save.assert_not_called()
+        prefetched.increment.assert_not_called()
+
+    async def test_remote_cast_once(self):
+        """The remote of many artifacts is cast once, and its downloader factory is reused."""
+        remotes = {}
+        first = self.remote_artifact("result", remote_id=1)
+        second = self.remote_artifact("result", remote_id=1)
+        with patch("pulpcore.app.tasks.repository._save_prefetched_artifact"):
+            await _prefetch_ca(Mock(), [first], remotes, Mock())
+            await _prefetch_ca(Mock(), [second], remotes, Mock())
+        second.remote.cast.assert_not_called()
+        first.remote.cast.return_value.get_downloader.assert_called_with(remote_artifact=second)
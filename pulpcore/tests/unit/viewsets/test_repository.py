@@ -0,0 +1,43 @@
+from unittest.mock import Mock, patch
+from uuid import uuid4
+
+from django.test import TestCase
+from rest_framework.exceptions import ValidationError
+
+from pulpcore.app import tasks, viewsets
+
+
+class RepositoryVersionPrefetchTestCase(TestCase):
+    def setUp(self):
+        self.version = Mock(pk=uuid4())
+        self.viewset = viewsets.RepositoryVersionViewSet()
+        self.viewset.get_object = Mock(return_value=self.version)
+
+    def prefetch(self, data):
+        with patch("pulpcore.app.viewsets.repository.enqueue_with_reservation") as enqueue:
+            enqueue.return_value = Mock(id=uuid4())
+            response = self.viewset.prefetch(Mock(data=data), self.version.repository.pk, 1)
+        return response, enqueue
+
+    def test_prefetch(self):
+        """A prefetch task of the version is queued, with the defaults of the missing options."""
+        response, enqueue = self.prefetch({"limit": 10, "order": "recent"})
+        self.assertEqual(response.status_code, 202)
+        enqueue.assert_called_once_with(
+            tasks.repository.prefetch_version,
+            [self.version.repository],
+            kwargs={
+                "repository_version_pk": self.version.pk,
+                "limit": 10,
+                "max_bytes": None,
+                "concurrency": 5,
+                "order": "recent",
+            },
+        )
+
+    def test_invalid(self):
+        """Invalid options are refused without queueing a task."""
+        with patch("pulpcore.app.viewsets.repository.enqueue_with_reservation") as enqueue:
+            with self.assertRaises(ValidationError):
+                self.viewset.prefetch(Mock(data={"order": "random"}), uuid4(), 1)
+        enqueue.assert_not_called()